@@ -34,6 +34,7 @@
 import os
 import shutil
 from project.utils.filechecks import filechecks_util
+from project.modules.archiveindex import getArchiveIndex
 
 #
 # class for action that move a data-file from checkout to working area
@@ -47,6 +48,7 @@ class checkout2past():
         self.session = session
         self.config = config['ACTIONS_CONFIG']['CHECKOUT2PAST']
         self.utils = filechecks_util()
+        self.archive = getArchiveIndex(self.config)
 
     #
     # Final move file
@@ -78,6 +80,9 @@ class checkout2past():
             os.makedirs(os.path.dirname(target_path), exist_ok=True)
             shutil.move(file, target_path)
             self.log.info("Move to Past Area - OK" + only_file)
+            if self.archive is not None:
+                self.archive.discard(file)
+                self.archive.record(target_path)
             # self.session['SESSION']['EXIT'] = 1
         except Exception as e:
             self.log.error('Move to Past Area ERROR on : ' + only_file)
@@ -89,6 +94,8 @@ class checkout2past():
         try:
             os.remove(source_path)
             self.log.info("Remove from Trust Archive - OK" + only_file)
+            if self.archive is not None:
+                self.archive.discard(source_path)
             # self.session['SESSION']['EXIT'] = 1
         except Exception as e:
             self.log.error('Remove from Trust Archive ERROR  : ' + only_file)
@@ -34,6 +34,7 @@
 import os
 import shutil
 from project.utils.filechecks import filechecks_util
+from project.modules.archiveindex import getArchiveIndex
 
 #
 # class for action that move a data-file from checkout to working area
@@ -47,6 +48,7 @@ class checkout2working():
         self.session = session
         self.config = config['ACTIONS_CONFIG']['CHECKOUT2WORKING']
         self.utils = filechecks_util()
+        self.archive = getArchiveIndex(self.config)
 
     #
     # Final move file
@@ -75,6 +77,9 @@ class checkout2working():
             os.makedirs(os.path.dirname(target_path), exist_ok=True)
             shutil.move(file, target_path)
             self.log.info("Move to Working Area - OK" + file_pid)
+            if self.archive is not None:
+                self.archive.discard(file)
+                self.archive.record(target_path)
             # self.session['SESSION']['EXIT'] = 1
         except Exception as e:
             self.log.error('Move to Working Area  : ' + file_pid)
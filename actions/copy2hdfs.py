@@ -41,7 +41,21 @@ copy2hdfs - Simple action class to move (upload) files to HDFS.
 config = {
     "HDFS": {
         "WEBHDFS_URL": "http://namenode:port",
-        "DEST_PATH": "/user/foo/destination_dir"   # HDFS destination folder
+        "DEST_PATH": "/user/foo/destination_dir",  # HDFS destination folder
+        "SDS_LAYOUT": True,                         # optional, DEST_PATH/YEAR/NET/STA/CHA.D/file
+        "PACK": {                                   # optional, small-file packing mode
+            "ENABLED": True,
+            "SPOOL_DIR": "/var/lib/archive/pack",
+            "TARGET_SIZE": 268435456,
+            "MAX_AGE_HOURS": 24,
+            "SWEEP_INTERVAL": 600
+        },
+        "QUEUE": {                                  # optional, asynchronous uploads (not with PACK)
+            "ENABLED": True,
+            "PATH": "/var/lib/archive/queue/hdfs-upload.sqlite",
+            "SPOOL_DIR": "/var/lib/archive/queue/hdfs-spool",
+            "RUN_UPLOADER": True
+        }
     },
     "KERBEROS": {
         "KEYTAB": "/path/to/keytab",
@@ -55,9 +69,15 @@ The class receives (from outside):
     - session: a dictionary-like object (optional use)
 """
 
+import os
+
 # in rum:
-# from project.modules.hdfsmanager import HdfsDAO
-from hdfsmanager import HdfsDAO
+# from project.modules.hdfsmanager import get_shared_dao
+# from project.modules.hdfspack import get_spool, start_sealer
+# from project.modules.hdfsqueue import get_upload_queue, start_uploader
+from hdfsmanager import get_shared_dao
+from hdfspack import get_spool, start_sealer
+from hdfsqueue import get_upload_queue, start_uploader
 
 
 class copy2hdfs:
@@ -73,12 +93,37 @@ class copy2hdfs:
         self.log = log
         self.session = session
 
-        # Initialize the HDFS DAO client
-        self.hdfs = HdfsDAO(self.config, self.log)
-        # try to HDFS connect
-        if not self.hdfs.connect():
+        # queue mode: enqueue and return, the uploader drains in background (see hdfsqueue)
+        queue_config = self.config["HDFS"].get("QUEUE", {})
+        queued = queue_config.get("ENABLED", False)
+        packed = self.config["HDFS"].get("PACK", {}).get("ENABLED", False)
+
+        # queued files are uploaded one by one by the uploader: packing would be skipped
+        if queued and packed:
+            self.log.error("HDFS QUEUE and PACK cannot be enabled together.")
+            raise ValueError("HDFS QUEUE and PACK cannot be enabled together")
+
+        # HDFS DAO client shared by the worker process: the session and the
+        # Kerberos ticket state survive across files and action instances;
+        # in queue and pack mode HDFS may be down, the uploader / sealer connect when they can
+        try:
+            self.hdfs = get_shared_dao(self.config, self.log, connect=not (queued or packed))
+        except RuntimeError:
             self.log.error("Unable to connect to HDFS.")
-            raise RuntimeError("HDFS connection error")
+            raise
+
+        # packing mode: day files go to per network/year containers (see hdfspack),
+        # the sealer uploads the containers that get too old between files
+        self.spool = None
+        if packed:
+            self.spool = get_spool(self.config, self.log)
+            start_sealer(self.config, self.log, self.hdfs)
+
+        self.queue = None
+        if queued:
+            self.queue = get_upload_queue(self.config)
+            if queue_config.get("RUN_UPLOADER", True):
+                start_uploader(self.config, self.log, self.hdfs)
 
     # ---------------------------------------------------------
     # upload to hdfs
@@ -111,6 +156,21 @@ class copy2hdfs:
             self.log.error(f"Exception while uploading to HDFS: {e}")
             return False
 
+    # ---------------------------------------------------------
+    # enqueue for the background uploader
+    # ---------------------------------------------------------
+    def _enqueue_file(self, source_path, dest_path):
+        """
+        Private method that records the upload in the durable queue.
+        """
+        try:
+            row_id = self.queue.put(source_path, dest_path)
+            self.log.info(f"Queued for HDFS upload (#{row_id}): {source_path} --> {dest_path}")
+            return True
+        except Exception as e:
+            self.log.error(f"Exception while queueing HDFS upload: {e}")
+            return False
+
     #
     # Action: do a copy to hdfs
     #
@@ -134,7 +194,25 @@ class copy2hdfs:
             self.log.error("DEST_PATH missing in configuration.")
             return None
 
-        copied = self._upload_file(source_path, dest_path)
-        self.hdfs.close()
+        # mirror the SDS tree; directories are created once (HdfsDAO directory cache)
+        if self.config["HDFS"].get("SDS_LAYOUT", False):
+            try:
+                dest_path = self.hdfs.sds_target(dest_path, os.path.basename(source_path))
+            except ValueError as e:
+                self.log.error(f"SDS layout: {e}")
+                return None
+
+        if self.queue is not None:
+            return self._enqueue_file(source_path, dest_path)
+
+        # packing is local: containers are uploaded when sealed, connecting only then
+        if self.spool is not None:
+            return self.spool.add(source_path, self.hdfs)
+
+        # cheap check: klist/kinit run only when the ticket is close to expiry
+        if not self.hdfs.ensure_connected():
+            self.log.error("Unable to connect to HDFS.")
+            return None
 
-        return copied
+        # the session stays open for the next file
+        return self._upload_file(source_path, dest_path)
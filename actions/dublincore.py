@@ -47,14 +47,19 @@
         PASS: pass
         AUTHENTICATE: false
       STATION_ENDPOINT: http://webservices.ingv.it/fdsnws/station/1/query?
-      HTTP_CONNECTION: webservices.ingv.it
+      STATION_CACHE:
+        TTL: 3600
+        STALE_TTL: 86400
       LOG_FILE: dublincore.log
 
 """
 
 import os
-import http.client
 import datetime
+from project.modules.stationmanager import getStationCache
+from project.modules.handoff import getSummary
+from project.modules.filefacts import fileExists
+from project.modules.mongoqueue import MongoUnavailable
 
 #
 # class for actions Dublin Core
@@ -67,6 +72,7 @@ class dublincore():
         self.log = log
         self.config = config['ACTIONS_CONFIG']['DUBLINCORE']
         self.session = session
+        self.stations = getStationCache(self.config, self.log)
         # mongo
         try:
             import project.modules.mongomanager
@@ -111,11 +117,19 @@ class dublincore():
 
             # check if file is already in dc-db
             # 
-            previous_doc = self.mongo.getPidDataObject(handle)
+            lookup = lambda: self.mongo.getPidDataObject(handle)
         else:
-            previous_doc = self.mongo.getFileDataObject(file)
+            lookup = lambda: self.mongo.getFileDataObject(file)
 
-        if not os.path.isfile(file):
+        try:
+            previous_doc = lookup()
+        except MongoUnavailable as ex:
+            # nothing written yet: the file is processed again once the DB is back
+            self.log.error("MongoDB unavailable, DC-META not processed for %s: %s" % (file, ex))
+            self.session['SESSION']['EXIT'] = 1
+            return
+
+        if not fileExists(self.session, file):
             self.log.info("File no longer exists in archive %s" % filename)
             return
 
@@ -196,7 +210,13 @@ class dublincore():
         self.session['SESSION']['COVERAGE_Z'] = float(stationinfo['ele'])
 
         # set start/end time of file if session exist otherwise left station's values
-        if 'STARTIME' in self.session['SESSION']:
+        # the handoff of sanitychecks has first start and last end of all the traces
+        summary = getSummary(self.session, file)
+        if summary is not None and summary['starttime'] is not None:
+            stationinfo['start'] = summary['starttime']
+            stationinfo['end'] = summary['endtime']
+            self.log.info("Assigned start/end time from stream handoff, start at: %s " % stationinfo['start'])
+        elif 'STARTIME' in self.session['SESSION']:
             stationinfo['start'] = self.session['SESSION']['STARTIME']
             stationinfo['end'] = self.session['SESSION']['ENDTIME']
             self.log.info("Assigned start/end time from file, start at: %s " % stationinfo['start'])
@@ -247,26 +267,18 @@ class dublincore():
 
         # Retrieve informations from EIDA station webservice be aware! the response must be in text format (not xml)
         # example:
-        # conn = http.client.HTTPConnection("webservices.rm.ingv.it", 80)
         # query = "http://webservices.rm.ingv.it/fdsnws/station/1/query?net=IV&sta=AMUR&format=text"
         # result = "#Network | Station | Latitude | Longitude | Elevation | SiteName | StartTime          | EndTime \n
         #              IV    | AMUR    | 40.9071  | 16.6041   |  443      |Altamura  |2005-08-03T15:46:00|          "
-        conn = http.client.HTTPConnection(self.config['HTTP_CONNECTION'], 80)
-        query = self.config['STATION_ENDPOINT'] + "net=" + net + "&sta=" + sta + "&format=text"
-        try:
-            conn.connect()
-            conn.request("GET", query)
-            response = conn.getresponse()
-            e = response.read()
-            conn.close()
-        except Exception as ex:
+        # answers are cached per station and shared with the other actions (see modules/stationmanager)
+        mystation = self.stations.getStation(net, sta)
+        if mystation is None:
             self.log.error("ERROR with Station webservices, set EXIT")
-            self.log.error(ex)
             self.session['SESSION']['EXIT'] = 1
             return
-        mystation = {"lat": e.decode('utf-8').split('|')[9], "lon": e.decode('utf-8').split('|')[10], "ele": e.decode('utf-8').split('|')[11], "start": e.decode('utf-8').split('|')[13], "end": e.decode('utf-8').split('|')[14]}
 
-        return mystation
+        # a copy: the caller overwrites start/end with the file's own times
+        return dict(mystation)
 
     #
     # _getFileDataObject id
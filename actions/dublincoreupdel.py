@@ -69,9 +69,9 @@ class dublincoreupdel():
         #
         self.log.info("Starting %s DC-META for file %s" % (self.config['MODE'], file))
 
-        # retrieve doc
+        # retrieve doc (from the digital object view in session)
         try:
-            my_doc = self.mongo.getDublinCoreByFilename(file)
+            my_doc = self.mongo.getSessionDigitalObject(self.session, file)['wf_do']
             if my_doc is None:
                 self.log.info("NOT json doc for file  %s" % file)
                 self.session['SESSION']['EXIT'] = 1
@@ -114,5 +114,7 @@ class dublincoreupdel():
                 self.session['SESSION']['EXIT'] = 1
                 return
 
+        # wf_do changed: next actions reload the view
+        self.mongo.dropSessionDigitalObject(self.session)
         self.log.info("Completed %s DC-META for file  %s" % (self.config['MODE'], file))
         return
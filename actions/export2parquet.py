@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+export2parquet - Action class exporting decoded day files to a columnar dataset on HDFS.
+
+# Disclaimer:
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+    This script is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY.
+
+# Copyright:
+    2025 Massimo Fares, INGV - Italy <massimo.fares@ingv.it>;
+    EIDA Italia Team, INGV - Italy  <adaisacd.ont@ingv.it>
+
+# License:
+    GPLv3
+
+# Platform:
+    Linux / Python 3.x
+
+# Action-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+# Action-Description:
+    Export-to-Parquet
+    Optional stage next to copy2hdfs: the day file is decoded once (Steim
+    included) and written as a Parquet file with one row per sample:
+
+        time (timestamp[ns], UTC) | sample | loc | qlt | segment | <WFCatalog daily stats>
+
+    The WFCatalog daily stats (smin, smax, smean, rms, avail, ...) are taken
+    from daily_streams when the MONGO block is configured; they are constant
+    per file and cost almost nothing once dictionary/RLE encoded.
+
+    The file is uploaded through HdfsDAO into a hive-style partitioned tree
+    that Spark discovers as partition columns:
+
+        <EXPORT_PATH>/net=IV/sta=ACER/cha=HHZ/year=2024/day=061/IV.ACER..HHZ.D.2024.061.parquet
+
+    When sanitychecks ran in the same policy with a full decode, the Stream
+    it published in the session is reused instead of reading the file again.
+
+    The version suffix ('#N') is dropped from the name so a new version of
+    a day file replaces the previous export.
+
+    pyarrow is an optional dependency: without it the action logs an error
+    and returns without exporting.
+
+
+# CONFIG expected structure:
+
+config = {
+    "EXPORT": {
+        "EXPORT_PATH": "/user/foo/parquet",          # HDFS dataset root
+        "SCRATCH_DIR": "/var/lib/archive/scratch",   # local temp for the Parquet file
+        "COMPRESSION": "zstd",
+        "ROW_GROUP_SIZE": 1048576,
+        "STATS_FIELDS": ["smin", "smax", "smean", "rms", "stdev", "ngaps", "avail"]
+    },
+    "HDFS": {...},                                   # as copy2hdfs
+    "KERBEROS": {...},
+    "MONGO": {...}                                   # optional, WFCatalog stats
+}
+
+The class receives (from outside):
+    - log:     logging object
+    - config:  dictionary containing at least config["EXPORT"]["EXPORT_PATH"]
+    - session: a dictionary-like object (optional use)
+"""
+
+import os
+import numpy as np
+from obspy import read
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# in rum:
+# from project.modules.hdfsmanager import get_shared_dao
+# from project.modules.mongomanager import MongoDAO
+# from project.modules.handoff import getStream, releaseStream
+from hdfsmanager import get_shared_dao
+from mongomanager import MongoDAO
+from handoff import getStream, releaseStream
+
+
+class export2parquet:
+    """
+    Class used to export a day file as a partitioned Parquet file on HDFS.
+    """
+
+    def __init__(self, log, config, session):
+
+        # in rum
+        # self.config = config['ACTIONS_CONFIG']['EXPORT_TO_PARQUET']
+        self.config = config
+        self.log = log
+        self.session = session
+        self.export = self.config["EXPORT"]
+
+        # HDFS DAO client shared by the worker process (see copy2hdfs)
+        try:
+            self.hdfs = get_shared_dao(self.config, self.log)
+        except RuntimeError:
+            self.log.error("Unable to connect to HDFS.")
+            raise
+
+        # WFCatalog daily stats are optional
+        self.mongo = None
+        if self.config.get("MONGO", {}).get("ENABLED", False):
+            self.mongo = MongoDAO(self.config, self.log)
+            self.mongo.connect()
+
+    # ---------------------------------------------------------
+    # decode
+    # ---------------------------------------------------------
+    def _to_table(self, file):
+        """
+        Decode the day file into an Arrow table, one row per sample.
+
+        Parameters
+        ----------
+        file : str
+            Local path of the day file.
+        """
+        # already decoded by sanitychecks in this policy run? (see modules/handoff)
+        stream = getStream(self.session, file) if self.session else None
+        if stream is None:
+            stream = read(file)
+        times, samples, segments = [], [], []
+        for segment, trace in enumerate(stream):
+            start = trace.stats.starttime.ns
+            step = int(round(1e9 / trace.stats.sampling_rate))
+            times.append(start + np.arange(trace.stats.npts, dtype=np.int64) * step)
+            samples.append(trace.data)
+            segments.append(np.full(trace.stats.npts, segment, dtype=np.int16))
+
+        columns = {
+            "time": pa.array(np.concatenate(times), type=pa.timestamp("ns", tz="UTC")),
+            "sample": pa.array(np.concatenate(samples)),
+            "segment": pa.array(np.concatenate(segments)),
+        }
+        n_rows = len(columns["time"])
+        stats = stream[0].stats
+        columns["loc"] = pa.repeat(pa.scalar(stats.location, pa.string()), n_rows).dictionary_encode()
+        columns["qlt"] = pa.repeat(pa.scalar(stats.get("mseed", {}).get("dataquality", ""), pa.string()), n_rows).dictionary_encode()
+
+        for field, value in self._daily_stats(file).items():
+            columns[field] = pa.repeat(pa.scalar(value), n_rows)
+
+        return pa.table(columns)
+
+    def _daily_stats(self, file):
+        """
+        WFCatalog daily stats of the file (empty without MONGO or document).
+        """
+        if self.mongo is None:
+            return {}
+        try:
+            document = self.mongo.getDocumentByFilenameOne(file, query_class='LOOKUP')
+        except Exception as e:
+            self.log.warning(f"WFCatalog stats unavailable for {os.path.basename(file)}: {e}")
+            return {}
+        if not document:
+            return {}
+        return {field: document.get(field) for field in self.export.get("STATS_FIELDS", [])
+                if document.get(field) is not None}
+
+    # ---------------------------------------------------------
+    # target path
+    # ---------------------------------------------------------
+    def _target_path(self, file):
+        """
+        <EXPORT_PATH>/net=/sta=/cha=/year=/day=/<fileId without version>.parquet
+        """
+        name = os.path.basename(file).split("#")[0]
+        net, sta, loc, cha, dtype, year, day = name.split(".")
+        return (f"{self.export['EXPORT_PATH'].rstrip('/')}/net={net}/sta={sta}/cha={cha}"
+                f"/year={year}/day={day}/{name}.parquet")
+
+    #
+    # Action: export to parquet
+    #
+    def do_export2parquet(self, file):
+        """
+        Public method that decodes the file, writes the Parquet file and uploads it.
+
+        Parameters
+        ----------
+        file : str
+            Local path of the day file.
+
+        Returns
+        -------
+        True on success, False otherwise
+        """
+        if pa is None:
+            self.log.error("pyarrow is not installed: Parquet export disabled.")
+            return False
+
+        try:
+            target = self._target_path(file)
+        except ValueError:
+            self.log.error(f"Not an SDS file name, export skipped: {os.path.basename(file)}")
+            return False
+
+        local = os.path.join(self.export.get("SCRATCH_DIR", "/var/lib/archive/scratch"),
+                             os.path.basename(target))
+        try:
+            table = self._to_table(file)
+            pq.write_table(table, local,
+                           compression=self.export.get("COMPRESSION", "zstd"),
+                           row_group_size=self.export.get("ROW_GROUP_SIZE", 1024 * 1024),
+                           use_dictionary=["loc", "qlt"] + list(self.export.get("STATS_FIELDS", [])))
+            self.log.info(f"Exported {table.num_rows} samples of {os.path.basename(file)} "
+                          f"({os.path.getsize(local)} bytes)")
+
+            if not self.hdfs.copy_local2hdfs_overwrite(local, target):
+                self.log.error("Parquet upload to HDFS failed.")
+                return False
+            return True
+
+        except Exception as e:
+            self.log.error(f"Exception while exporting {os.path.basename(file)} to Parquet: {e}")
+            return False
+
+        finally:
+            if os.path.exists(local):
+                os.remove(local)
+            # last reader of the handed-over samples
+            if self.session:
+                releaseStream(self.session)
@@ -35,6 +35,8 @@
 import os
 import shutil
 from project.utils.filechecks import filechecks_util
+from project.modules.filefacts import getFacts, sdsPath
+from project.modules.archiveindex import getArchiveIndex, isArchived
 
 #
 # class for action that move a data-file from checkin to archive
@@ -47,6 +49,7 @@ class move2archive():
         self.session = session
         self.config = config['ACTIONS_CONFIG']['MOVE2ARCHIVE']
         self.utils = filechecks_util()
+        self.archive = getArchiveIndex(self.config)
 
     #
     # Final move file
@@ -56,7 +59,7 @@ class move2archive():
         
         # sds switch
         if sds:
-            target_path = self.utils.sdsPath(target_archive, os.path.basename(file))
+            target_path = sdsPath(target_archive, os.path.basename(file))
         else:
             target_path = target_archive + os.path.basename(file) + self.config['TAG_WARNING']
 
@@ -70,37 +73,47 @@ class move2archive():
             if self.config['MV_NOT_CP'] == True:
                 shutil.move(file, target_path)
                 self.log.info("MOVE to Target Archive - OK " + target_path)  # + os.path.basename(file)
+                # the cached stat of the file is no longer valid
+                facts = getFacts(self.session, file)
+                if facts is not None:
+                    facts.forget()
             else:
                 shutil.copy(file, target_path)
                 self.log.info("COPY to Target Archive - OK " + target_path)  # + os.path.basename(file)
+            if self.archive is not None:
+                self.archive.record(target_path)
 
             self.log.info("remove tagged file")    
             # remove TAGGED (i.e. .maintenance) file on trusted archive (if exist) and put in version archive
-            if os.path.isfile(target_path+self.config['TAG_FILE']):  
+            if isArchived(self.archive, target_path+self.config['TAG_FILE']):
                 # print("exist maint file - not a versioned: " + target_path+self.config['TAG_FILE'])              
                 self.log.info("There is a tagged file " + target_path+self.config['TAG_FILE'])
                 #copy to versioned archive
-                version_path = self.utils.sdsPath(self.config['ARCHIVE_VERSION'], os.path.basename(file) )
+                version_path = sdsPath(self.config['ARCHIVE_VERSION'], os.path.basename(file) )
                 os.makedirs(os.path.dirname(version_path), exist_ok=True)
                 shutil.copy(target_path+self.config['TAG_FILE'], version_path+'-'+self.session['SESSION']['VERSION'])
                 # delete original file
                 os.remove(target_path+self.config['TAG_FILE'])
+                if self.archive is not None:
+                    self.archive.discard(target_path+self.config['TAG_FILE'])
                 self.log.info("tagged file removed, the new one is in place")
 
                 # if session version exist, save original(.maintenance) file into version archive
             elif 'VERSION' in self.session['SESSION']:
-                version_path = self.utils.sdsPath(self.config['ARCHIVE_VERSION'], self.session['SESSION']['LAST_FILENAME'])
-                maint_path = self.utils.sdsPath(target_archive,self.session['SESSION']['LAST_FILENAME']+self.config['TAG_FILE']) 
+                version_path = sdsPath(self.config['ARCHIVE_VERSION'], self.session['SESSION']['LAST_FILENAME'])
+                maint_path = sdsPath(target_archive,self.session['SESSION']['LAST_FILENAME']+self.config['TAG_FILE']) 
                               
                 # print("exist maint file but versioned - move maint-path into version-path: version_path: " + version_path + " maint_path: " + maint_path)
                 os.makedirs(os.path.dirname(version_path), exist_ok=True)
-                if os.path.isfile(maint_path):                
+                if isArchived(self.archive, maint_path):
                     self.log.info("There is a last version tagged file " + maint_path)
 
                     shutil.copy(maint_path, version_path+'-'+self.session['SESSION']['VERSION'])
                     self.log.info("version file saved on archive-version with: " + version_path+'-'+self.session['SESSION']['VERSION'])
                     # delete original file
                     os.remove(maint_path)
+                    if self.archive is not None:
+                        self.archive.discard(maint_path)
                     self.log.info("version tagged file removed, the new one is in place")
                     # self.session['SESSION']['EXIT'] = 1
                 else:
@@ -42,6 +42,7 @@ from pyhandle.handleclient import PyHandleClient
 from pyhandle.clientcredentials import PIDClientCredentials
 from pyhandle.handleexceptions import *
 import uuid
+from project.modules.mongoqueue import MongoUnavailable
 import os
 
 
@@ -93,9 +94,17 @@ class pidcreate():
 
             # check if file is already in dc-db
             # 
-            previous_doc = self.mongo.getPidDataObject(handle)
+            lookup = lambda: self.mongo.getPidDataObject(handle)
         else:
-            previous_doc = self.mongo.getFileDataObject(file)
+            lookup = lambda: self.mongo.getFileDataObject(file)
+
+        try:
+            previous_doc = lookup()
+        except MongoUnavailable as ex:
+            # also while the DC document of the file waits in the write-behind queue
+            self.log.error("MongoDB unavailable, PID not minted for %s: %s" % (file, ex))
+            self.session['SESSION']['EXIT'] = 1
+            return
 
 
         # doc already into db: OK
@@ -69,7 +69,12 @@ class pidupdel():
 
         cred = PIDClientCredentials.load_from_JSON(self.config['CRED_FILE'])
         client = PyHandleClient('rest').instantiate_with_credentials(cred)
-        pid = self.mongo.getPIDfromFile(file)
+        # handle from the digital object view in session
+        pid = self.mongo.getSessionDigitalObject(self.session, file)['handle']
+        if pid is None:
+            self.log.error("File not in WF-HANDLE, no PID for: %s" % file)
+            self.session['SESSION']['EXIT'] = 1
+            return
         self.session['SESSION']['PID_HANDLE'] = pid
         if self.config['DRY_RUN'] == True:
             self.log.info("PID NOT UPDATED - DRY-RUN Mode - skip updel" )
@@ -34,10 +34,11 @@
 """
 
 import warnings
-import filecmp
 import os
 import shutil
 from project.utils.filechecks import filechecks_util
+from project.modules.filefacts import buildFacts, sdsPath
+from project.modules.archiveindex import getArchiveIndex, isArchived
 
 # needed to silence output warnings for files partially broken
 # decommented the following line
@@ -55,6 +56,19 @@ class preflychecks():
         self.log.info("preflychecks start ")
         self.session = session
         self.utils = filechecks_util()
+        # optional local index of the trust archive (existence checks without NFS round trips)
+        self.archive = getArchiveIndex(self.config)
+        # optional WFCatalog DB: md5 of the archived files (daily_streams.files.chksm) for TEST 3
+        self.wfc_mongo = None
+        if 'CHECKSUM_MONGO' in self.config:
+            try:
+                import project.modules.mongomanager
+                self.wfc_mongo = project.modules.mongomanager.MongoDAO({'MONGO': self.config['CHECKSUM_MONGO']}, self.log)
+                self.wfc_mongo.connect()
+            except Exception as ex:
+                self.log.error("Could not connect to WFCatalog Mongo, checksums will be computed")
+                self.log.error(ex)
+                self.wfc_mongo = None
         # mongo
         try:
             import project.modules.mongomanager
@@ -84,7 +98,9 @@ class preflychecks():
         # TEST 1 Check given file exist
         #
         try:
-            if not os.path.isfile(file):
+            # stat, SDS fields, version handle and archive paths computed once for the whole policy
+            facts = buildFacts(self.session, file)
+            if not facts.exists:
                 self.log.error("File no longer exists in check-in directory  %s" % filename)
                 self.session['SESSION']['EXIT'] = 1
                 return
@@ -106,9 +122,8 @@ class preflychecks():
 
         if '#' in filevers:
             # it's versioned file
-            filename = filevers.split("#")[0]
-            handle = filevers.split("#")[1]
-            handle = handle.replace(".", "/")
+            filename = facts.name
+            handle = facts.handle
             print(filename)
             print(handle)
             # set handle and filename in session
@@ -119,7 +134,7 @@ class preflychecks():
             
             self.log.info(" PRE_FLY for VERSIONED source: " + filename + " start copy")
             if self.config['SCRATCH_SDS'] == True:
-                file_v = self.utils.sdsPath(self.config['ARCHIVE_SCRATCH'], filename)            
+                file_v = sdsPath(self.config['ARCHIVE_SCRATCH'], filename)
             else:
                 file_v = os.path.join( self.config['ARCHIVE_SCRATCH'], filename)
 
@@ -136,6 +151,7 @@ class preflychecks():
             self.session['SESSION']['VERS_FILE'] = file_v
             # substitute original file with working-copy
             file = file_v
+            facts.setFile(file_v)
 
 
 
@@ -197,12 +213,12 @@ class preflychecks():
         #
         # TEST 2 Check current file NOT IN archive
         #
-        archived_file = self.utils.sdsPath(self.config['ARCHIVE_TRUST'], filename)
+        archived_file = facts.archivePath(self.config['ARCHIVE_TRUST'])
         #print("archived_file : " + archived_file)
         if self.config['CHK_ARCHIVE'] == True:
 
             try:
-                if os.path.isfile(archived_file):
+                if isArchived(self.archive, archived_file):
                     self.log.error("Check Archive file error: File is present in Archive, rejected! something went wrong aborting on %s" % os.path.basename(file))
                     self.session['SESSION']['EXIT'] = 1
                     print("ERROR: file is present into archive")
@@ -232,10 +248,12 @@ class preflychecks():
         if self.config['CHK_TAGGED'] == True:
 
             try:
-                if os.path.isfile(archived_file + self.config['TAG_FILE']):
+                if isArchived(self.archive, archived_file + self.config['TAG_FILE']):
 
-                    # compare two files; NOTE: remove 'not' in filecompare if needed by policy 
-                    if not filecmp.cmp(archived_file + self.config['TAG_FILE'], file):
+                    # compare two files; NOTE: remove 'not' in filecompare if needed by policy
+                    # (by checksum: only the incoming file is read, see filechecks_util.sameContent)
+                    if not self.utils.sameContent(archived_file + self.config['TAG_FILE'], file, self.archive,
+                                                  self.wfc_mongo, facts, self.log):
                         self.log.error(
                             "Check Archive file error: file tagged with: " + self.config['TAG_FILE'] + "and current file are equals, rejected! something went wrong aborting on %s" % os.path.basename(
                                 file))
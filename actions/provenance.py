@@ -35,6 +35,7 @@
 import os
 import datetime
 import project.modules.mongomanager
+from project.modules.mongoqueue import MongoUnavailable
 
 #
 # class for action Provenance & Version
@@ -84,7 +85,13 @@ class provenance():
         previous_doc = None
         # load previous prov doc
         #
-        previous_doc = self.mongo.getProvDigitalObject(self.handle)
+        try:
+            previous_doc = self.mongo.getProvDigitalObject(self.handle)
+        except MongoUnavailable as ex:
+            # nothing written yet: the file is processed again once the DB is back
+            self.log.error("MongoDB unavailable, WF PROVENANCE not processed for %s: %s" % (file, ex))
+            self.session['SESSION']['EXIT'] = 1
+            return
 
         if '#' in self.filevers:
             # it's versioned file
@@ -114,7 +121,12 @@ class provenance():
         if version:
             print('SECOND+ CHEKIN')
             # previous versions returns a list of object ordered by version
-            list_previous_versions = self.mongo.getVersionDigitalObject(self.handle)
+            try:
+                list_previous_versions = self.mongo.getVersionDigitalObject(self.handle)
+            except MongoUnavailable as ex:
+                self.log.error("MongoDB unavailable, WF PROVENANCE not processed for %s: %s" % (file, ex))
+                self.session['SESSION']['EXIT'] = 1
+                return
 
             # take last version
             for i in list_previous_versions:
@@ -152,9 +164,8 @@ class provenance():
                 self.mongo.updateEnableProvByPid(self.handle, enabled)
                 self.log.info("OK PROVENANCE document disabled for file %s", file)
 
-                # enable version docs
-                # retrieve previous versions returns a list of object ordered by version
-                list_previous_versions = self.mongo.getVersionDigitalObject(self.handle)
+                # enable version docs: the previous versions read above (the current one is
+                # stored enabled), no read after the writes that may be queued behind
                 # enable all versions
                 for i in list_previous_versions:
                     # print(i)
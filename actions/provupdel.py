@@ -76,8 +76,13 @@ class provupdel():
             self.session['SESSION']['EXIT'] = 1
             return
 
-        # retrieve previous doc        
-        previous_doc = self.mongo.getProvDigitalObject(self.handle)        
+        # retrieve previous doc (from the digital object view in session)
+        view = self.mongo.getSessionDigitalObject(self.session, file)
+        if view['handle'] == self.handle:
+            previous_doc = view['do_prov']
+        else:
+            view = None
+            previous_doc = self.mongo.getProvDigitalObject(self.handle)
         #
         # disable prov document
         enabled = 0
@@ -89,7 +94,10 @@ class provupdel():
         if previous_doc:
             print('Disable prov-vers')
             # previous versions returns a list of object ordered by version
-            list_previous_versions = self.mongo.getVersionDigitalObject(self.handle)
+            if view:
+                list_previous_versions = view['do_vers']
+            else:
+                list_previous_versions = self.mongo.getVersionDigitalObject(self.handle)
 
             # disable all versions
             for i in list_previous_versions:
@@ -98,4 +106,7 @@ class provupdel():
                 self.mongo.updateEnableVersById(my_id, enabled)
 
             self.log.info("OK VERSION documents disabled for file %s", file)
+
+        # do_prov/do_vers changed: next actions reload the view
+        self.mongo.dropSessionDigitalObject(self.session)
             
\ No newline at end of file
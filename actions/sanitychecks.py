@@ -30,6 +30,10 @@
 
 # Config-Action setting requirements:
     STATION_ENDPOINT: url for station service
+    STATION_CACHE: optional station metadata cache settings (see modules/stationmanager)
+    HEADER_ONLY: if true read only the record headers (fast mode), default false
+    DEEP_CHECK: if true always decode all samples (full integrity check), overrides HEADER_ONLY
+    HANDOFF: optional size limit/lifetime of the stream published in session (see modules/handoff)
     ARCHIVE_BAD: "/var/lib/archive/bad/" target of bad files
     IF_BAD_GOTO: jump to action if it is a bad file, otherwise exit.
     TYPE_CODE: mseed type file (i.e. Data, Log, etc..)
@@ -37,15 +41,13 @@
 
 """
 
-from obspy import read
-import warnings
-import datetime
 import shutil
 import os
 from project.utils.filechecks import filechecks_util
-
-# needed to silence output warnings for files partially broken
-warnings.filterwarnings('ignore', '.*')
+from project.modules.stationmanager import getStationCache
+from project.modules.handoff import publishStream
+from project.modules.filefacts import fileExists, sdsPath
+from project.modules.sanitytests import runTests, headerOnly
 
 
 #
@@ -61,6 +63,7 @@ class sanitychecks():
         self.log.info("sanitychecks initialized ")
         self.error_code = ""
         self.utils = filechecks_util()
+        self.stations = getStationCache(self.config, self.log)
 
     #
     #  Sanity Checks processing
@@ -90,162 +93,29 @@ class sanitychecks():
                 self._move_file(filename, file, good)
                 return
         
-        if not os.path.isfile(file):
+        if not fileExists(self.session, file):
             self.log.info("File no longer exists in archive %s" % filename)
             return
 
-        mseed = file
-        st = None       
-        band_code =  self.config['BAND_CODE']
-        band_file_code = filename.split('.')[3][0]
-
         self.log.info("SANITY-Checks START for :" + filename)
         print("do_sanitychecks for: " + filename)
 
-        #
-        # TEST 0 - 1 Check ZERO/Broken file
-        #
-        # check if the file is empty or not valid
-        try:
-            st = read(mseed)
-        except Exception as e:
-            self.log.error('Check ZERO file error: ')
-            self.log.error(e)
-            print('ERROR Check ZERO file: the file is empty or unreadable')
-            self.error_code = "0"
-            good = False
-            self._move_file(filename, file, good)
-            return
-
-        if st is None:
-            self.log.error('Check Broken file: FAILED ')
-            print('ERROR Check Broken file: the file is unusable')
-            self.error_code = "1"
+        # TESTs 0-4 (see modules/sanitytests): stations cached per station (see modules/stationmanager),
+        # bursts of files of one station cost a single station service request
+        self.error_code, message, st = runTests(file, filename, self.config, self.stations.getEpochIndex,
+                                                log=self.log)
+        if self.error_code:
+            print("ERROR " + message)
             good = False
             self._move_file(filename, file, good)
             return
 
-        else:
-            self.log.info('Check ZERO/Broken file: OK ')
-
-            #
-            # TEST 2 Check SDS file:
-            #
-            # check if the filename reflect the infos inside mseed header
-
-            fileinside = ''
-            [xnet,xsta,xloc,xcha,xtype,xyear,xjday] = filename.split('.')
-            ok = False
+        # @TODO get better start and end date : first startdate last enddate
+        self.session['SESSION']['STARTIME'] = str(st[-1].stats.starttime)
+        self.session['SESSION']['ENDTIME'] = str(st[-1].stats.endtime)
 
-            if xtype not in self.config['TYPE_CODE']:
-                self.log.error('Check SDS file: FAILED - Type-Code not allowed')
-                print("ERROR Check SDS: Type-Code not allowed")
-                self.error_code = "2"
-                good = False                        
-                self._move_file(filename, file, good)                        
-                return
-
-            try:
-                for tr in st:
-                    
-                    realdata = tr.stats.network + '.' + tr.stats.station + '.' + tr.stats.location + '.' +\
-                               tr.stats.channel + '.' + xtype + '.' + str(tr.stats.starttime.year) + '.' + str(tr.stats.starttime.julday).zfill(3)
-                    #self.log.info(" realdata:  "+realdata)
-
-                    if xnet == tr.stats.network and xsta == tr.stats.station and xloc == tr.stats.location and xcha == tr.stats.channel and xtype in self.config['TYPE_CODE'] and xyear == str(tr.stats.starttime.year) and xjday == str(tr.stats.starttime.julday).zfill(3):
-                        ok = True
-                    else:
-                        ok = False
-                        break
-
-                self.log.info(" realdata:  "+realdata)        
-                if ok:
-                    self.log.info('Check SDS file: OK ')
-
-                else:                        
-                    self.log.error('Check SDS file: FAILED ')
-                    print("ERROR Check SDS: info inside file " + realdata + " not equal to name " + filename)
-                    self.error_code = "2"
-                    good = False                        
-                    self._move_file(filename, file, good)                        
-                    return
-                
-            except Exception as e:
-                self.log.error('2-1 unexpected error on step 2: ')
-                self.log.error(e)
-                print(e)
-                self.error_code = "21"
-                good = False
-                self._move_file(filename, file, good)
-                return
-
-            #
-            # TEST 3 check RATE filename (band code)
-            #
-            # check if sampling_rate of filename is consistent with mseed header
-
-            try:
-                if band_code[band_file_code][0] <= tr.stats.sampling_rate <= band_code[band_file_code][1]:
-                    self.log.info("Check RATE file: OK ")
-                else:
-                    self.log.error("Check RATE file: FAILED ")
-                    print("ERROR Check RATE band code: " + tr.stats.sampling_rate )
-                    self.error_code = "3"
-                    good = False
-                    self._move_file(filename, file, good)
-                    return
-
-            except Exception as e:
-                self.log.error('3-1 unexpected error on step 3: ')
-                self.log.error(e)
-                print(e)
-                self.error_code = "31"
-                good = False
-                self._move_file(filename, file, good)
-                return
-
-            #
-            # TEST 4 check EPOCH in file
-            #
-            # check if mseed data are consistent with station epoch
-            
-            netsta = [tr.stats.network + '.' + tr.stats.station]
-            url_endpoint = self.config['STATION_ENDPOINT'] + 'level=channel&net=' + tr.stats.network + '&station=' + tr.stats.station + '&format=text'
-
-            print(url_endpoint)
-
-            epochs = self.utils.getEpochsFromService(netsta, url_endpoint)
-            if len(epochs) == 0:
-                print("epochs no-data")
-                self.log.error("Check EPOCH file: FAILED: no-data ")
-                good = False
-                self.error_code = "41"
-                self._move_file(filename, file, good)
-                return
-
-            # print(epochs)
-            scnl = tr.stats.network + '.' + tr.stats.station + '.' + tr.stats.location + '.' + tr.stats.channel
-            jday = str(tr.stats.starttime.year) + '.' + str(tr.stats.starttime.julday)
-            # @TODO get better start and end date : first startdate last enddate
-            self.session['SESSION']['STARTIME'] = str(tr.stats.starttime)
-            self.session['SESSION']['ENDTIME'] = str(tr.stats.endtime)
-            julday = datetime.datetime.strptime(jday, '%Y.%j').date()
-            meta_OK = False
-            for ep in epochs:
-                [x, start, end] = ep
-                if scnl == x:
-                    if self.utils.time_in_range(start, end, julday):
-                        meta_OK = True
-
-            if meta_OK:
-                self.log.info("Check EPOCH file: OK ")
-            else:
-                self.log.error("Check EPOCH file: FAILED: time not in range ")
-                print("ERROR Check EPOCH " + jday)
-                self.error_code = "4"
-                good = False
-                self._move_file(filename, file, good)
-                return
+        # hand the decoded stream (or its headers) over to the next actions of the policy
+        publishStream(self.session, file, st, self.config.get('HANDOFF'), headonly=headerOnly(self.config))
 
         self._move_file(filename, file, good)
         return
@@ -274,7 +144,7 @@ class sanitychecks():
                 # skip to the next file (exit=1) and move current file into BAD;
                 # check if bad archive is SDS
                 if self.config['BAD_SDS']:
-                    target_path = self.utils.sdsPath(self.config['ARCHIVE_BAD'], os.path.basename(file))
+                    target_path = sdsPath(self.config['ARCHIVE_BAD'], os.path.basename(file))
                     os.makedirs(os.path.dirname(target_path), exist_ok=True)
                     #self.session['SESSION']['EXIT'] = 1
                     shutil.move(file, target_path + "-" + self.error_code)
@@ -34,9 +34,10 @@
 """
 
 import warnings
-import filecmp
 import os
 from project.utils.filechecks import filechecks_util
+from project.modules.filefacts import sdsPath
+from project.modules.archiveindex import getArchiveIndex, isArchived
 
 # needed to silence output warnings for files partially broken
 # decommented the following line
@@ -54,6 +55,18 @@ class tagafile():
         self.log.info("tagafile start ")
         self.session = session
         self.utils = filechecks_util()
+        self.archive = getArchiveIndex(self.config)
+        # optional WFCatalog DB: md5 of the archived files (daily_streams.files.chksm)
+        self.wfc_mongo = None
+        if 'CHECKSUM_MONGO' in self.config:
+            try:
+                import project.modules.mongomanager
+                self.wfc_mongo = project.modules.mongomanager.MongoDAO({'MONGO': self.config['CHECKSUM_MONGO']}, self.log)
+                self.wfc_mongo.connect()
+            except Exception as ex:
+                self.log.error("Could not connect to WFCatalog Mongo, checksums will be computed")
+                self.log.error(ex)
+                self.wfc_mongo = None
 
     #
     # Notice! file = path + filename
@@ -80,13 +93,22 @@ class tagafile():
         #
         # STEP 2 tag a file on archive (if given and archived files are equals)
         #
-        archived_file = self.utils.sdsPath(self.config['ARCHIVE_TRUST'], os.path.basename(file))
+        archived_file = sdsPath(self.config['ARCHIVE_TRUST'], os.path.basename(file))
         print(archived_file)
 
         try:
-            if os.path.isfile(archived_file):
-                if filecmp.cmp(archived_file, file):
+            if isArchived(self.archive, archived_file):
+                # by checksum: only the checkout file is read (see filechecks_util.sameContent)
+                if self.utils.sameContent(archived_file, file, self.archive, self.wfc_mongo, log=self.log):
                     os.rename(archived_file, archived_file + self.config['TAG_FILE'])
+                    if self.archive is not None:
+                        # same content: the tagged copy keeps size/mtime/md5 of the archived file
+                        row = self.archive.lookup(archived_file)
+                        self.archive.discard(archived_file)
+                        if row is not None:
+                            self.archive.record(archived_file + self.config['TAG_FILE'], row['size'], row['mtime'], row['md5'])
+                        else:
+                            self.archive.record(archived_file + self.config['TAG_FILE'])
                     self.log.info("File in Archive is equals tagged as maintenance file: %s" % os.path.basename(file))
                 else:
                     self.log.error("File in Archive is different, somethings goes wrong aborting on %s" % os.path.basename(file))
@@ -54,6 +54,9 @@
         PASS: pass
         AUTHENTICATE: false
         ALLOW_DOUBLE: false
+        WRITE_BEHIND:
+          ENABLED: true
+          QUEUE_PATH: "/var/lib/archive/queue/mongo-writebehind.sqlite"
     ARCHIVE_ROOT: "/var/lib/archive/incoming/"
     DEFAULT_LOG_FILE: WFCatalog-collector.log
     PROCESSING_TIMEOUT: 120
@@ -67,6 +70,7 @@
 from project.modules.wfcatalogmanager import WFCatalogCollector
 import os
 from project.modules.mongomanager import MongoDAO
+from project.modules.filefacts import fileExists
 import time
 
 
@@ -113,7 +117,7 @@ class wfccollector():
                 self.session['SESSION']['EXIT'] = 1
                 return
                 
-        if not os.path.isfile(file):
+        if not fileExists(self.session, file):
             self.log.info("File no longer exists in archive %s" % filename)
             return
 
@@ -121,7 +125,10 @@ class wfccollector():
         self.parsedargs['file'] = file
 
 
-        #  while loop until connected/Meta-collected
+        #  while loop until connected/Meta-collected;
+        #  with the Mongo write-behind enabled documents are queued on outage, so a single attempt is enough
+        retry = not self.mongo.write_behind
+        wfc_collector = None
         while True:
 
             try:
@@ -143,6 +150,10 @@ class wfccollector():
                 self.log.error(ex)
                 print("ERROR could not compute WF metadata")
                 del wfc_collector
+                wfc_collector = None
+                if not retry:
+                    self.session['SESSION']['EXIT'] = 1
+                    return
                 time.sleep(3)
                 #self.session['SESSION']['EXIT'] = 1
                 #return
@@ -80,6 +80,8 @@ class wfcupdel():
         mylist = wfc_updater.getFileList()
         # do metadata update
         self.log.info("called updater WF CATALOG METADATA for : " + os.path.basename(file))
+        # the streams change: next actions must not read a view loaded before
+        self.mongo.dropSessionDigitalObject(self.session)
         try:
             wfc_updater.collectMetadata(file)
             self.log.info(" WF UPDATE METADATA for source: " + file + " is: OK")
@@ -105,6 +107,12 @@ class wfcupdel():
         self.parsedargs['delete'] = True
         # spawn wfc_collector
         wfc_remover = WFCatalogCollector(self.parsedargs, self.config, self.mongo, self.log)
+        # load the whole digital object once, next actions of the rule read it from session
+        try:
+            wfc_remover.do_view = self.mongo.getSessionDigitalObject(self.session, file)
+        except Exception as ex:
+            self.log.error("Could not load digital object view, falling back to single lookups")
+            self.log.error(ex)
         # wfcatalog collector legacy
         print("get file list")
         mylist = wfc_remover.getFileList()
@@ -119,4 +127,7 @@ class wfcupdel():
             self.log.error(ex)
             # self.session['SESSION']['EXIT'] = 1
             return
+        finally:
+            # the streams changed: next actions reload the view
+            self.mongo.dropSessionDigitalObject(self.session)
         return
@@ -0,0 +1,291 @@
+#! /usr/bin/env python
+"""
+
+# Disclaimer:
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+    This script is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY.
+
+# Copyright:
+    2023 Massimo Fares, INGV - Italy <massimo.fares@ingv.it>; EIDA Italia Team, INGV - Italy  <adaisacd.ont@ingv.it>
+
+# License:
+    GPLv3
+
+# Platform:
+    Linux
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+
+Local existence index of an SDS archive (SQLite).
+
+The trust archive sits on NFS, where every os.path.isfile() is a network
+round trip; preflychecks, the WFCatalog neighbour lookups and move2archive
+probe it for every file. The index keeps one row per archived file:
+
+    path (relative to the archive root) | name (SDS basename) | tag ('' or i.e. '.quarantine') | size | mtime | md5
+
+move2archive, checkout2past and checkout2working record what they add to
+or remove from the archive; a full re-sync walks the archive again
+(utils/archive_index.py --resync). Until the first re-sync has completed
+the index is not used and every lookup goes to the file system, as does
+any path outside the archive root.
+
+The index is a per-host accelerator, not the reference: SQLite must stay
+on a local disk (WAL locking is not safe on NFS) and other hosts and tools
+change the archive without telling it. Its misses are trusted while the
+last re-sync is younger than MAX_SYNC_AGE (a new file is the common case
+of preflychecks, so it costs no NFS round trip); its hits are always
+confirmed on the file system (isArchived), and dropped when the file was
+removed behind its back. Run the re-sync from cron at least every
+MAX_SYNC_AGE; when it is older every lookup goes to the file system again.
+
+Configuration (yaml), inside the CONFIG block of the actions using it
+(disabled unless ENABLED is set):
+
+    ARCHIVE_INDEX:
+      ENABLED: true
+      PATH: "/var/lib/archive/queue/archive-index.sqlite"
+      ROOT: "/var/lib/archive/trust/"
+      MAX_SYNC_AGE: 86400      # seconds a re-sync is trusted for misses
+
+Usage:
+    index = getArchiveIndex(self.config)          # None when not configured
+    isArchived(index, archived_file)              # index miss, or os.path.isfile()
+    index.record(target_path)                     # after a move/copy into the archive
+    index.discard(source_path)                    # after a removal from the archive
+
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+#
+# '' for an SDS file name, the suffix for a tagged copy (NET.STA.LOC.CHA.TYPE.YEAR.DOY.quarantine -> '.quarantine')
+#
+def tagOf(name):
+
+    fields = name.split('.')
+    if len(fields) <= 7:
+        return ''
+    return '.' + '.'.join(fields[7:])
+
+
+class ArchiveIndex():
+
+    def __init__(self, path, root, max_sync_age=86400):
+
+        self.path = path
+        self.root = os.path.abspath(root)
+        self.max_sync_age = max_sync_age
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " tag TEXT NOT NULL,"
+                " size INTEGER,"
+                " mtime REAL,"
+                " md5 TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS files_name ON files (name)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._synced_at = self.syncedAt()
+
+    def _conn(self):
+
+        return sqlite3.connect(self.path, timeout=30)
+
+    #
+    # relative path inside the archive, None if path is outside
+    #
+    def _relative(self, path):
+
+        path = os.path.abspath(path)
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path[len(self.root) + 1:]
+
+    #
+    # True while the last re-sync is younger than max_sync_age
+    #
+    @property
+    def ready(self):
+
+        if self._synced_at is None or time.time() - self._synced_at > self.max_sync_age:
+            # re-synced meanwhile by another process (utils/archive_index.py)?
+            self._synced_at = self.syncedAt()
+        return self._synced_at is not None and time.time() - self._synced_at <= self.max_sync_age
+
+    def syncedAt(self):
+
+        with self._lock, self._conn() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'synced_at'").fetchone()
+        return None if row is None else float(row[0])
+
+    #
+    # row of an archive path ({'path', 'name', 'tag', 'size', 'mtime', 'md5'}) or None
+    #
+    def lookup(self, path):
+
+        rel = self._relative(path)
+        if rel is None:
+            return None
+        with self._lock, self._conn() as conn:
+            row = conn.execute("SELECT path, name, tag, size, mtime, md5 FROM files WHERE path = ?",
+                               (rel,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('path', 'name', 'tag', 'size', 'mtime', 'md5'), row))
+
+    #
+    # True/False from the index, None when the index cannot answer (re-sync missing or too old,
+    # outside root); True only means "recorded here", see isArchived
+    #
+    def exists(self, path):
+
+        if not self.ready or self._relative(path) is None:
+            return None
+        return self.lookup(path) is not None
+
+    #
+    # a file was added to (or rewritten in) the archive; stat is taken from the file unless given
+    #
+    def record(self, path, size=None, mtime=None, md5=None):
+
+        rel = self._relative(path)
+        if rel is None:
+            return False
+        if size is None or mtime is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return self.discard(path)
+            size, mtime = st.st_size, st.st_mtime
+        name = os.path.basename(rel)
+        with self._lock, self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO files (path, name, tag, size, mtime, md5) VALUES (?, ?, ?, ?, ?, ?)",
+                         (rel, name, tagOf(name), size, mtime, md5))
+        return True
+
+    #
+    # a file was removed from the archive (or moved out of it)
+    #
+    def discard(self, path):
+
+        rel = self._relative(path)
+        if rel is None:
+            return False
+        with self._lock, self._conn() as conn:
+            conn.execute("DELETE FROM files WHERE path = ?", (rel,))
+        return True
+
+    #
+    # cache the md5 of an archived file (i.e. computed for a comparison)
+    #
+    def setChecksum(self, path, md5):
+
+        rel = self._relative(path)
+        if rel is None:
+            return False
+        with self._lock, self._conn() as conn:
+            conn.execute("UPDATE files SET md5 = ? WHERE path = ?", (md5, rel))
+        return True
+
+    #
+    # walk the archive and replace the whole index; md5 already known for unchanged files is kept
+    #
+    def resync(self, log=None, batch=10000):
+
+        started = time.time()
+        with self._lock, self._conn() as conn:
+            known = {path: (size, mtime, md5) for path, size, mtime, md5 in
+                     conn.execute("SELECT path, size, mtime, md5 FROM files WHERE md5 IS NOT NULL")}
+
+        rows = []
+        count = 0
+        # no thread lock while walking: lookups keep working on the previous content
+        with self._conn() as conn:
+            conn.execute("CREATE TEMP TABLE scan (path TEXT PRIMARY KEY, name TEXT, tag TEXT, size INTEGER,"
+                         " mtime REAL, md5 TEXT)")
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                for name in filenames:
+                    full = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    rel = full[len(self.root) + 1:]
+                    previous = known.get(rel)
+                    md5 = previous[2] if previous and previous[:2] == (st.st_size, st.st_mtime) else None
+                    rows.append((rel, name, tagOf(name), st.st_size, st.st_mtime, md5))
+                    if len(rows) >= batch:
+                        conn.executemany("INSERT OR REPLACE INTO scan VALUES (?, ?, ?, ?, ?, ?)", rows)
+                        count += len(rows)
+                        rows = []
+                        if log:
+                            log.info("archive index: %d file(s) scanned" % count)
+            conn.executemany("INSERT OR REPLACE INTO scan VALUES (?, ?, ?, ?, ?, ?)", rows)
+            count += len(rows)
+            conn.execute("DELETE FROM files")
+            conn.execute("INSERT INTO files SELECT * FROM scan")
+            conn.execute("DROP TABLE scan")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_at', ?)", (str(started),))
+        self._synced_at = started
+        if log:
+            log.info("archive index: %d file(s) in %s, re-synced in %.1fs" % (count, self.root, time.time() - started))
+        return count
+
+    def __len__(self):
+
+        with self._lock, self._conn() as conn:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+#
+# existence check: a miss of a recently re-synced index is enough, a hit is confirmed on the
+# file system (the file may have been removed by another host or tool) and dropped if stale
+#
+def isArchived(index, path):
+
+    indexed = index.exists(path) if index is not None else None
+    if indexed is False:
+        return False
+    found = os.path.isfile(path)
+    if index is not None:
+        if indexed and not found:
+            index.discard(path)
+        elif found and indexed is None:
+            index.record(path)
+    return found
+
+
+#
+# one index per SQLite file, shared by every action of the worker
+#
+_indexes = {}
+_registry_lock = threading.Lock()
+
+
+def getArchiveIndex(config):
+
+    index_config = config.get('ARCHIVE_INDEX', {})
+    if not index_config.get('ENABLED', False):
+        return None
+    path = index_config.get('PATH', '/var/lib/archive/queue/archive-index.sqlite')
+    with _registry_lock:
+        if path not in _indexes:
+            _indexes[path] = ArchiveIndex(path, index_config.get('ROOT', config.get('ARCHIVE_TRUST',
+                                                                                   '/var/lib/archive/trust/')),
+                                          index_config.get('MAX_SYNC_AGE', 86400))
+        return _indexes[path]
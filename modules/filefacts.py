@@ -0,0 +1,180 @@
+#! /usr/bin/env python
+"""
+
+# Disclaimer:
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+    This script is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY.
+
+# Copyright:
+    2023 Massimo Fares, INGV - Italy <massimo.fares@ingv.it>; EIDA Italia Team, INGV - Italy  <adaisacd.ont@ingv.it>
+
+# License:
+    GPLv3
+
+# Platform:
+    Linux
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+
+Facts about the file of a policy run, computed once and carried in the session.
+
+preflychecks stats the incoming file, parses its SDS name and version
+handle and builds the archive paths; the following actions read them from
+session['SESSION']['FACTS'] instead of stat-ing the file again (one NFS
+round trip each) and re-parsing the name:
+
+    facts = getFacts(self.session, file)       # None if not built for this file
+    if not fileExists(self.session, file): ...  # cached stat, os.path.isfile() without facts
+    facts.net, facts.sta, facts.loc, facts.cha, facts.dtype, facts.year, facts.jday
+    facts.archivePath(self.config['ARCHIVE_TRUST'])
+    facts.md5()                                 # computed on first use, then cached
+
+An action that moves or rewrites the file calls forget() (or dropFacts) so
+later actions go back to the file system.
+
+"""
+import hashlib
+import os
+import stat
+
+SESSION_KEY = 'FACTS'
+
+
+#
+# sds path of a file name: <root><year>/<net>/<sta>/<cha>.D/<name>
+#
+def sdsPath(root_dir, name):
+
+    parts = name.split(".")
+    return root_dir + parts[5] + "/" + parts[0] + "/" + parts[1] + "/" + parts[3] + ".D/" + name
+
+
+class FileFacts():
+
+    def __init__(self, source):
+
+        # source: the file given to the policy, possibly NAME#handle
+        # file:   the file the actions work on (the SDS named working copy for versions)
+        self.source = source
+        self.file = source
+        basename = os.path.basename(source)
+        self.versioned = '#' in basename
+        self.name = basename.split('#')[0]
+        self.handle = basename.split('#')[1].replace('.', '/') if self.versioned else None
+
+        fields = self.name.split('.')
+        self.sds = len(fields) == 7
+        if self.sds:
+            self.net, self.sta, self.loc, self.cha, self.dtype, self.year, self.jday = fields
+        else:
+            self.net = self.sta = self.loc = self.cha = self.dtype = self.year = self.jday = None
+
+        self.stat = None
+        self._md5 = None
+        self.restat()
+
+    #
+    # stat the working file again (None if missing)
+    #
+    def restat(self):
+
+        try:
+            self.stat = os.stat(self.file)
+        except OSError:
+            self.stat = None
+        self._md5 = None
+        return self.stat
+
+    #
+    # the actions now work on another file (i.e. the working copy of a version)
+    #
+    def setFile(self, file):
+
+        self.file = file
+        return self.restat()
+
+    def forget(self):
+
+        self.stat = None
+        self._md5 = None
+
+    @property
+    def exists(self):
+
+        return self.stat is not None and stat.S_ISREG(self.stat.st_mode)
+
+    @property
+    def size(self):
+
+        return None if self.stat is None else self.stat.st_size
+
+    @property
+    def mtime(self):
+
+        return None if self.stat is None else self.stat.st_mtime
+
+    @property
+    def scnl(self):
+
+        return "%s.%s.%s.%s" % (self.net, self.sta, self.loc, self.cha)
+
+    def archivePath(self, root_dir):
+
+        return sdsPath(root_dir, self.name)
+
+    def taggedPath(self, root_dir, tag):
+
+        return sdsPath(root_dir, self.name) + tag
+
+    #
+    # md5 of the working file, read once
+    #
+    def md5(self, blocksize=1024 * 1024):
+
+        if self._md5 is None:
+            hasher = hashlib.md5()
+            with open(self.file, 'rb') as f:
+                for block in iter(lambda: f.read(blocksize), b''):
+                    hasher.update(block)
+            self._md5 = hasher.hexdigest()
+        return self._md5
+
+
+#
+# session helpers
+#
+def buildFacts(session, source):
+
+    facts = FileFacts(source)
+    session['SESSION'][SESSION_KEY] = facts
+    return facts
+
+
+#
+# facts of file (the policy source or the working copy), None if not built for it
+#
+def getFacts(session, file):
+
+    facts = session.get('SESSION', {}).get(SESSION_KEY)
+    if facts is None or file not in (facts.source, facts.file):
+        return None
+    return facts
+
+
+def fileExists(session, file):
+
+    facts = getFacts(session, file)
+    if facts is None or facts.file != file:
+        return os.path.isfile(file)
+    return facts.exists
+
+
+def dropFacts(session):
+
+    session.get('SESSION', {}).pop(SESSION_KEY, None)
@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+"""
+
+# Disclaimer:
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+    This script is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY.
+
+# Copyright:
+    2023 Massimo Fares, INGV - Italy <massimo.fares@ingv.it>; EIDA Italia Team, INGV - Italy  <adaisacd.ont@ingv.it>
+
+# License:
+    GPLv3
+
+# Platform:
+    Linux
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+
+Decoded-stream handoff between the actions of one policy run.
+
+The first action decoding a file (sanitychecks) publishes the obspy Stream
+and a header summary in the session; the following actions working on the
+same file read them instead of decoding the file again.
+
+The handoff is bound to the file: path, size and mtime must still match, so
+a file rewritten or moved meanwhile is never served from the session. It
+also has a lifetime, and the Stream itself is kept only below a size limit
+(the summary is always kept):
+
+    session['SESSION']['STREAM'] = {
+        'file': path, 'size': ..., 'mtime': ..., 'expires': epoch seconds,
+        'headonly': true if the samples were not decoded,
+        'stream': obspy Stream or None,
+        'summary': {'starttime': ..., 'endtime': ..., 'traces': [[id, start, end, sampling_rate, npts], ...]}
+    }
+
+Configuration (yaml), inside the CONFIG block of the publishing action:
+
+    HANDOFF:
+      ENABLED: true
+      MAX_BYTES: 67108864    # keep the Stream only if its samples are below this size
+      LIFETIME: 600          # seconds the handoff is valid
+
+Usage:
+    publishStream(self.session, file, st, self.config.get('HANDOFF'))
+    summary = getSummary(self.session, file)      # None if missing, expired or stale
+    st = getStream(self.session, file)            # None unless fully decoded and still valid
+    releaseStream(self.session)                   # free the samples, keep the summary
+
+"""
+import os
+import time
+
+SESSION_KEY = 'STREAM'
+
+
+#
+# header summary of a Stream: first start, last end and one row per trace
+#
+def summarize(stream):
+
+    traces = [[tr.id, str(tr.stats.starttime), str(tr.stats.endtime), tr.stats.sampling_rate, tr.stats.npts]
+              for tr in stream]
+    return {
+        'starttime': str(min(tr.stats.starttime for tr in stream)) if len(stream) else None,
+        'endtime': str(max(tr.stats.endtime for tr in stream)) if len(stream) else None,
+        'traces': traces
+    }
+
+
+def _fileKey(file):
+
+    st = os.stat(file)
+    return st.st_size, st.st_mtime_ns
+
+
+#
+# publish the Stream decoded from file (headonly: read without samples)
+#
+def publishStream(session, file, stream, config=None, headonly=False):
+
+    config = config or {}
+    if not config.get('ENABLED', True):
+        return None
+    try:
+        size, mtime = _fileKey(file)
+    except OSError:
+        return None
+
+    data_bytes = 0 if headonly else sum(tr.data.nbytes for tr in stream)
+    handoff = {
+        'file': file,
+        'size': size,
+        'mtime': mtime,
+        'expires': time.time() + config.get('LIFETIME', 600),
+        'headonly': headonly,
+        'stream': stream if data_bytes <= config.get('MAX_BYTES', 64 * 1024 * 1024) else None,
+        'summary': summarize(stream)
+    }
+    session['SESSION'][SESSION_KEY] = handoff
+    return handoff
+
+
+#
+# valid handoff of file or None (an expired or stale one is removed)
+#
+def getHandoff(session, file):
+
+    handoff = session.get('SESSION', {}).get(SESSION_KEY)
+    if handoff is None or handoff['file'] != file:
+        return None
+    try:
+        valid = handoff['expires'] > time.time() and _fileKey(file) == (handoff['size'], handoff['mtime'])
+    except OSError:
+        valid = False
+    if not valid:
+        session['SESSION'].pop(SESSION_KEY, None)
+        return None
+    return handoff
+
+
+def getSummary(session, file):
+
+    handoff = getHandoff(session, file)
+    return None if handoff is None else handoff['summary']
+
+
+#
+# fully decoded Stream of file; callers must not modify it (copy() it first)
+#
+def getStream(session, file):
+
+    handoff = getHandoff(session, file)
+    if handoff is None or handoff['headonly']:
+        return None
+    return handoff['stream']
+
+
+#
+# drop the samples once no later action needs them; the summary stays until it expires
+#
+def releaseStream(session):
+
+    handoff = session['SESSION'].get(SESSION_KEY)
+    if handoff is not None:
+        handoff['stream'] = None
+        handoff['headonly'] = True
@@ -15,9 +15,29 @@ Configuration (yaml):
     ....
     "HDFS":
         "WEBHDFS_URL": "http://master02.spark.int.ingv.it:14000"
+        "N_TRANSFERS": 4                  # optional, concurrent uploads in copy_local2hdfs_many
+        "CHUNK_SIZE": 4194304             # optional, streaming chunk for large files (bytes)
+        "LARGE_FILE_SIZE": 67108864       # optional, files above this size use CHUNK_SIZE
+        "RESTORE_RANGE_SIZE": 67108864    # optional, bytes per parallel OPEN in copy_hdfs2local_many
+        "DIR_CACHE_ROOT": "/user/massimo.fares"   # optional, tree listed at connect to seed the directory cache
+        "DIR_CACHE_DEPTH": 4              # optional, listing depth (SDS: year/net/sta/cha.D)
+        "CHECKSUM":                       # optional, verify uploads with GETFILECHECKSUM (needs crc32c)
+            "ENABLED": false
+            "RETRIES": 2                  # re-uploads of a mismatching file
+            "TYPE": "CRC32C"              # cluster dfs.checksum.type
+            "BYTES_PER_CHECKSUM": 512     # cluster dfs.bytes-per-checksum
+            "BLOCK_SIZE": 134217728       # block size used on CREATE
+            "COMBINE_MODE": "MD5MD5CRC"   # cluster dfs.checksum.combine.mode (MD5MD5CRC | COMPOSITE_CRC)
+        "RESUMABLE":                      # optional, temp file + APPEND restart + rename
+            "ENABLED": false              # not yet exercised against a real cluster
+            "MIN_SIZE": 67108864          # files from this size (default LARGE_FILE_SIZE)
+            "ATTEMPTS": 5                 # resumes within one upload call
+            "LEASE_TIMEOUT": 300          # seconds to wait for the lease of an interrupted writer
+            "LEASE_POLL": 10              # seconds between lease probes
     "KERBEROS":
         "KEYTAB": "/usr/src/code/project/spare/massimo.fares.keytab", s
         "PRINCIPAL": "massimo.fares@SPARK.INT.INGV.IT"
+        "RENEW_MARGIN_MINUTES": 60        # optional, re-check klist only this close to expiry
 
 Prerequisites:
 apt-get install krb5-config
@@ -25,6 +45,7 @@ apt-get install libkrb5-dev
 apt-get install krb5-user
 pip3 install requests_kerberos
 pip3 install hdfs
+pip3 install crc32c          # required by CHECKSUM with TYPE CRC32C (refused without it)
 
 Manual kinit:
 klist -kt massimo.fares.keytab
@@ -37,8 +58,13 @@ Usage:
     dao.connect()
     dao.list_dir("/path")
     dao.copy_local2hdfs_overwrite("/local/file", "/hdfs/target")
+    dao.copy_local2hdfs_many([("/local/a", "/hdfs/a"), ("/local/b", "/hdfs/b")])
+    dao.restore_dir("/hdfs/archive/2024", "/var/lib/archive/trust/2024")
     dao.close()
 
+Long-running workers should share one DAO per process instead:
+    dao = get_shared_dao(config, logger)   # connects once, then only ensure_connected()
+
 
 
 # Module-Author:
@@ -46,27 +72,173 @@ Usage:
 
 """
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import os
 import re
+import time
 import subprocess
+import threading
+import hashlib
+import json
+import struct
+import zlib
+import posixpath
+from urllib.parse import quote
 from datetime import datetime, timedelta
 import requests
 from hdfs.ext.kerberos import KerberosClient
 from requests_kerberos import HTTPKerberosAuth, DISABLED
+try:
+    from crc32c import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+
+# NameNode answers to an APPEND on a file whose last writer still holds the lease
+_LEASE_ERRORS = ('AlreadyBeingCreatedException', 'RecoveryInProgressException', 'LeaseExpiredException')
+
+
+class HdfsChecksumError(Exception):
+    """
+    Raised when an uploaded file keeps mismatching its local HDFS checksum.
+    """
+    pass
+
+
+def _crc32c_table() -> List[int]:
+    table = []
+    for n in range(256):
+        crc = n
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = _crc32c_table()
+
+
+def crc32c(data: bytes, crc: int = 0) -> int:
+    """
+    CRC32C (Castagnoli) of data; uses the crc32c package when installed.
+    The table fallback (a few MB/s) is only meant for tests: HdfsDAO refuses
+    CHECKSUM with TYPE CRC32C when the package is missing.
+    """
+    if _crc32c is not None:
+        return _crc32c(data, crc)
+    crc ^= 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+class HdfsChecksum:
+    """
+    HDFS file checksum computed locally, while the bytes are streamed.
+
+    One of the two dfs.checksum.combine.mode values is computed:
+      - MD5MD5CRC (default): one CRC per BYTES_PER_CHECKSUM chunk, MD5 of the
+        chunk CRCs of every block, MD5 of the block MD5s
+        (algorithm "MD5-of-<crcPerBlock>MD5-of-<bpc>CRC32C", bytes = bpc, crcPerBlock, md5)
+      - COMPOSITE_CRC: the CRC of the whole file (algorithm "COMPOSITE-CRC32C")
+    """
+
+    def __init__(self, bytes_per_checksum: int = 512, block_size: int = 128 * 1024 * 1024,
+                 crc_type: str = 'CRC32C', combine_mode: str = 'MD5MD5CRC') -> None:
+        self.composite = combine_mode == 'COMPOSITE_CRC'
+        self.bpc = bytes_per_checksum
+        self.block_size = block_size
+        self._crc = crc32c if crc_type == 'CRC32C' else zlib.crc32
+        self.length = 0
+        self._chunk = b''
+        self._block_crcs = []
+        self._block_bytes = 0
+        self._block_md5s = []
+        self._file_crc = 0
+
+    def update(self, data: bytes) -> None:
+        self.length += len(data)
+        if self.composite:
+            self._file_crc = self._crc(data, self._file_crc)
+            return
+        data = self._chunk + data
+        pos = 0
+        while len(data) - pos >= self.bpc:
+            self._add_chunk(data[pos:pos + self.bpc])
+            pos += self.bpc
+        self._chunk = data[pos:]
+
+    def stream(self, source_path: str, chunk_size: int):
+        """
+        Generator over the file content that updates the checksum on the way.
+        """
+        with open(source_path, 'rb') as src:
+            for block in iter(lambda: src.read(chunk_size), b''):
+                self.update(block)
+                yield block
+
+    def hexdigest(self) -> str:
+        if self.composite:
+            return '%08x' % self._file_crc
+        return self._md5md5().hex()
+
+    def matches(self, remote: Dict[str, Any]) -> bool:
+        """
+        Compare with a GETFILECHECKSUM result {'algorithm', 'bytes', 'length'}.
+        """
+        algorithm = remote.get('algorithm', '')
+        if algorithm.startswith('COMPOSITE-') != self.composite:
+            raise HdfsChecksumError(f"checksum algorithm {algorithm} does not match COMBINE_MODE")
+        if self.composite:
+            return remote['bytes'][-8:].lower() == self.hexdigest()
+
+        m = re.match(r"MD5-of-\d+MD5-of-(\d+)CRC", algorithm)
+        if not m or int(m.group(1)) != self.bpc:
+            raise HdfsChecksumError(f"unsupported or mismatching checksum algorithm: {algorithm}")
+        # bytes = bytesPerCRC (int) + crcPerBlock (long) + md5
+        return remote['bytes'][-32:].lower() == self.hexdigest()
+
+    def _add_chunk(self, chunk: bytes) -> None:
+        self._block_crcs.append(struct.pack('>I', self._crc(chunk) & 0xFFFFFFFF))
+        self._block_bytes += len(chunk)
+        if self._block_bytes >= self.block_size:
+            self._close_block()
+
+    def _close_block(self) -> None:
+        self._block_md5s.append(hashlib.md5(b''.join(self._block_crcs)).digest())
+        self._block_crcs = []
+        self._block_bytes = 0
+
+    def _md5md5(self) -> bytes:
+        md5s = list(self._block_md5s)
+        crcs = list(self._block_crcs)
+        if self._chunk:
+            crcs.append(struct.pack('>I', self._crc(self._chunk) & 0xFFFFFFFF))
+        if crcs:
+            md5s.append(hashlib.md5(b''.join(crcs)).digest())
+        return hashlib.md5(b''.join(md5s)).digest()
 
 """
 # Data Access Object for HDFS operations via WebHDFS + Kerberos.
 
 Public methods:
   - connect(): establish session and Kerberos-authenticated KerberosClient
+  - ensure_connected(): cheap pre-operation check, re-runs klist/kinit only near ticket expiry
+  - hdfs_mkdir(path) / hdfs_mkdirs([path, ...]): create directories not yet known to exist
+  - sds_target(root, file_name): SDS path of a day file under an HDFS root
   - list_dir(path)
   - list_user_dir(path)
   - copy_local2hdfs_overwrite(local, hdfs)
   - copy_local2hdfs(local, hdfs)
+  - copy_local2hdfs_many([(local, hdfs), ...])
   - move_hdfs2hdfs(src, dst)
   - copy_hdfs2local(hdfs, local)
+  - copy_hdfs2local_many([(hdfs, local), ...]) / restore_dir(hdfs_dir, local_dir): parallel range-read restore
+  - read_range(hdfs_path, offset, length)
   - delete_hdfs(hdfs_path)
-  - close(): cleanup session
+  - close(): cleanup session (sessions and clients are per thread)
 """
 class HdfsDAO:
 
@@ -83,25 +255,74 @@ class HdfsDAO:
         # Kerberos config
         self._keytab = self.config['KERBEROS']['KEYTAB'] #self.config.get("KERBEROS", {}).get("KEYTAB")
         self._principal = self.config['KERBEROS']['PRINCIPAL'] #self.config.get("KERBEROS", {}).get("PRINCIPAL")
-
-        # Internal state
-        self.kclient= None
-        self.session = None
+        self.renew_margin = self.config['KERBEROS'].get('RENEW_MARGIN_MINUTES', 60)
+
+        # Upload policy (optional keys)
+        self.n_transfers = self.config['HDFS'].get('N_TRANSFERS', 4)
+        self.chunk_size = self.config['HDFS'].get('CHUNK_SIZE', 4 * 1024 * 1024)
+        self.large_file_size = self.config['HDFS'].get('LARGE_FILE_SIZE', 64 * 1024 * 1024)
+        self.restore_range_size = self.config['HDFS'].get('RESTORE_RANGE_SIZE', 64 * 1024 * 1024)
+
+        # End-to-end integrity check (optional): must mirror the cluster
+        # dfs.bytes-per-checksum / dfs.checksum.type; block size is forced on CREATE
+        checksum = self.config['HDFS'].get('CHECKSUM', {})
+        self.verify_checksum = checksum.get('ENABLED', False)
+        self.checksum_retries = checksum.get('RETRIES', 2)
+        self.bytes_per_checksum = checksum.get('BYTES_PER_CHECKSUM', 512)
+        self.checksum_type = checksum.get('TYPE', 'CRC32C')
+        self.block_size = checksum.get('BLOCK_SIZE', 128 * 1024 * 1024)
+        self.checksum_combine = checksum.get('COMBINE_MODE', 'MD5MD5CRC')
+        if self.verify_checksum and self.checksum_type == 'CRC32C' and _crc32c is None:
+            # the pure python CRC would make every upload CPU-bound
+            self.log.error("HDFS.CHECKSUM needs the crc32c package (pip3 install crc32c): "
+                           "upload checksum verification disabled")
+            self.verify_checksum = False
+
+        # Resumable uploads (optional) for files above MIN_SIZE
+        resumable = self.config['HDFS'].get('RESUMABLE', {})
+        self.resumable = resumable.get('ENABLED', False)
+        self.resume_min_size = resumable.get('MIN_SIZE', self.large_file_size)
+        self.resume_attempts = resumable.get('ATTEMPTS', 5)
+        self.lease_timeout = resumable.get('LEASE_TIMEOUT', 300)
+        self.lease_poll = resumable.get('LEASE_POLL', 10)
+
+        # Internal state: requests.Session and its HTTPKerberosAuth are not
+        # thread-safe, so every thread (parallel transfers, actions sharing the
+        # DAO) gets its own session and KerberosClient, see kclient / session
+        self._local = threading.local()
+        self._generation = 0
+        self._connected = False
         self.token_is_live= False
+        self.ticket_expiry: Optional[datetime] = None
+        self._ticket_lock = threading.Lock()
+
+        # Directories known to exist: seeded at connect, grown by hdfs_mkdir
+        self.dir_cache_root = self.config['HDFS'].get('DIR_CACHE_ROOT')
+        self.dir_cache_depth = self.config['HDFS'].get('DIR_CACHE_DEPTH', 4)
+        self._known_dirs = set()
+        self._dirs_lock = threading.Lock()
 
     # ---------------------------
     # Public API
     # ---------------------------
-    def connect(self, min_remaining_minutes: int = 60) -> bool:
+    def connect(self, min_remaining_minutes: Optional[int] = None) -> bool:
         """
         Connect to HDFS using Kerberos. Ensures a valid Kerberos ticket
         before instantiating the KerberosClient.
 
+        Calling connect() on an already connected DAO does not open a new
+        session: it only makes sure the cached ticket is still valid.
+
         Returns
         -------
         bool
             True on successful connection, False otherwise (logs error).
         """
+        if min_remaining_minutes is None:
+            min_remaining_minutes = self.renew_margin
+        if self.kclient is not None and self.token_is_live:
+            return self.ensure_connected(min_remaining_minutes)
+
         try:
             # Ensure Kerberos ticket is valid/renewed
             self.token_is_live = self._check_and_renew_kerberos(min_remaining_minutes)
@@ -109,29 +330,70 @@ class HdfsDAO:
                 self.log.error("Kerberos ticket invalid or could not be renewed. Aborting connect.")
                 return False
 
-            # Initialize HTTP session
-            self.session = requests.Session()
-
-            # Create KerberosClient for WebHDFS operations
-            self.kclient = KerberosClient(
-                url=self.webhdfs_url,
-                root='/',
-                mutual_auth='OPTIONAL',
-                session=self.session
-            )
+            # New HTTP sessions and KerberosClients, created per thread on first use
+            self._generation += 1
+            self._connected = True
 
             # Test connection by listing root; will raise if something fails
             self.kclient.list("/")
 
             self.log.info("Connected to HDFS (WebHDFS) successfully.")
+            self._seed_dir_cache()
             return True
 
         except Exception as exc:
             self.log.error(f"HDFS connection error: {exc}")
             # Keep token_is_live as False when connect fails
             self.token_is_live = False
+            self._connected = False
             return False
 
+    @property
+    def kclient(self) -> Optional[KerberosClient]:
+        """
+        KerberosClient of the calling thread (None while not connected).
+        """
+        local = self._thread_client()
+        return local.kclient if local is not None else None
+
+    @property
+    def session(self) -> Optional[requests.Session]:
+        """
+        HTTP session of the calling thread (None while not connected).
+        """
+        local = self._thread_client()
+        return local.session if local is not None else None
+
+    def ensure_connected(self, min_remaining_minutes: Optional[int] = None) -> bool:
+        """
+        Make sure the DAO is usable before an operation, reusing the open
+        session and KerberosClient.
+
+        The ticket expiry read by the last klist is kept in memory: while it is
+        further away than `min_remaining_minutes` no subprocess is spawned.
+        Only near expiry (or if never connected) klist/kinit run again.
+
+        Returns
+        -------
+        bool
+            True when the session is usable, False otherwise (logs error).
+        """
+        if min_remaining_minutes is None:
+            min_remaining_minutes = self.renew_margin
+        if self.kclient is None:
+            return self.connect(min_remaining_minutes)
+        if self._ticket_is_fresh(min_remaining_minutes):
+            return True
+
+        with self._ticket_lock:
+            # another thread may have renewed while we waited
+            if self._ticket_is_fresh(min_remaining_minutes):
+                return True
+            self.token_is_live = self._check_and_renew_kerberos(min_remaining_minutes)
+            if not self.token_is_live:
+                self.log.error("Kerberos ticket invalid or could not be renewed.")
+            return self.token_is_live
+
     def list_dir(self, dirpath: str = '/user/massimo.fares') -> Optional[List[str]]:
         """
         List contents of an HDFS directory.
@@ -139,7 +401,7 @@ class HdfsDAO:
         Returns list of names or None on failure.
         """
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Listing HDFS directory: {dirpath}")
@@ -153,7 +415,7 @@ class HdfsDAO:
         List a user's HDFS directory.
         """
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Listing user directory: {user_path}")
@@ -175,7 +437,13 @@ class HdfsDAO:
         -------
         bool
             True if created successfully or already exists, False on error.
+
+        Directories already known to exist (directory cache) cost no request;
+        MKDIRS creates the missing parents too, all of them are cached.
         """
+        hdfs_path = posixpath.normpath(hdfs_path)
+        if self._dir_known(hdfs_path):
+            return True
 
         # Build WebHDFS URL
         url = (
@@ -184,7 +452,7 @@ class HdfsDAO:
         )
 
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Creating hdfs directory: {hdfs_path}")
@@ -192,6 +460,7 @@ class HdfsDAO:
 
             if response.status_code == 200:
                 self.log.info(f"HDFS directory created: {hdfs_path}")
+                self._remember_dir(hdfs_path)
                 return True
             elif response.status_code == 401:
                 self.log.error("Kerberos authentication failed.")
@@ -206,6 +475,34 @@ class HdfsDAO:
 
         return False
 
+    def hdfs_mkdirs(self, hdfs_paths: List[str]) -> bool:
+        """
+        Create many directories at once (i.e. the SDS tree of a batch of files):
+        known directories and parents of other requested ones are skipped, so
+        one MKDIRS is sent per missing leaf directory.
+
+        Returns True if every directory exists afterwards.
+        """
+        wanted = {posixpath.normpath(path) for path in hdfs_paths}
+        missing = {path for path in wanted if not self._dir_known(path)}
+        # MKDIRS is recursive: a parent of another missing directory comes for free
+        leaves = [path for path in missing
+                  if not any(other.startswith(path + '/') for other in missing)]
+        if leaves:
+            self.log.info(f"Creating {len(leaves)} hdfs directory tree(s) for {len(wanted)} directories")
+        return all([self.hdfs_mkdir(path) for path in sorted(leaves)])
+
+    @staticmethod
+    def sds_target(root: str, file_name: str) -> str:
+        """
+        SDS path of a day file under an HDFS root:
+        <root>/<YEAR>/<NET>/<STA>/<CHA>.D/<file_name>
+        """
+        parts = file_name.split(".")
+        if len(parts) < 6:
+            raise ValueError(f"Invalid SDS filename: {file_name}")
+        return posixpath.join(root, parts[5], parts[0], parts[1], f"{parts[3]}.D", file_name)
+
     def copy_local2hdfs_overwrite(self, source_path: str, target_path: str) -> bool:
         """
         Upload a local file to HDFS, overwriting target if it exists.
@@ -213,16 +510,11 @@ class HdfsDAO:
         Returns True on success, False on failure.
         """
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Uploading (overwrite) {source_path} -> {target_path}")
-            self.kclient.upload(
-                hdfs_path=target_path,
-                local_path=source_path,
-                overwrite=True,
-                n_threads=1
-            )
+            self._put(source_path, target_path, overwrite=True)
             return True
         except Exception as exc:
             self.log.error(f"Upload (overwrite) error: {exc}")
@@ -233,27 +525,62 @@ class HdfsDAO:
         Upload a local file to HDFS without overwriting (fails if exists).
         """
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Uploading {source_path} -> {target_path} (no overwrite)")
-            self.kclient.upload(
-                hdfs_path=target_path,
-                local_path=source_path,
-                overwrite=False,
-                n_threads=1
-            )
+            self._put(source_path, target_path, overwrite=False)
             return True
         except Exception as exc:
             self.log.error(f"Upload (no overwrite) error: {exc}")
             return False
 
+    def copy_local2hdfs_many(self, pairs: List[Tuple[str, str]], overwrite: bool = True,
+                             n_transfers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Upload many local files to HDFS with concurrent transfers.
+
+        Parameters
+        ----------
+        pairs : list of (source_path, target_path)
+            Local file and HDFS destination of each upload.
+        overwrite : bool
+            Overwrite existing targets (default True).
+        n_transfers : int, optional
+            Concurrent uploads; defaults to HDFS.N_TRANSFERS.
+
+        Returns
+        -------
+        dict
+            {'files': [per-file result], 'ok': int, 'failed': int,
+             'bytes': int, 'seconds': float, 'mb_per_s': float}
+            where each per-file result is
+            {'source', 'target', 'ok', 'bytes', 'seconds', 'mb_per_s', 'error'}.
+        """
+        n_transfers = n_transfers or self.n_transfers
+        start = time.monotonic()
+
+        if not self.ensure_connected():
+            self.log.error("Kerberos authentication is not active.")
+            results = [self._upload_result(src, dst, False, 0, 0.0, "Kerberos authentication is not active.")
+                       for src, dst in pairs]
+        else:
+            self.log.info(f"Uploading {len(pairs)} file(s) with {n_transfers} concurrent transfer(s)")
+            self.hdfs_mkdirs([posixpath.dirname(dst) for _, dst in pairs])
+            with ThreadPoolExecutor(max_workers=n_transfers) as pool:
+                results = list(pool.map(lambda pair: self._upload_one(pair[0], pair[1], overwrite), pairs))
+
+        summary = self._transfer_summary(results, time.monotonic() - start)
+        self.log.info(f"Uploaded {summary['ok']}/{len(pairs)} file(s), "
+                      f"{summary['bytes']} bytes in {summary['seconds']:.1f}s ({summary['mb_per_s']:.2f} MB/s)")
+        return summary
+
     def move_hdfs2hdfs(self, hdfs_src_path: str, hdfs_dst_path: str) -> bool:
         """
         Rename or move a file within HDFS.
         """
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Renaming/moving: {hdfs_src_path} -> {hdfs_dst_path}")
@@ -268,7 +595,7 @@ class HdfsDAO:
         Download an HDFS file to local filesystem.
         """
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Downloading {source_hdfs_path} -> {target_local_path}")
@@ -282,16 +609,117 @@ class HdfsDAO:
             self.log.error(f"Download error: {exc}")
             return False
 
+    def copy_hdfs2local_many(self, pairs: List[Tuple[str, str]], n_transfers: Optional[int] = None,
+                             range_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Bulk restore: download many HDFS files concurrently.
+
+        Files larger than `range_size` are split into ranges fetched with
+        parallel OPEN offset/length requests and written in place into a
+        preallocated '<local>.part' file, renamed when complete. Every range of
+        every file goes into one pool, so a few huge files and many small
+        ones share the same `n_transfers` streams.
+
+        Parameters
+        ----------
+        pairs : list of (hdfs_path, local_path)
+            HDFS file and local destination (file path or existing directory).
+        n_transfers : int, optional
+            Concurrent requests; defaults to HDFS.N_TRANSFERS.
+        range_size : int, optional
+            Bytes per range request; defaults to HDFS.RESTORE_RANGE_SIZE.
+
+        Returns
+        -------
+        dict
+            Same summary as copy_local2hdfs_many, with per-file
+            {'source', 'target', 'ok', 'bytes', 'seconds', 'mb_per_s', 'error'}.
+        """
+        n_transfers = n_transfers or self.n_transfers
+        range_size = range_size or self.restore_range_size
+        start = time.monotonic()
+
+        if not self.ensure_connected():
+            self.log.error("Kerberos authentication is not active.")
+            results = [self._upload_result(src, dst, False, 0, 0.0, "Kerberos authentication is not active.")
+                       for src, dst in pairs]
+            return self._transfer_summary(results, time.monotonic() - start)
+
+        # plan: preallocate every target, one task per range
+        files, tasks = [], []
+        for hdfs_path, local_path in pairs:
+            entry = {'source': hdfs_path, 'target': local_path, 'error': None, 'start': time.monotonic()}
+            files.append(entry)
+            try:
+                length = self.kclient.status(hdfs_path)['length']
+                if os.path.isdir(local_path):
+                    local_path = os.path.join(local_path, posixpath.basename(hdfs_path))
+                    entry['target'] = local_path
+                os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+                entry['length'] = length
+                entry['part'] = local_path + '.part'
+                with open(entry['part'], 'wb') as f:
+                    f.truncate(length)
+                for offset in range(0, length, range_size):
+                    tasks.append((entry, offset, min(range_size, length - offset)))
+            except Exception as exc:
+                entry['error'] = str(exc)
+
+        self.log.info(f"Restoring {len(pairs)} file(s) in {len(tasks)} range request(s) "
+                      f"with {n_transfers} concurrent transfer(s)")
+        with ThreadPoolExecutor(max_workers=n_transfers) as pool:
+            for entry, error in pool.map(lambda task: self._download_range(*task), tasks):
+                if error and not entry['error']:
+                    entry['error'] = error
+
+        results = [self._finish_download(entry) for entry in files]
+        summary = self._transfer_summary(results, time.monotonic() - start)
+        self.log.info(f"Restored {summary['ok']}/{len(pairs)} file(s), "
+                      f"{summary['bytes']} bytes in {summary['seconds']:.1f}s ({summary['mb_per_s']:.2f} MB/s)")
+        return summary
+
+    def restore_dir(self, hdfs_dir: str, local_dir: str, n_transfers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Restore a whole HDFS tree (i.e. one year of the SDS archive) under
+        local_dir, keeping the relative layout, with copy_hdfs2local_many.
+        """
+        pairs = []
+        for dirpath, _, filenames in self.kclient.walk(hdfs_dir):
+            relative = posixpath.relpath(dirpath, hdfs_dir)
+            for name in filenames:
+                pairs.append((posixpath.join(dirpath, name), os.path.normpath(os.path.join(local_dir, relative, name))))
+        return self.copy_hdfs2local_many(pairs, n_transfers)
+
+    def read_range(self, hdfs_path: str, offset: int = 0, length: Optional[int] = None) -> Optional[bytes]:
+        """
+        Read `length` bytes of an HDFS file starting at `offset`
+        (WebHDFS OPEN with offset/length); the whole file if length is None.
+
+        Returns the bytes or None on failure.
+        """
+        try:
+            if not self.ensure_connected():
+                raise RuntimeError("Kerberos authentication is not active.")
+
+            self.log.debug(f"Reading {hdfs_path} offset={offset} length={length}")
+            with self.kclient.read(hdfs_path, offset=offset, length=length) as reader:
+                return reader.read()
+        except Exception as exc:
+            self.log.error(f"Read error for {hdfs_path}: {exc}")
+            return None
+
     def delete_hdfs(self, hdfs_dst_path: str) -> bool:
         """
         Delete a file on HDFS (non-recursive by default).
         """
         try:
-            if not self.token_is_live:
+            if not self.ensure_connected():
                 raise RuntimeError("Kerberos authentication is not active.")
 
             self.log.info(f"Deleting HDFS path: {hdfs_dst_path}")
             self.kclient.delete(hdfs_dst_path, recursive=False, skip_trash=False)
+            with self._dirs_lock:
+                self._known_dirs.discard(posixpath.normpath(hdfs_dst_path))
             return True
         except Exception as exc:
             self.log.error(f"Delete error for {hdfs_dst_path}: {exc}")
@@ -302,10 +730,14 @@ class HdfsDAO:
         Close HTTP session and clear Kerberos client reference.
         """
         try:
-            if self.session:
-                self.session.close()
-            self.kclient = None
+            self._connected = False
+            local = self._local
+            if getattr(local, 'session', None) is not None:
+                local.session.close()
+                local.session = None
+                local.kclient = None
             self.token_is_live = False
+            self.ticket_expiry = None
             self.log.info("HdfsDAO session closed.")
         except Exception as exc:
             self.log.debug(f"Error during close(): {exc}")
@@ -313,6 +745,352 @@ class HdfsDAO:
     # ---------------------------
     # Private helpers
     # ---------------------------
+    def _thread_client(self):
+        """
+        Session and KerberosClient of the calling thread, created on its first
+        use after each connect(). Sessions of the transfer threads go away with
+        their thread at the end of a batch.
+        """
+        if not self._connected:
+            return None
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            if getattr(local, 'session', None) is not None:
+                local.session.close()
+            local.session = requests.Session()
+            local.kclient = KerberosClient(
+                url=self.webhdfs_url,
+                root='/',
+                mutual_auth='OPTIONAL',
+                session=local.session
+            )
+            local.generation = self._generation
+        return local
+
+    def _seed_dir_cache(self) -> None:
+        """
+        Fill the directory cache from a recursive listing of DIR_CACHE_ROOT.
+        """
+        if not self.dir_cache_root:
+            return
+        try:
+            start = time.monotonic()
+            seeded = 0
+            for dirpath, _, _ in self.kclient.walk(self.dir_cache_root, depth=self.dir_cache_depth,
+                                                    ignore_missing=True):
+                self._remember_dir(dirpath)
+                seeded += 1
+            self.log.info(f"Directory cache seeded with {seeded} directories under "
+                          f"{self.dir_cache_root} in {time.monotonic() - start:.1f}s")
+        except Exception as exc:
+            # the cache is an optimization: without it hdfs_mkdir just asks HDFS
+            self.log.warning(f"Cannot seed HDFS directory cache: {exc}")
+
+    def _dir_known(self, hdfs_path: str) -> bool:
+        with self._dirs_lock:
+            return hdfs_path in self._known_dirs
+
+    def _remember_dir(self, hdfs_path: str) -> None:
+        """
+        Cache a directory and all its parents.
+        """
+        path = posixpath.normpath(hdfs_path)
+        with self._dirs_lock:
+            while path not in self._known_dirs and path not in ('/', '.', ''):
+                self._known_dirs.add(path)
+                path = posixpath.dirname(path)
+
+    def _ticket_is_fresh(self, min_remaining_minutes: int) -> bool:
+        """
+        True if the cached ticket expiry is further away than the margin.
+        """
+        return (self.token_is_live and self.ticket_expiry is not None
+                and self.ticket_expiry - datetime.now() > timedelta(minutes=min_remaining_minutes))
+
+    def _read_ticket_expiry(self) -> Optional[datetime]:
+        """
+        Run `klist` and return the parsed ticket expiry (None on failure).
+        """
+        result = subprocess.run(["klist"], capture_output=True, text=True)
+        if result.returncode != 0:
+            self.log.error("Unable to read Kerberos ticket using klist.")
+            self.log.debug(f"klist stderr: {result.stderr}")
+            return None
+
+        output = result.stdout or result.stderr or ""
+        self.log.debug(f"klist output:\n{output}")
+
+        expire_dt = self._parse_klist_expiry(output)
+        if expire_dt is None:
+            self.log.error("Could not parse Kerberos ticket expiration time from klist output.")
+        return expire_dt
+
+    def _chunk_size_for(self, source_path: str) -> int:
+        """
+        Streaming chunk size for an upload: large files use HDFS.CHUNK_SIZE,
+        small ones the hdfs library default.
+        """
+        try:
+            if os.path.getsize(source_path) >= self.large_file_size:
+                return self.chunk_size
+        except OSError:
+            pass
+        return 65536
+
+    def _put(self, source_path: str, target_path: str, overwrite: bool) -> None:
+        """
+        Upload one file; with HDFS.CHECKSUM.ENABLED the HDFS checksum is computed
+        while streaming and compared with GETFILECHECKSUM, re-uploading only on
+        mismatch. Raises on failure.
+        """
+        # parent directory through the cache: one MKDIRS per directory and run
+        self.hdfs_mkdir(posixpath.dirname(target_path))
+
+        if self.resumable and os.path.getsize(source_path) >= self.resume_min_size:
+            self._put_resumable(source_path, target_path, overwrite)
+            return
+
+        if not self.verify_checksum:
+            self.kclient.upload(
+                hdfs_path=target_path,
+                local_path=source_path,
+                overwrite=overwrite,
+                n_threads=1,
+                chunk_size=self._chunk_size_for(source_path)
+            )
+            return
+
+        target_path = self._resolve_target(source_path, target_path)
+        for attempt in range(self.checksum_retries + 1):
+            checksum = HdfsChecksum(self.bytes_per_checksum, self.block_size,
+                                    self.checksum_type, self.checksum_combine)
+            self.kclient.write(
+                target_path,
+                data=checksum.stream(source_path, self._chunk_size_for(source_path)),
+                # a mismatching copy is ours: replace it on retry
+                overwrite=overwrite or attempt > 0,
+                blocksize=self.block_size
+            )
+            remote = self.kclient.checksum(target_path)
+            if checksum.matches(remote):
+                self.log.debug(f"Checksum verified for {target_path}: {remote['algorithm']}")
+                return
+            self.log.warning(f"Checksum mismatch for {target_path} "
+                             f"(attempt {attempt + 1}/{self.checksum_retries + 1}): "
+                             f"local {checksum.hexdigest()} remote {remote['bytes']}")
+
+        raise HdfsChecksumError(f"checksum mismatch after {self.checksum_retries + 1} upload(s): {target_path}")
+
+    def _put_resumable(self, source_path: str, target_path: str, overwrite: bool) -> None:
+        """
+        Upload through a temporary '.partial' file next to the target: after a
+        failure (ticket expiry, network blip) the interrupted writer's lease is
+        waited out (_close_partial), the remote length is read back and the
+        upload continues with WebHDFS APPEND from that offset; the complete
+        file is renamed into place. The temporary name depends on
+        the source path, size and mtime, so a later call (i.e. an upload queue
+        retry) resumes the same partial file while a changed source restarts.
+        Raises on failure.
+        """
+        target_path = self._resolve_target(source_path, target_path)
+        stat = os.stat(source_path)
+        key = hashlib.md5(f"{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+        tmp_path = posixpath.join(posixpath.dirname(target_path),
+                                  f".{posixpath.basename(target_path)}.{key}.partial")
+        chunk_size = self._chunk_size_for(source_path)
+
+        # a partial left by an earlier call may still be open (dead writer's lease)
+        offset = self._close_partial(tmp_path)
+        if offset is not None and offset > stat.st_size:
+            self.log.warning(f"Discarding inconsistent partial upload {tmp_path} ({offset} > {stat.st_size} bytes)")
+            self.kclient.delete(tmp_path)
+            offset = None
+        if offset:
+            self.log.info(f"Resuming upload of {source_path} at byte {offset}/{stat.st_size}")
+
+        # checksum computed while streaming a fresh upload, re-read only if it had to be resumed
+        checksum = None
+        for attempt in range(self.resume_attempts + 1):
+            try:
+                if offset is None:
+                    if self.verify_checksum:
+                        checksum = HdfsChecksum(self.bytes_per_checksum, self.block_size,
+                                                self.checksum_type, self.checksum_combine)
+                        data = checksum.stream(source_path, chunk_size)
+                    else:
+                        data = self._read_from(source_path, 0, chunk_size)
+                    self.kclient.write(tmp_path, data=data, overwrite=True,
+                                       blocksize=self.block_size if self.verify_checksum else None)
+                elif offset < stat.st_size:
+                    self.kclient.write(tmp_path, data=self._read_from(source_path, offset, chunk_size),
+                                       append=True)
+                break
+            except Exception as exc:
+                checksum = None
+                if attempt == self.resume_attempts:
+                    raise
+                self.ensure_connected()
+                self.log.warning(f"Upload of {source_path} interrupted ({exc}), "
+                                 f"waiting for the lease of {tmp_path}")
+                # the length is final only once the file is closed
+                offset = self._close_partial(tmp_path)
+                self.log.warning(f"Resuming upload of {source_path} at byte {offset or 0}/{stat.st_size}")
+
+        length = self._remote_length(tmp_path)
+        if length != stat.st_size:
+            raise IOError(f"partial upload {tmp_path} has {length} bytes, expected {stat.st_size}")
+
+        if self.verify_checksum:
+            if checksum is None:
+                checksum = HdfsChecksum(self.bytes_per_checksum, self.block_size,
+                                        self.checksum_type, self.checksum_combine)
+                for _ in checksum.stream(source_path, chunk_size):
+                    pass
+            remote = self.kclient.checksum(tmp_path)
+            if not checksum.matches(remote):
+                # start over at the next call
+                self.kclient.delete(tmp_path)
+                raise HdfsChecksumError(f"checksum mismatch on resumed upload: {target_path}")
+
+        if self.kclient.status(target_path, strict=False):
+            if not overwrite:
+                raise IOError(f"{target_path} already exists")
+            self.kclient.delete(target_path)
+        self.kclient.rename(tmp_path, target_path)
+
+    def _resolve_target(self, source_path: str, target_path: str) -> str:
+        """
+        upload() puts files inside an existing directory: write() needs the file path.
+        """
+        status = self.kclient.status(target_path, strict=False)
+        if status and status['type'] == 'DIRECTORY':
+            return f"{target_path.rstrip('/')}/{os.path.basename(source_path)}"
+        return target_path
+
+    def _remote_length(self, hdfs_path: str) -> Optional[int]:
+        status = self.kclient.status(hdfs_path, strict=False)
+        return status['length'] if status else None
+
+    def _close_partial(self, hdfs_path: str) -> Optional[int]:
+        """
+        Length of a partial file once it is closed, None if it does not exist.
+        The writer of an interrupted stream keeps its lease (soft limit 60 s)
+        and GETFILESTATUS does not count the last block while the file is open;
+        an empty APPEND is accepted only when nobody holds the lease, and makes
+        the NameNode recover the file (last block included) once the soft limit
+        has expired. Probed every LEASE_POLL seconds up to LEASE_TIMEOUT.
+        """
+        if self._remote_length(hdfs_path) is None:
+            return None
+        deadline = time.monotonic() + self.lease_timeout
+        while True:
+            try:
+                self.kclient.write(hdfs_path, data=b'', append=True)
+                return self._remote_length(hdfs_path)
+            except Exception as exc:
+                remote = getattr(exc, 'exception', None) or str(exc)
+                if not any(name in remote for name in _LEASE_ERRORS):
+                    raise
+                if time.monotonic() >= deadline:
+                    raise IOError(f"lease of {hdfs_path} not released after {self.lease_timeout}s: {exc}")
+                self.log.debug(f"{hdfs_path} still leased ({remote}), next probe in {self.lease_poll}s")
+                time.sleep(self.lease_poll)
+
+    @staticmethod
+    def _read_from(source_path: str, offset: int, chunk_size: int):
+        with open(source_path, 'rb') as src:
+            src.seek(offset)
+            for block in iter(lambda: src.read(chunk_size), b''):
+                yield block
+
+    def _upload_one(self, source_path: str, target_path: str, overwrite: bool) -> Dict[str, Any]:
+        """
+        Single upload used by the parallel API; never raises, returns the per-file result.
+        """
+        start = time.monotonic()
+        try:
+            size = os.path.getsize(source_path)
+            self._put(source_path, target_path, overwrite)
+            return self._upload_result(source_path, target_path, True, size, time.monotonic() - start)
+        except Exception as exc:
+            self.log.error(f"Upload error {source_path} -> {target_path}: {exc}")
+            return self._upload_result(source_path, target_path, False, 0, time.monotonic() - start, str(exc))
+
+    def _download_range(self, entry: Dict[str, Any], offset: int, length: int):
+        """
+        Fetch one range into the preallocated part file; never raises,
+        returns (entry, error).
+        """
+        if entry['error']:
+            return entry, None
+        try:
+            fd = os.open(entry['part'], os.O_WRONLY)
+            try:
+                written = 0
+                with self.kclient.read(entry['source'], offset=offset, length=length,
+                                       chunk_size=self.chunk_size) as reader:
+                    for block in reader:
+                        os.pwrite(fd, block, offset + written)
+                        written += len(block)
+            finally:
+                os.close(fd)
+            if written != length:
+                return entry, f"short read at offset {offset}: {written}/{length} bytes"
+            return entry, None
+        except Exception as exc:
+            self.log.error(f"Range read error {entry['source']} [{offset}:{offset + length}]: {exc}")
+            return entry, str(exc)
+
+    def _finish_download(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Verify (HDFS.CHECKSUM) and move the part file into place.
+        """
+        seconds = time.monotonic() - entry['start']
+        try:
+            if entry['error']:
+                raise IOError(entry['error'])
+            if self.verify_checksum:
+                checksum = HdfsChecksum(self.bytes_per_checksum, self.block_size,
+                                        self.checksum_type, self.checksum_combine)
+                for _ in checksum.stream(entry['part'], self.chunk_size):
+                    pass
+                if not checksum.matches(self.kclient.checksum(entry['source'])):
+                    raise HdfsChecksumError(f"checksum mismatch on restore of {entry['source']}")
+            with open(entry['part'], 'rb+') as f:
+                os.fsync(f.fileno())
+            os.replace(entry['part'], entry['target'])
+            return self._upload_result(entry['source'], entry['target'], True, entry['length'], seconds)
+        except Exception as exc:
+            self.log.error(f"Restore error {entry['source']} -> {entry['target']}: {exc}")
+            if entry.get('part') and os.path.exists(entry['part']):
+                os.remove(entry['part'])
+            return self._upload_result(entry['source'], entry['target'], False, 0, seconds, str(exc))
+
+    @staticmethod
+    def _transfer_summary(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        total = sum(r['bytes'] for r in results if r['ok'])
+        return {
+            'files': results,
+            'ok': sum(1 for r in results if r['ok']),
+            'failed': sum(1 for r in results if not r['ok']),
+            'bytes': total,
+            'seconds': elapsed,
+            'mb_per_s': (total / 1048576.0) / elapsed if elapsed > 0 else 0.0
+        }
+
+    @staticmethod
+    def _upload_result(source_path: str, target_path: str, ok: bool, size: int, seconds: float,
+                       error: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            'source': source_path,
+            'target': target_path,
+            'ok': ok,
+            'bytes': size,
+            'seconds': seconds,
+            'mb_per_s': (size / 1048576.0) / seconds if ok and seconds > 0 else 0.0,
+            'error': error
+        }
+
     def _check_and_renew_kerberos(self, min_remaining_minutes: int = 60) -> bool:
         """
         Check current Kerberos ticket expiration and try to renew it if needed.
@@ -323,24 +1101,19 @@ class HdfsDAO:
           3) try `kinit -R` to renew
           4) if renew fails and keytab/principal configured try `kinit -kt keytab principal`
 
+        The resulting expiry is cached in `self.ticket_expiry` (re-read with
+        klist after a successful renewal) so ensure_connected() can skip the
+        subprocesses until the ticket gets close to expiring again.
+
         Returns True if ticket is currently valid or was successfully renewed.
         """
         try:
             self.log.info("Checking Kerberos ticket status using klist...")
-            result = subprocess.run(["klist"], capture_output=True, text=True)
-
-            if result.returncode != 0:
-                self.log.error("Unable to read Kerberos ticket using klist.")
-                self.log.debug(f"klist stderr: {result.stderr}")
-                return False
-
-            output = result.stdout or result.stderr or ""
-            self.log.debug(f"klist output:\n{output}")
-
-            expire_dt = self._parse_klist_expiry(output)
+            expire_dt = self._read_ticket_expiry()
             if expire_dt is None:
-                self.log.error("Could not parse Kerberos ticket expiration time from klist output.")
+                self.ticket_expiry = None
                 return False
+            self.ticket_expiry = expire_dt
 
             now = datetime.now()
             remaining = expire_dt - now
@@ -356,6 +1129,7 @@ class HdfsDAO:
             renew = subprocess.run(["kinit", "-R"], capture_output=True, text=True)
             if renew.returncode == 0:
                 self.log.info("Kerberos ticket successfully renewed with kinit -R.")
+                self.ticket_expiry = self._read_ticket_expiry()
                 return True
 
             self.log.warning("kinit -R failed. Attempting full kinit using keytab configured...")
@@ -370,6 +1144,7 @@ class HdfsDAO:
                 )  # missed '-V' last option by hand
                 if full.returncode == 0:
                     self.log.info("Kerberos ticket successfully renewed via keytab.")
+                    self.ticket_expiry = self._read_ticket_expiry()
                     return True
                 else:
                     self.log.error("Full kinit via keytab failed.")
@@ -397,8 +1172,18 @@ class HdfsDAO:
         #  - "Expires: 10/04/2025 13:45:00"
         #  - "End Time: 10/04/2025 13:45:00"
         #  - or lines with date/time like "10/04/2025 13:45:00"
+        #  In the MIT tabular output ("Valid starting  Expires  Service principal")
+        #  the first date of a ticket line is the start time: take the second one,
+        #  preferring the krbtgt line.
         pattern = re.compile(r"(\d{1,2}/\d{1,2}/\d{2,4}\s+\d{1,2}:\d{2}(?::\d{2})?)")
-        m = pattern.search(txt)
+        m = None
+        for line in sorted(txt.split("\n"), key=lambda l: "krbtgt/" not in l):
+            dates = list(pattern.finditer(line))
+            if len(dates) >= 2:
+                m = dates[1]
+                break
+        if m is None:
+            m = pattern.search(txt)
         if not m:
             # As fallback, search for ISO-like date strings
             iso_pattern = re.compile(r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})")
@@ -423,3 +1208,31 @@ class HdfsDAO:
         # As a last resort return None
         self.log.debug(f"Could not parse date string '{expire_str}' with common formats.")
         return None
+
+
+# shared DAO, one per HDFS + KERBEROS configuration and process: the DAO
+# settings (checksum, directory cache, thresholds) belong to the configuration
+_shared_daos: Dict[str, HdfsDAO] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_dao(config, log, connect: bool = True) -> HdfsDAO:
+    """
+    Return the process-wide HdfsDAO for this configuration, connecting it on
+    first use and only calling ensure_connected() afterwards. Actions with
+    different HDFS/KERBEROS blocks get different DAOs.
+
+    With connect=False the DAO is returned as is: every operation connects
+    on demand through ensure_connected().
+
+    Raises RuntimeError if the connection cannot be established.
+    """
+    key = json.dumps([config['HDFS'], config['KERBEROS']], sort_keys=True, default=str)
+    with _shared_lock:
+        dao = _shared_daos.get(key)
+        if dao is None:
+            dao = HdfsDAO(config, log)
+            _shared_daos[key] = dao
+    if connect and not dao.ensure_connected():
+        raise RuntimeError("HDFS connection error")
+    return dao
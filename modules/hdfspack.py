@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+hdfspack
+--------
+Small-file packing for the HDFS archive.
+
+mSEED day files are a few MB or less: one HDFS object per day file loads the
+NameNode and slows down Spark listing. In packing mode day files are
+appended to a local spool container per network/year; when the container
+reaches the size target (or gets too old) it is sealed and uploaded as one
+object, next to its offset manifest:
+
+    <DEST_PATH>/<NET>/<YEAR>/<NET>.<YEAR>.<YYYYmmddTHHMMSS>.pack
+    <DEST_PATH>/<NET>/<YEAR>/<NET>.<YEAR>.<YYYYmmddTHHMMSS>.pack.idx.json
+
+The container is the plain concatenation of the member files (no header,
+no compression); the manifest lists every member with its byte offset,
+length and md5:
+
+    {"container": "IV.2024.20240301T120000.pack",
+     "members": [{"name": "IV.ACER..HHZ.D.2024.061", "offset": 0,
+                  "length": 1048576, "md5": "..."}, ...]}
+
+A member added twice (i.e. a new version of the day file) keeps every copy;
+readers take the last one. Single members are read back with a WebHDFS OPEN
+offset/length, without downloading the container.
+
+Configuration (yaml), inside the HDFS block of copy2hdfs:
+
+    "HDFS":
+        ....
+        "PACK":
+            "ENABLED": true
+            "SPOOL_DIR": "/var/lib/archive/pack"   # local, durable across restarts
+            "TARGET_SIZE": 268435456                # seal containers above this size (bytes)
+            "MAX_AGE_HOURS": 24                     # seal containers older than this
+            "SWEEP_INTERVAL": 600                   # seconds between age checks of idle containers
+
+add() only seals the container it appends to: a background sealer
+(start_sealer) sweeps the spool every SWEEP_INTERVAL, so the last container
+of a network/year is sealed after MAX_AGE_HOURS even when no more files come.
+Packing is synchronous: it cannot be combined with the upload QUEUE.
+
+Usage:
+    spool = get_spool(config, log)
+    start_sealer(config, log, dao)
+    spool.add("/data/IV/2024/ACER/HHZ.D/IV.ACER..HHZ.D.2024.061", dao)
+
+    data = read_member(dao, "/user/x/IV/2024/IV.2024.20240301T120000.pack",
+                       "IV.ACER..HHZ.D.2024.061", "/tmp/IV.ACER..HHZ.D.2024.061")
+
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+"""
+
+from typing import Optional, Dict, Any, Tuple
+import os
+import glob
+import json
+import time
+import fcntl
+import hashlib
+import threading
+from datetime import datetime
+
+PACK_SUFFIX = ".pack"
+INDEX_SUFFIX = ".idx.json"
+PART_SUFFIX = ".part"
+
+
+class PackSpool:
+    """
+    Local spool of open containers, one per network/year.
+
+    Each open container is `<SPOOL_DIR>/<NET>.<YEAR>.pack.part` plus its
+    manifest `<NET>.<YEAR>.pack.part.idx.json`, rewritten after every member
+    so a restarted worker continues where it stopped. An exclusive flock on
+    the container serializes workers sharing the spool.
+    """
+
+    def __init__(self, config, log) -> None:
+        self.log = log
+        self.dest_path = config['HDFS']['DEST_PATH']
+        pack = config['HDFS'].get('PACK', {})
+        self.spool_dir = pack.get('SPOOL_DIR', '/var/lib/archive/pack')
+        self.target_size = pack.get('TARGET_SIZE', 256 * 1024 * 1024)
+        self.max_age = pack.get('MAX_AGE_HOURS', 24) * 3600
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def add(self, source_path: str, dao) -> bool:
+        """
+        Append a day file to the container of its network/year; seal and
+        upload the containers that reached the size target or the max age.
+
+        Parameters
+        ----------
+        source_path : str
+            Local day file, SDS named (NET.STA.LOC.CHA.TYPE.YEAR.DOY[#version]).
+        dao : HdfsDAO
+            DAO used to upload sealed containers, connected only when one is
+            ready: packing itself never needs HDFS.
+
+        Returns
+        -------
+        bool
+            True when the file is in the spool (upload of a sealed container
+            may still fail and is retried at the next add), False otherwise.
+        """
+        try:
+            group = self._group_of(source_path)
+        except ValueError as exc:
+            self.log.error(f"Cannot pack {source_path}: {exc}")
+            return False
+
+        part = os.path.join(self.spool_dir, group + PACK_SUFFIX + PART_SUFFIX)
+        with self._lock:
+            try:
+                with self._open_locked(part) as container:
+                    manifest = self._load_manifest(part)
+                    offset = container.seek(0, os.SEEK_END)
+                    length, md5 = self._append(source_path, container)
+                    manifest['members'].append({
+                        'name': os.path.basename(source_path),
+                        'offset': offset,
+                        'length': length,
+                        'md5': md5
+                    })
+                    self._save_manifest(part, manifest)
+                self.log.info(f"Packed {source_path} into {part} at offset {offset} ({length} bytes)")
+            except Exception as exc:
+                self.log.error(f"Pack error for {source_path}: {exc}")
+                return False
+
+            self._seal_ready(dao)
+        return True
+
+    def flush(self, dao) -> int:
+        """
+        Seal and upload every open container regardless of size and age.
+
+        Returns the number of containers uploaded.
+        """
+        with self._lock:
+            return self._seal_ready(dao, force=True)
+
+    def sweep(self, dao) -> int:
+        """
+        Seal and upload the open containers over TARGET_SIZE or MAX_AGE_HOURS.
+
+        Returns the number of containers uploaded.
+        """
+        with self._lock:
+            return self._seal_ready(dao)
+
+    # ---------------------------
+    # Private helpers
+    # ---------------------------
+    @staticmethod
+    def _group_of(source_path: str) -> str:
+        """
+        `<NET>.<YEAR>` of an SDS file name.
+        """
+        fields = os.path.basename(source_path).split('#')[0].split('.')
+        if len(fields) != 7 or not fields[5].isdigit():
+            raise ValueError("not an SDS file name")
+        return f"{fields[0]}.{fields[5]}"
+
+    @staticmethod
+    def _open_locked(part: str):
+        """
+        Open the container for append under an exclusive lock, retrying if
+        another worker sealed (and removed) it while we were waiting.
+        """
+        while True:
+            container = open(part, 'ab')
+            fcntl.flock(container, fcntl.LOCK_EX)
+            try:
+                if os.stat(part).st_ino == os.fstat(container.fileno()).st_ino:
+                    return container
+            except FileNotFoundError:
+                pass
+            container.close()
+
+    @staticmethod
+    def _append(source_path: str, container) -> Tuple[int, str]:
+        md5 = hashlib.md5()
+        length = 0
+        with open(source_path, 'rb') as src:
+            for block in iter(lambda: src.read(1024 * 1024), b''):
+                container.write(block)
+                md5.update(block)
+                length += len(block)
+        container.flush()
+        os.fsync(container.fileno())
+        return length, md5.hexdigest()
+
+    @staticmethod
+    def _load_manifest(part: str) -> Dict[str, Any]:
+        try:
+            with open(part + INDEX_SUFFIX) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'container': None, 'created': time.time(), 'members': []}
+
+    @staticmethod
+    def _save_manifest(part: str, manifest: Dict[str, Any]) -> None:
+        tmp = part + INDEX_SUFFIX + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, part + INDEX_SUFFIX)
+
+    def _seal_ready(self, dao, force: bool = False) -> int:
+        """
+        Upload the open containers over TARGET_SIZE or MAX_AGE_HOURS (all of
+        them if force) and drop them from the spool once uploaded.
+        """
+        sealed = 0
+        connected = None
+        for part in glob.glob(os.path.join(self.spool_dir, '*' + PACK_SUFFIX + PART_SUFFIX)):
+            try:
+                container = open(part, 'rb')
+            except FileNotFoundError:
+                continue  # sealed by another worker
+            with container:
+                fcntl.flock(container, fcntl.LOCK_EX)
+                if not os.path.exists(part):
+                    continue
+                manifest = self._load_manifest(part)
+                if not manifest['members']:
+                    continue
+                size = os.fstat(container.fileno()).st_size
+                age = time.time() - manifest.get('created', time.time())
+                if not (force or size >= self.target_size or age >= self.max_age):
+                    continue
+                if connected is None:
+                    connected = dao.ensure_connected()
+                    if not connected:
+                        self.log.warning("HDFS not reachable, containers sealed at the next sweep")
+                if not connected:
+                    break
+                if self._upload(part, manifest, dao):
+                    os.remove(part + INDEX_SUFFIX)
+                    os.remove(part)
+                    sealed += 1
+        return sealed
+
+    def _upload(self, part: str, manifest: Dict[str, Any], dao) -> bool:
+        group = os.path.basename(part)[:-len(PACK_SUFFIX + PART_SUFFIX)]
+        net, year = group.split('.')
+        # the name is fixed at the first upload attempt so retries overwrite it
+        if not manifest.get('container'):
+            manifest['container'] = f"{group}.{datetime.now().strftime('%Y%m%dT%H%M%S')}{PACK_SUFFIX}"
+            self._save_manifest(part, manifest)
+        target = f"{self.dest_path.rstrip('/')}/{net}/{year}/{manifest['container']}"
+
+        self.log.info(f"Sealing {part}: {len(manifest['members'])} member(s) -> {target}")
+        # container first: a manifest on HDFS always points to complete data
+        if not dao.copy_local2hdfs_overwrite(part, target):
+            return False
+        if not dao.copy_local2hdfs_overwrite(part + INDEX_SUFFIX, target + INDEX_SUFFIX):
+            return False
+        return True
+
+
+class Sealer(threading.Thread):
+    """
+    Sweep loop: seal the containers that got too old while no file was
+    added to them (add() only looks at the spool when a file comes).
+    """
+
+    def __init__(self, spool: PackSpool, dao, log, interval: int = 600) -> None:
+        threading.Thread.__init__(self, name="hdfs-pack-sealer", daemon=True)
+        self.spool = spool
+        self.dao = dao
+        self.log = log
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                sealed = self.spool.sweep(self.dao)
+                if sealed:
+                    self.log.info(f"Pack sealer uploaded {sealed} container(s)")
+            except Exception as exc:
+                self.log.error(f"Pack sealer error: {exc}")
+
+
+#
+# reader
+#
+def read_manifest(dao, container_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the offset manifest of an HDFS container (None on failure).
+    """
+    raw = dao.read_range(container_path + INDEX_SUFFIX)
+    if raw is None:
+        return None
+    return json.loads(raw)
+
+
+def find_member(manifest: Dict[str, Any], member: str) -> Optional[Dict[str, Any]]:
+    """
+    Manifest entry of a member; the last copy wins when it was packed more than once.
+    """
+    for entry in reversed(manifest['members']):
+        if entry['name'] == member:
+            return entry
+    return None
+
+
+def read_member(dao, container_path: str, member: str, local_path: Optional[str] = None,
+                manifest: Optional[Dict[str, Any]] = None, log=None) -> Optional[bytes]:
+    """
+    Extract one member of an HDFS container by offset.
+
+    Parameters
+    ----------
+    dao : HdfsDAO
+        Connected DAO.
+    container_path : str
+        HDFS path of the .pack container.
+    member : str
+        Day file name as stored in the manifest.
+    local_path : str, optional
+        Write the member here as well.
+    manifest : dict, optional
+        Already loaded manifest (saves one round trip when reading many members).
+
+    Returns
+    -------
+    bytes
+        Member content, or None if missing, unreadable or failing the md5 check.
+    """
+    log = log or dao.log
+    manifest = manifest or read_manifest(dao, container_path)
+    if manifest is None:
+        log.error(f"No manifest for container {container_path}")
+        return None
+
+    entry = find_member(manifest, member)
+    if entry is None:
+        log.error(f"{member} is not packed in {container_path}")
+        return None
+
+    data = dao.read_range(container_path, offset=entry['offset'], length=entry['length'])
+    if data is None:
+        return None
+    if len(data) != entry['length'] or hashlib.md5(data).hexdigest() != entry['md5']:
+        log.error(f"Checksum mismatch reading {member} from {container_path}")
+        return None
+
+    if local_path:
+        with open(local_path, 'wb') as f:
+            f.write(data)
+    return data
+
+
+# one spool and one sealer per spool directory and process
+_spools: Dict[str, PackSpool] = {}
+_sealers: Dict[str, Sealer] = {}
+_spools_lock = threading.Lock()
+
+
+def get_spool(config, log) -> PackSpool:
+    """
+    Return the process-wide PackSpool of this configuration.
+    """
+    spool_dir = config['HDFS'].get('PACK', {}).get('SPOOL_DIR', '/var/lib/archive/pack')
+    with _spools_lock:
+        if spool_dir not in _spools:
+            _spools[spool_dir] = PackSpool(config, log)
+        return _spools[spool_dir]
+
+
+def start_sealer(config, log, dao) -> Sealer:
+    """
+    Start (once per process) the background sweep of the PACK spool.
+    """
+    spool = get_spool(config, log)
+    with _spools_lock:
+        if spool.spool_dir not in _sealers:
+            sealer = Sealer(spool, dao, log, config['HDFS'].get('PACK', {}).get('SWEEP_INTERVAL', 600))
+            sealer.start()
+            _sealers[spool.spool_dir] = sealer
+        return _sealers[spool.spool_dir]
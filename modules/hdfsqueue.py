@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+"""
+hdfsqueue
+---------
+Durable local upload queue decoupling copy2hdfs from the HDFS cluster.
+
+copy2hdfs records (source, destination, md5) in a SQLite queue and returns
+at once; an Uploader loop (thread inside the worker, or the standalone
+utils/hdfs_uploader.py) drains it in batches with concurrent transfers
+(HdfsDAO.copy_local2hdfs_many), retries failures with exponential backoff
+and keeps every completed upload as an audit record.
+
+With SPOOL_DIR set the file is hard-linked (copied across filesystems)
+into the spool at enqueue time, so actions running after copy2hdfs may
+move or delete the original; the spooled copy is removed once uploaded.
+
+Row states: pending -> running -> done | pending (retry) | failed
+A running row whose lease expired (worker died mid-upload) is pending again.
+
+Configuration (yaml), inside the HDFS block of copy2hdfs:
+
+    "HDFS":
+        ....
+        "QUEUE":
+            "ENABLED": true
+            "PATH": "/var/lib/archive/queue/hdfs-upload.sqlite"
+            "SPOOL_DIR": "/var/lib/archive/queue/hdfs-spool"   # optional
+            "RUN_UPLOADER": true      # drain from the worker; false if utils/hdfs_uploader.py runs
+            "BATCH": 50               # files per copy_local2hdfs_many call
+            "INTERVAL": 10            # seconds between drain runs
+            "MAX_ATTEMPTS": 8         # then the row is failed (HDFS outages do not count)
+            "BACKOFF_BASE": 30        # seconds, doubled at every attempt
+            "BACKOFF_MAX": 3600
+            "LEASE": 1800             # seconds a running row stays claimed
+
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+"""
+
+from typing import Optional, Dict, Any, List
+import os
+import time
+import errno
+import shutil
+import hashlib
+import sqlite3
+import threading
+
+
+def file_md5(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class UploadQueue:
+    """
+    SQLite queue of pending HDFS uploads, shared by the workers of a host.
+    """
+
+    def __init__(self, path: str, spool_dir: Optional[str] = None) -> None:
+        self.path = path
+        self.spool_dir = spool_dir
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " source TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " md5 TEXT NOT NULL,"
+                " spooled INTEGER NOT NULL DEFAULT 0,"
+                " state TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_try REAL NOT NULL DEFAULT 0,"
+                " claimed REAL,"
+                " enqueued REAL NOT NULL,"
+                " finished REAL,"
+                " bytes INTEGER,"
+                " seconds REAL,"
+                " error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS uploads_state ON uploads (state, next_try)")
+
+    def _conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    # ---------------------------
+    # Producer side
+    # ---------------------------
+    def put(self, source_path: str, target_path: str, checksum: Optional[str] = None) -> int:
+        """
+        Enqueue an upload; returns the queue id. The file is spooled first
+        when SPOOL_DIR is configured.
+        """
+        checksum = checksum or file_md5(source_path)
+        spooled = 0
+        if self.spool_dir:
+            source_path = self._spool(source_path, checksum)
+            spooled = 1
+        with self._lock, self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO uploads (source, target, md5, spooled, enqueued) VALUES (?, ?, ?, ?, ?)",
+                (source_path, target_path, checksum, spooled, time.time()))
+            return cur.lastrowid
+
+    def _spool(self, source_path: str, checksum: str) -> str:
+        spooled = os.path.join(self.spool_dir, f"{checksum}.{os.path.basename(source_path)}")
+        if os.path.exists(spooled):
+            return spooled
+        try:
+            os.link(source_path, spooled)
+        except OSError as exc:
+            if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            tmp = spooled + '.tmp'
+            shutil.copy2(source_path, tmp)
+            os.replace(tmp, spooled)
+        return spooled
+
+    # ---------------------------
+    # Consumer side
+    # ---------------------------
+    def claim(self, limit: int, lease: float) -> List[Dict[str, Any]]:
+        """
+        Atomically take up to `limit` due rows (pending, or running with an
+        expired lease) and mark them running.
+        """
+        now = time.time()
+        with self._lock, self._conn() as conn:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, source, target, md5, spooled, attempts FROM uploads"
+                    " WHERE (state = 'pending' AND next_try <= ?) OR (state = 'running' AND claimed < ?)"
+                    " ORDER BY id LIMIT ?", (now, now - lease, limit)).fetchall()
+                conn.executemany("UPDATE uploads SET state = 'running', claimed = ? WHERE id = ?",
+                                 [(now, row[0]) for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        keys = ('id', 'source', 'target', 'md5', 'spooled', 'attempts')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def done(self, row_id: int, size: int, seconds: float) -> None:
+        with self._lock, self._conn() as conn:
+            conn.execute("UPDATE uploads SET state = 'done', finished = ?, bytes = ?, seconds = ?, error = NULL"
+                         " WHERE id = ?", (time.time(), size, seconds, row_id))
+
+    def retry(self, row_id: int, error: str, delay: Optional[float]) -> None:
+        """
+        Schedule a new attempt in `delay` seconds; with delay None the row is failed.
+        """
+        with self._lock, self._conn() as conn:
+            if delay is None:
+                conn.execute("UPDATE uploads SET state = 'failed', attempts = attempts + 1, finished = ?,"
+                             " error = ? WHERE id = ?", (time.time(), error, row_id))
+            else:
+                conn.execute("UPDATE uploads SET state = 'pending', attempts = attempts + 1, next_try = ?,"
+                             " error = ? WHERE id = ?", (time.time() + delay, error, row_id))
+
+    def postpone(self, row_ids: List[int], error: str, delay: float) -> None:
+        """
+        Put claimed rows back to pending for `delay` seconds without counting
+        an attempt (the upload could not even start, i.e. HDFS unreachable).
+        """
+        with self._lock, self._conn() as conn:
+            conn.executemany("UPDATE uploads SET state = 'pending', next_try = ?, error = ? WHERE id = ?",
+                             [(time.time() + delay, error, row_id) for row_id in row_ids])
+
+    def in_use(self, source_path: str) -> bool:
+        """
+        True if a pending or running row still reads source_path.
+        """
+        with self._lock, self._conn() as conn:
+            return conn.execute("SELECT 1 FROM uploads WHERE source = ? AND state IN ('pending', 'running')"
+                                " LIMIT 1", (source_path,)).fetchone() is not None
+
+    def requeue_failed(self) -> int:
+        """
+        Put every failed row back in the queue (attempts reset); returns the count.
+        """
+        with self._lock, self._conn() as conn:
+            return conn.execute("UPDATE uploads SET state = 'pending', attempts = 0, next_try = 0"
+                                " WHERE state = 'failed'").rowcount
+
+    # ---------------------------
+    # Audit
+    # ---------------------------
+    def stats(self) -> Dict[str, int]:
+        with self._lock, self._conn() as conn:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM uploads GROUP BY state").fetchall())
+
+    def audit(self, state: Optional[str] = None, since: Optional[float] = None,
+              limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Latest queue records, optionally filtered by state and enqueue time.
+        """
+        query = ("SELECT id, source, target, md5, state, attempts, enqueued, finished, bytes, seconds, error"
+                 " FROM uploads WHERE 1 = 1")
+        params = []
+        if state:
+            query += " AND state = ?"
+            params.append(state)
+        if since:
+            query += " AND enqueued >= ?"
+            params.append(since)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        keys = ('id', 'source', 'target', 'md5', 'state', 'attempts', 'enqueued', 'finished',
+                'bytes', 'seconds', 'error')
+        with self._lock, self._conn() as conn:
+            return [dict(zip(keys, row)) for row in conn.execute(query, params).fetchall()]
+
+    def __len__(self) -> int:
+        with self._lock, self._conn() as conn:
+            return conn.execute("SELECT COUNT(*) FROM uploads WHERE state IN ('pending', 'running')").fetchone()[0]
+
+
+class Uploader(threading.Thread):
+    """
+    Drain loop: claim a batch, check the source md5, upload the batch with
+    concurrent transfers, record results, back off failed rows.
+    """
+
+    def __init__(self, queue: UploadQueue, dao, log, queue_config: Optional[Dict[str, Any]] = None) -> None:
+        threading.Thread.__init__(self, name="hdfs-uploader", daemon=True)
+        queue_config = queue_config or {}
+        self.queue = queue
+        self.dao = dao
+        self.log = log
+        self.batch = queue_config.get('BATCH', 50)
+        self.interval = queue_config.get('INTERVAL', 10)
+        self.max_attempts = queue_config.get('MAX_ATTEMPTS', 8)
+        self.backoff_base = queue_config.get('BACKOFF_BASE', 30)
+        self.backoff_max = queue_config.get('BACKOFF_MAX', 3600)
+        self.lease = queue_config.get('LEASE', 1800)
+        # consecutive drains that found HDFS unreachable
+        self._outages = 0
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as exc:
+                self.log.error(f"HDFS uploader error: {exc}")
+
+    def drain(self) -> int:
+        """
+        Upload every due row; returns the number of completed uploads.
+        """
+        uploaded = 0
+        while not self._stop_event.is_set():
+            rows = self.queue.claim(self.batch, self.lease)
+            if not rows:
+                break
+
+            # an outage is not an attempt: the rows wait (with backoff) however long it lasts,
+            # and the sources are not hashed again at every drain
+            if not self.dao.ensure_connected():
+                delay = min(self.backoff_base * 2 ** self._outages, self.backoff_max)
+                self._outages += 1
+                self.queue.postpone([row['id'] for row in rows], "HDFS not reachable", delay)
+                self.log.warning(f"HDFS not reachable, {len(rows)} upload(s) postponed by {delay}s")
+                break
+            self._outages = 0
+
+            ready = []
+            for row in rows:
+                error = self._check_source(row)
+                if error:
+                    self._failed(row, error, permanent=True)
+                else:
+                    ready.append(row)
+            if not ready:
+                continue
+
+            summary = self.dao.copy_local2hdfs_many([(row['source'], row['target']) for row in ready])
+            for row, result in zip(ready, summary['files']):
+                if result['ok']:
+                    self.queue.done(row['id'], result['bytes'], result['seconds'])
+                    if row['spooled'] and not self.queue.in_use(row['source']):
+                        self._unspool(row['source'])
+                    uploaded += 1
+                else:
+                    self._failed(row, result['error'] or "upload failed")
+
+        if uploaded:
+            self.log.info(f"HDFS uploader completed {uploaded} upload(s), {len(self.queue)} still queued")
+        return uploaded
+
+    @staticmethod
+    def _check_source(row: Dict[str, Any]) -> Optional[str]:
+        try:
+            if file_md5(row['source']) != row['md5']:
+                return "source changed after enqueue (md5 mismatch)"
+        except OSError as exc:
+            return f"source unreadable: {exc}"
+        return None
+
+    def _failed(self, row: Dict[str, Any], error: str, permanent: bool = False) -> None:
+        attempts = row['attempts'] + 1
+        if permanent or attempts >= self.max_attempts:
+            self.log.error(f"HDFS upload failed for good after {attempts} attempt(s): "
+                           f"{row['source']} -> {row['target']}: {error}")
+            self.queue.retry(row['id'], error, None)
+            return
+        delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+        self.log.warning(f"HDFS upload attempt {attempts} failed, retry in {delay}s: "
+                         f"{row['source']} -> {row['target']}: {error}")
+        self.queue.retry(row['id'], error, delay)
+
+    def _unspool(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError as exc:
+            self.log.warning(f"Cannot remove spooled file {path}: {exc}")
+
+
+# one queue per queue path and one uploader per queue in this process
+_queues: Dict[str, UploadQueue] = {}
+_uploaders: Dict[str, Uploader] = {}
+_registry_lock = threading.Lock()
+
+
+def get_upload_queue(config) -> UploadQueue:
+    """
+    Return the process-wide UploadQueue configured in HDFS.QUEUE.
+    """
+    queue_config = config['HDFS'].get('QUEUE', {})
+    path = queue_config.get('PATH', '/var/lib/archive/queue/hdfs-upload.sqlite')
+    with _registry_lock:
+        if path not in _queues:
+            _queues[path] = UploadQueue(path, queue_config.get('SPOOL_DIR'))
+        return _queues[path]
+
+
+def start_uploader(config, log, dao) -> Uploader:
+    """
+    Start (once per process) the background uploader draining HDFS.QUEUE.
+    """
+    queue = get_upload_queue(config)
+    with _registry_lock:
+        if queue.path not in _uploaders:
+            uploader = Uploader(queue, dao, log, config['HDFS'].get('QUEUE', {}))
+            uploader.start()
+            _uploaders[queue.path] = uploader
+        return _uploaders[queue.path]
@@ -28,7 +28,33 @@
   
 """
 import os
+from bson import ObjectId
 from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from project.modules.mongoqueue import MongoUnavailable, createTimeSeries, getBreaker, getQueue, getIngestBuffer
+
+#
+# fields shared by all the hourly granules of one daily stream;
+# bucket/timeseries layouts store them once instead of 24 times
+#
+HOURLY_COMMON = ('streamId', 'fileId', 'created', 'collector', 'status', 'format', 'type',
+                 'net', 'sta', 'loc', 'cha', 'files')
+
+#
+# read-preference routing per query class (MONGO.READ_PREFERENCE), primary when not configured:
+#   EXISTENCE:  "is this file already there" checks before processing
+#   DEPENDENCY: daily streams depending on a file (neighbour lookups)
+#   REFERENCE:  slow-changing reference data (net_info)
+#   LOOKUP:     read-your-writes paths, i.e. docs written by a previous action of the same policy
+#
+QUERY_CLASSES = ('EXISTENCE', 'DEPENDENCY', 'REFERENCE', 'LOOKUP')
+READ_MODES = {
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest
+}
 
 #
 # Data Access Object  for MongoDB
@@ -46,6 +72,27 @@ class MongoDAO():
         self._connected = False
         self.client = None
         self.db = None
+        # clients of the digital object view DBs on other hosts (see _viewDatabase)
+        self._view_clients = {}
+
+        # hourly granules layout: documents (one per hour) | bucket (one per day) | timeseries
+        self.hourly_storage = self.config['MONGO'].get('HOURLY_STORAGE', 'documents')
+        self._timeseries_ready = False
+
+        # read preference of each query class
+        self.read_preferences = self._readPreferences()
+
+        # optional circuit breaker + write-behind queue (see mongoqueue)
+        self.write_behind = self.config['MONGO'].get('WRITE_BEHIND', {}).get('ENABLED', False)
+        if self.write_behind:
+            self.breaker = getBreaker(self.config['MONGO'])
+            self.queue = getQueue(self.config['MONGO'], self.log)
+
+        # optional fast-ingest profile: buffered inserts under relaxed write concern, verified at the end
+        self.fast_ingest = self.config['MONGO'].get('INGEST_PROFILE', {}).get('MODE', 'safe') == 'fast'
+        if self.fast_ingest:
+            fallback = self.queue.put if self.write_behind else None
+            self.ingest = getIngestBuffer(self.config['MONGO'], self.log, fallback)
 
     #
     # connect to MongoDB
@@ -55,7 +102,12 @@ class MongoDAO():
         if self._connected:
             return
 
-        self.client = MongoClient(self.host)
+        if self.write_behind:
+            # fail fast on server selection, the breaker takes care of the rest
+            timeout = self.config['MONGO']['WRITE_BEHIND'].get('SERVER_TIMEOUT_MS', 5000)
+            self.client = MongoClient(self.host, serverSelectionTimeoutMS=timeout)
+        else:
+            self.client = MongoClient(self.host)
         self.db = self.client[self.config['MONGO']['DB_NAME']]
 
         if self.config['MONGO']['AUTHENTICATE']:
@@ -63,11 +115,25 @@ class MongoDAO():
 
         self._connected = True
 
+        # the time-series collection must exist before the first insert (an insert would create a plain one)
+        if self.hourly_storage == 'timeseries':
+            try:
+                self.ensureTimeSeries()
+            except (ConnectionFailure, MongoUnavailable) as ex:
+                self.log.warning("Could not check hourly_ts collection at connect: %s" % ex)
+
     #
     # Disconnect to MongoDB
     #
     def disconnect(self):
         
+        if self.fast_ingest:
+            self.ingest.flush()
+
+        for client in self._view_clients.values():
+            client.close()
+        self._view_clients = {}
+
         if self._connected:
             self.client.close()
             self._connected = False
@@ -75,7 +141,108 @@ class MongoDAO():
         else:
             return False
 
-        
+    #
+    # guarded write: goes to the queue while the breaker is open (or the queue is not drained yet,
+    # to keep ops in order), falls back to the queue on connection failure;
+    # key: fileId of an op filtered by _id (see WriteBehindQueue.touches)
+    #
+    def _write(self, coll, op, *args, key=None):
+
+        if self.fast_ingest:
+            if op in ('insert_one', 'insert_many'):
+                docs = [args[0]] if op == 'insert_one' else args[0]
+                for doc in docs:
+                    doc.setdefault('_id', ObjectId())
+                self.ingest.add(coll, docs)
+                return None
+            # buffered inserts go before any update/delete
+            self.ingest.flush()
+            if op.startswith('delete'):
+                self.ingest.forget(coll, args[0])
+
+        if self.write_behind and (not self.breaker.allow() or self.queue.pending):
+            self.queue.put(self.config['MONGO']['DB_NAME'], coll, op, *args, key=key)
+            self.log.info("Mongo unavailable, %s on %s queued" % (op, coll))
+            return None
+
+        try:
+            result = getattr(self.db[coll], op)(*args)
+        except ConnectionFailure as ex:
+            if not self.write_behind:
+                raise
+            self.breaker.failure()
+            self.queue.put(self.config['MONGO']['DB_NAME'], coll, op, *args, key=key)
+            self.log.warning("Mongo write failed, %s on %s queued: %s" % (op, coll, ex))
+            return None
+
+        if self.write_behind:
+            self.breaker.success()
+        return result
+
+    #
+    # build the read preference of each query class from config
+    #
+    def _readPreferences(self):
+
+        routing = self.config['MONGO'].get('READ_PREFERENCE', {})
+        # max staleness in seconds (>= 90 per MongoDB spec), -1 means no limit
+        staleness = routing.get('MAX_STALENESS', -1)
+
+        preferences = {}
+        for query_class in QUERY_CLASSES:
+            mode = routing.get(query_class, 'primary')
+            if mode == 'primary':
+                preferences[query_class] = Primary()
+            elif mode in READ_MODES:
+                preferences[query_class] = READ_MODES[mode](max_staleness=staleness)
+            else:
+                raise ValueError("Unknown read preference %s for %s" % (mode, query_class))
+
+        return preferences
+
+    #
+    # collection handle routed according to the query class
+    #
+    def _coll(self, name, query_class='LOOKUP'):
+
+        return self.db.get_collection(name, read_preference=self.read_preferences[query_class])
+
+    #
+    # end of a fast-ingest run: flush and verify what reached the DB
+    # (also done on a timer by the ingest flusher, and at exit)
+    #
+    def finishIngest(self):
+
+        if not self.fast_ingest:
+            return {}
+        return self.ingest.verify()
+
+    #
+    # guarded read: raises MongoUnavailable at once while the breaker is open, and also while
+    # queued writes of the file read (key: fileId) are not replayed yet (the DB would answer
+    # with a state older than ours); the other reads go through once the breaker is closed
+    #
+    def _read(self, query, key=None):
+
+        if self.fast_ingest and key is not None and self.ingest.holds(key):
+            # the buffered inserts of the file must be visible to its existence and lookup reads
+            self.ingest.flush(acknowledged=True)
+
+        if not self.write_behind:
+            return query()
+
+        if not self.breaker.allow():
+            raise MongoUnavailable("MongoDB circuit breaker is open")
+        if key is not None and self.queue.touches(key):
+            raise MongoUnavailable("MongoDB writes of %s still in the write-behind queue" % key)
+        try:
+            result = query()
+        except ConnectionFailure as ex:
+            self.breaker.failure()
+            raise MongoUnavailable(str(ex))
+
+        self.breaker.success()
+        return result
 
 
     # -------- Provenance -----------
@@ -90,7 +257,7 @@ class MongoDAO():
     #
     def getProvDigitalObject(self, handle):
 
-        return self.db.do_prov.find_one({'dc_identifier': handle}) 
+        return self._read(lambda: self._coll('do_prov').find_one({'dc_identifier': handle}))
 
     #
     # get do_vers document by pid oredered by version
@@ -98,29 +265,29 @@ class MongoDAO():
     def getVersionDigitalObject(self, handle):
 
         # return self.db.do_vers.find({'dc_identifier': handle}).sort({'version':1})
-        return self.db.do_vers.find({'dc_identifier': handle}).sort([('version',1)]) 
+        return self._read(lambda: list(self._coll('do_vers').find({'dc_identifier': handle}).sort([('version',1)])))
 
     #
     # update Version file-name by _id
     #
     def updateVersionDigitalObject(self, my_id, file_version, location_version):
 
-        self.db.do_vers.update_one({'_id': my_id}, {"$set": {"schema_file.name": file_version}}, upsert=False)
-        self.db.do_vers.update_one({'_id': my_id}, {"$set": {"schema_file.position": location_version}}, upsert=False)
+        self._write('do_vers', 'update_one', {'_id': my_id}, {"$set": {"schema_file.name": file_version}})
+        self._write('do_vers', 'update_one', {'_id': my_id}, {"$set": {"schema_file.position": location_version}})
 
     #
     # update enable in do_prov collection
     #
     def updateEnableProvByPid(self, handle, enabled):
 
-        self.db.do_prov.update_one({'dc_identifier': handle}, {"$set": {"enabled": enabled}}, upsert=False)
+        self._write('do_prov', 'update_one', {'dc_identifier': handle}, {"$set": {"enabled": enabled}})
 
     #
     # update enable in do_vers collection
     #
     def updateEnableVersById(self, my_id, enabled):
 
-        self.db.do_vers.update_one({'_id': my_id}, {"$set": {"enabled": enabled}}, upsert=False)
+        self._write('do_vers', 'update_one', {'_id': my_id}, {"$set": {"enabled": enabled}})
 
 
     #
@@ -130,7 +297,7 @@ class MongoDAO():
     def storeProvDigitalObject(self, obj):
         # print("store Provenance data object")
         try:
-            self.db.do_prov.insert_one(obj)
+            self._write('do_prov', 'insert_one', obj)
         except Exception as ex:
             self.log.error("error on insert Provenance")
             self.log.error(ex)
@@ -145,7 +312,7 @@ class MongoDAO():
     def storeVersionDigitalObject(self, obj):
         # print("store Version data object")
         try:
-            self.db.do_vers.insert_one(obj)
+            self._write('do_vers', 'insert_one', obj)
         except Exception as ex:
             self.log.error("error on insert Version")
             self.log.error(ex)
@@ -162,23 +329,25 @@ class MongoDAO():
     #
     # get wf_do FileDataObject
     #
-    def getFileDataObject(self, file):
+    def getFileDataObject(self, file, query_class='LOOKUP'):
 
-        return self.db.wf_do.find_one({'fileId': os.path.basename(file)})
+        return self._read(lambda: self._coll('wf_do', query_class).find_one({'fileId': os.path.basename(file)}),
+                          key=os.path.basename(file))
 
     #
     # get wf_do PidDataObject
     #
     def getPidDataObject(self, pid):
 
-        return self.db.wf_do.find_one({'dc_identifier': pid})    
+        return self._read(lambda: self._coll('wf_do').find_one({'dc_identifier': pid}))
 
     #
     # get PID from FileDataObject
     #
     def getPIDfromFile(self, file):
 
-        doc = self.db.wf_do.find_one({'fileId': os.path.basename(file)})        
+        doc = self._read(lambda: self._coll('wf_do').find_one({'fileId': os.path.basename(file)}),
+                         key=os.path.basename(file))
         return doc['dc_identifier']
 
     #
@@ -186,7 +355,7 @@ class MongoDAO():
     #
     def _storeFileDataObject(self, obj):
 
-        return self.db.wf_do.insert_one(obj)    
+        return self._write('wf_do', 'insert_one', obj)
 
     #
     # _store FileDataObject
@@ -195,7 +364,7 @@ class MongoDAO():
     def storeWFDataObject(self, obj):
         # print("store data object")
         try:
-            self.db.wf_do.insert_one(obj)
+            self._write('wf_do', 'insert_one', obj)
         except Exception as ex:
             self.log.error("error on insert")
             self.log.error(ex)
@@ -208,41 +377,42 @@ class MongoDAO():
     #
     def getDublinCoreByFilename(self, file):
 
-        return self.db.wf_do.find_one({'fileId': os.path.basename(file)})
+        return self._read(lambda: self._coll('wf_do').find_one({'fileId': os.path.basename(file)}),
+                          key=os.path.basename(file))
 
     #
     # update Date Enabled in DublinCore collection
     #
     def updateEnableDublinCoreById(self, id, enabled):
 
-        self.db.wf_do.update_one({'_id': id}, {"$set": {"enabled": enabled}}, upsert=False)
+        self._write('wf_do', 'update_one', {'_id': id}, {"$set": {"enabled": enabled}})
 
     #
     # update fileId in DublinCore collection
     #
     def updateFilenameDublinCoreById(self, id, filename):
 
-        self.db.wf_do.update_one({'_id': id}, {"$set": {"fileId": filename}}, upsert=False)    
+        self._write('wf_do', 'update_one', {'_id': id}, {"$set": {"fileId": filename}})
 
     #
     # update Date Availability in DublinCore collection
     #
     def updateDateDublinCoreById(self, id, date_time_obj):
 
-        self.db.wf_do.update_one({'_id': id}, {"$set": {"dcterms_available": date_time_obj}}, upsert=False)
+        self._write('wf_do', 'update_one', {'_id': id}, {"$set": {"dcterms_available": date_time_obj}})
     #
     # update PID-HANDLE in DublinCore collection
     #
     def updateHandleDublinCoreById(self, id, handle):
 
-        self.db.wf_do.update_one({'_id': id}, {"$set": {"dc_identifier": handle}}, upsert=False)
+        self._write('wf_do', 'update_one', {'_id': id}, {"$set": {"dc_identifier": handle}})
 
     #
     # removes documents from DublinCore collection
     #
     def removeDublinCoreById(self, id):
 
-        self.db.wf_do.delete_one({'_id': id})
+        self._write('wf_do', 'delete_one', {'_id': id})
 
     #
     # DB name: wf_hand
@@ -250,7 +420,14 @@ class MongoDAO():
 
     def getNetInfoByNet(self, net):
 
-        return self.db.net_info.find_one({'net': net})
+        return self._read(lambda: self._coll('net_info', 'REFERENCE').find_one({'net': net}))
+
+    #
+    # codes of every authoritative network
+    #
+    def getNetInfoNets(self):
+
+        return self._read(lambda: self._coll('net_info', 'REFERENCE').distinct('net'))
 
 
 
@@ -262,23 +439,130 @@ class MongoDAO():
 
     # 
     # stores daily and hourly granules to collections
+    # (_id is set client side so that hourly/segments can reference a queued daily stream)
     #
     def _storeGranule(self, stream, granule):
 
+        stream.setdefault('_id', ObjectId())
+
         if granule == 'daily':
-            
-            return self.db.daily_streams.insert_one(stream).inserted_id
+            self._write('daily_streams', 'insert_one', stream)
         elif granule == 'hourly':
-          return self.db.hourly_streams.insert_one(stream).inserted_id
+            self._write('hourly_streams', 'insert_one', stream)
+
+        return stream['_id']
     
+    #
+    # stores all the hourly granules of a daily stream according to HOURLY_STORAGE
+    #
+    def storeHourlyGranules(self, stream_id, granules):
+
+        if not granules:
+            return
+
+        if self.hourly_storage == 'bucket':
+            self._write('hourly_buckets', 'insert_one', self._toHourlyBucket(stream_id, granules))
+
+        elif self.hourly_storage == 'timeseries':
+            docs = [self._toTimeSeriesGranule(stream_id, g) for g in granules]
+            if not self._timeseries_ready:
+                try:
+                    self.ensureTimeSeries()
+                except (ConnectionFailure, MongoUnavailable) as ex:
+                    if not self.write_behind:
+                        raise
+                    # the drainer creates the collection before replaying into it
+                    self.queue.put(self.config['MONGO']['DB_NAME'], 'hourly_ts', 'insert_many', docs)
+                    self.log.info("Mongo unavailable, insert_many on hourly_ts queued: %s" % ex)
+                    return
+            self._write('hourly_ts', 'insert_many', docs)
+
+        else:
+            for granule in granules:
+                self._storeGranule(granule, 'hourly')
+
+    #
+    # returns the hourly granules of a daily stream as flat documents, whatever the layout
+    # they were written with (every layout is read: HOURLY_STORAGE may have changed meanwhile);
+    # one granule per hour if a stream is found in more than one layout (i.e. while migrating)
+    #
+    def getHourlyGranules(self, stream_id):
+
+        def query():
+            granules = {}
+
+            for granule in self._coll('hourly_streams').find({'streamId': stream_id}):
+                granules.setdefault(granule['ts'], granule)
+
+            for bucket in self._coll('hourly_buckets').find({'streamId': stream_id}):
+                common = {key: bucket[key] for key in HOURLY_COMMON if key in bucket}
+                for granule in bucket['granules']:
+                    doc = dict(common)
+                    doc.update(granule)
+                    granules.setdefault(doc['ts'], doc)
+
+            for granule in self._coll('hourly_ts').find({'meta.streamId': stream_id}):
+                doc = dict(granule.pop('meta'))
+                doc.update(granule)
+                granules.setdefault(doc['ts'], doc)
+
+            return [granules[ts] for ts in sorted(granules)]
+
+        return self._read(query)
+
+    #
+    # one bucket document per day: shared fields once, hourly values in the granules array
+    #
+    def _toHourlyBucket(self, stream_id, granules):
+
+        bucket = {key: granules[0][key] for key in HOURLY_COMMON if key in granules[0]}
+        bucket.update({
+            '_id': ObjectId(),
+            'streamId': stream_id,
+            'ts': min(g['ts'] for g in granules),
+            'te': max(g['te'] for g in granules),
+            'ngran': len(granules),
+            'granules': [{key: value for key, value in g.items() if key not in HOURLY_COMMON and key != '_id'}
+                         for g in granules]
+        })
+        return bucket
+
+    #
+    # time-series measurement: the fields shared by the day (stream identity included) go into the metaField
+    #
+    def _toTimeSeriesGranule(self, stream_id, granule):
+
+        doc = {key: value for key, value in granule.items() if key not in HOURLY_COMMON and key != '_id'}
+        doc['meta'] = {key: granule[key] for key in HOURLY_COMMON if key in granule}
+        doc['meta']['streamId'] = stream_id
+        return doc
+
+    #
+    # create the hourly time-series collection (MongoDB >= 5.0) if missing;
+    # done at connect and by utils/migrate_hourly, raises if the DB cannot be reached
+    #
+    def ensureTimeSeries(self):
+
+        if self._timeseries_ready:
+            return
+
+        if self.write_behind and not self.breaker.allow():
+            raise MongoUnavailable("MongoDB circuit breaker is open")
+        createTimeSeries(self.db)
+        self._timeseries_ready = True
+
     # 
     # removes documents all related to ObjectId
     #
-    def removeDocumentsById(self, id):
-       
-        self.db.daily_streams.delete_one({'_id': id})
-        self.db.hourly_streams.delete_many({'streamId': id})
-        self.db.c_segments.delete_many({'streamId': id})
+    def removeDocumentsById(self, id, file=None):
+
+        # file: fileId of the daily stream, the reads of that file wait for a queued removal
+        key = os.path.basename(file) if file else None
+        self._write('daily_streams', 'delete_one', {'_id': id}, key=key)
+        self._write('hourly_streams', 'delete_many', {'streamId': id}, key=key)
+        self._write('hourly_buckets', 'delete_many', {'streamId': id}, key=key)
+        self._write('hourly_ts', 'delete_many', {'meta.streamId': id}, key=key)
+        self._write('c_segments', 'delete_many', {'streamId': id}, key=key)
     
     # 
     # Saves a continuous segment to collection
@@ -286,7 +570,7 @@ class MongoDAO():
     def storeContinuousSegment(self, segment):
         # print(segment)
         try:
-            self.db.c_segments.insert_one(segment)
+            self._write('c_segments', 'insert_one', segment)
         except Exception as ex:
             print(ex)
 
@@ -295,18 +579,178 @@ class MongoDAO():
     #
     def getDailyFilesById(self, file):
         
-        return self.db.daily_streams.find({'files.name': os.path.basename(file)}, {'files': 1, 'fileId': 1, '_id': 1})
+        return self._read(lambda: list(self._coll('daily_streams', 'DEPENDENCY').find({'files.name': os.path.basename(file)}, {'files': 1, 'fileId': 1, '_id': 1})),
+                          key=os.path.basename(file))
+
+    #
+    # md5 of a file as recorded in the daily streams using it (None if unknown)
+    #
+    def getFileChecksum(self, file):
+
+        name = os.path.basename(file)
+        doc = self._read(lambda: self._coll('daily_streams', 'DEPENDENCY').find_one(
+            {'fileId': name, 'files.name': name}, {'files': 1}), key=name)
+        if doc is None:
+            return None
+        for used_file in doc['files']:
+            if used_file['name'] == name:
+                return used_file.get('chksm')
+        return None
 
     #
     # get a Document By Filename
     #
     def getDocumentByFilename(self, file):
 
-        return self.db.daily_streams.find({'fileId': os.path.basename(file)})
+        return self._read(lambda: list(self._coll('daily_streams').find({'fileId': os.path.basename(file)})),
+                          key=os.path.basename(file))
+
+    #
+    # get One Document By Filename (existence check unless a read-your-writes class is given)
+    #
+    def getDocumentByFilenameOne(self, file, query_class='EXISTENCE'):
+
+        return self._read(lambda: self._coll('daily_streams', query_class).find_one({'fileId': os.path.basename(file)}),
+                          key=os.path.basename(file))
 
     #
-    # get One Document By Filename
+    # removes the daily stream of a file and all related documents;
+    # while Mongo is unavailable the removal is queued and resolved by the drainer at replay time
     #
-    def getDocumentByFilenameOne(self, file):
+    def removeDocumentsByFilename(self, file):
+
+        if self.write_behind and (not self.breaker.allow() or self.queue.pending):
+            self._queueRemoval(file)
+            return
+
+        try:
+            documents = self.getDocumentByFilename(file)
+        except MongoUnavailable:
+            if not self.write_behind:
+                raise
+            self._queueRemoval(file)
+            return
+        for document in documents:
+            self.removeDocumentsById(document['_id'], file)
+
+    def _queueRemoval(self, file):
 
-        return self.db.daily_streams.find_one({'fileId': os.path.basename(file)})
+        self.queue.put(self.config['MONGO']['DB_NAME'], 'daily_streams', 'delete_streams',
+                       {'fileId': os.path.basename(file)})
+        self.log.info("Mongo unavailable, removal of %s queued" % os.path.basename(file))
+
+
+
+    # -------- Digital Object view -----------
+    #
+    # digital object of a file (DublinCore, PID, provenance/versions, WFCatalog daily stream and
+    # dependents) collected with one query per DB: $lookup cannot cross databases.
+    # Each DB is reached through its own connection block, by default this DAO's MONGO block:
+    #
+    #   DO_VIEW:
+    #     DC:   {DB_HOST, DB_NAME: wf_hand, USER, PASS, AUTHENTICATE}
+    #     PROV: {DB_HOST, DB_NAME: wf_prov, ...}
+    #     WFC:  {DB_HOST, DB_NAME: wfrepo, ...}
+    #
+    # (legacy DC_DB/PROV_DB/WFC_DB keys only override the DB name)
+
+    VIEW_DBS = {'DC': 'wf_hand', 'PROV': 'wf_prov', 'WFC': 'wfrepo'}
+
+    #
+    # database of one part of the view, one client per host/user shared by the DAO
+    #
+    def _viewDatabase(self, part):
+
+        view_config = self.config.get('DO_VIEW', {})
+        mongo = dict(self.config['MONGO'])
+        mongo['DB_NAME'] = view_config.get(part + '_DB', self.VIEW_DBS[part])
+        mongo.update(view_config.get(part, {}))
+
+        authenticate = mongo.get('AUTHENTICATE', False)
+        if mongo['DB_HOST'] == self.host and (not authenticate or mongo['USER'] == self.config['MONGO'].get('USER')):
+            client = self.client
+        else:
+            key = (mongo['DB_HOST'], mongo['USER'] if authenticate else None)
+            if key not in self._view_clients:
+                if authenticate:
+                    self._view_clients[key] = MongoClient(mongo['DB_HOST'], username=mongo['USER'],
+                                                          password=mongo['PASS'])
+                else:
+                    self._view_clients[key] = MongoClient(mongo['DB_HOST'])
+            client = self._view_clients[key]
+        return client[mongo['DB_NAME']]
+
+    #
+    # fetch the digital object view of a file
+    #
+    def getDigitalObject(self, file):
+
+        name = os.path.basename(file)
+
+        def query():
+            view = {'fileId': name, 'wf_do': None, 'handle': None, 'do_prov': None, 'do_vers': [],
+                    'daily_stream': None, 'dependents': []}
+
+            # DublinCore (and PID handle)
+            view['wf_do'] = self._viewDatabase('DC').get_collection(
+                'wf_do', read_preference=self.read_preferences['LOOKUP']).find_one({'fileId': name})
+            if view['wf_do']:
+                view['handle'] = view['wf_do']['dc_identifier']
+
+            # provenance + versions
+            if view['handle']:
+                prov = list(self._viewDatabase('PROV').get_collection(
+                    'do_prov', read_preference=self.read_preferences['LOOKUP']).aggregate([
+                        {'$match': {'dc_identifier': view['handle']}},
+                        {'$limit': 1},
+                        {'$lookup': {'from': 'do_vers', 'localField': 'dc_identifier',
+                                     'foreignField': 'dc_identifier', 'as': 'versions'}}
+                    ]))
+                if prov:
+                    view['do_vers'] = prov[0].pop('versions')
+                    view['do_prov'] = prov[0]
+
+            # WFCatalog: daily stream (hourly granules and segments are removed by streamId,
+            # nobody reads them from the view) plus dependent streams
+            wfc = list(self._viewDatabase('WFC').get_collection(
+                'daily_streams', read_preference=self.read_preferences['LOOKUP']).aggregate([
+                    {'$match': {'$or': [{'fileId': name}, {'files.name': name}]}},
+                    {'$facet': {
+                        'stream': [
+                            {'$match': {'fileId': name}},
+                            {'$limit': 1},
+                            {'$project': {'files': 1, 'fileId': 1, '_id': 1}}
+                        ],
+                        'dependents': [
+                            {'$match': {'files.name': name}},
+                            {'$project': {'files': 1, 'fileId': 1, '_id': 1}}
+                        ]
+                    }}
+                ]))
+            if wfc:
+                view['daily_stream'] = wfc[0]['stream'][0] if wfc[0]['stream'] else None
+                view['dependents'] = wfc[0]['dependents']
+
+            return view
+
+        return self._read(query, key=name)
+
+    #
+    # digital object view kept in session: fetched by the first action of the rule, reused by the next ones
+    #
+    def getSessionDigitalObject(self, session, file):
+
+        view = session['SESSION'].get('DO_VIEW')
+        if view is None or view['fileId'] != os.path.basename(file):
+            view = self.getDigitalObject(file)
+            session['SESSION']['DO_VIEW'] = view
+            self.log.info("Digital object view loaded for %s" % os.path.basename(file))
+
+        return view
+
+    #
+    # an action changed the digital object: the next one loads a fresh view
+    #
+    def dropSessionDigitalObject(self, session):
+
+        session['SESSION'].pop('DO_VIEW', None)
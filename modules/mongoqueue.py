@@ -0,0 +1,780 @@
+#! /usr/bin/env python
+"""
+
+# Disclaimer:
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+    This script is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY.
+
+# Copyright:
+    2023 Massimo Fares, INGV - Italy <massimo.fares@ingv.it>; EIDA Italia Team, INGV - Italy  <adaisacd.ont@ingv.it>
+
+# License:
+    GPLv3
+
+# Platform:
+    Linux
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+
+Circuit breaker and durable write-behind queue used by MongoDAO.
+
+When MongoDB is slow or down the breaker opens: writes are appended to a
+local SQLite queue instead of blocking the worker, reads fail fast with
+MongoUnavailable. A background drainer replays the queue in bulk as soon
+as the breaker lets a probe through and the DB answers again.
+
+Configuration (yaml), inside the MONGO block of any action using MongoDAO:
+
+    MONGO:
+      ...
+      WRITE_BEHIND:
+        ENABLED: true
+        QUEUE_PATH: "/var/lib/archive/queue/mongo-writebehind.sqlite"
+        FAILURE_THRESHOLD: 3     # consecutive failures before opening
+        RESET_TIMEOUT: 30        # seconds before a half-open probe
+        DRAIN_INTERVAL: 10       # seconds between drainer runs
+        DRAIN_BATCH: 500         # operations replayed per bulk_write
+
+Reads go to the DB again as soon as the breaker closes, while the drainer
+is still replaying: only the reads of a file (fileId) with writes still in
+the queue fail with MongoUnavailable, the DB would answer for it with a
+state older than ours.
+
+Operations the DB rejects on replay (validation errors, failed operations)
+are moved to a dead-letter table of the same SQLite file and logged as
+errors; WriteBehindQueue.dead() lists them and revive() queues them again.
+
+Fast-ingest profile (bulk reloads that can be replayed from the archive):
+inserts are buffered and sent with unordered insert_many under a relaxed
+write concern; every buffered document is recorded in a local ledger and
+a verification pass at the end of the run re-inserts, acknowledged, what
+did not reach the DB. Updates and deletes keep the default write concern.
+
+    MONGO:
+      ...
+      INGEST_PROFILE:
+        MODE: fast               # safe (default) | fast
+        W: 0                     # 0 = unacknowledged, 1 = primary only
+        J: false
+        BULK_SIZE: 500           # documents per insert_many
+        FLUSH_INTERVAL: 30       # seconds a document may wait in the buffer
+        VERIFY_INTERVAL: 600     # seconds between verification passes
+        LEDGER_PATH: "/var/lib/archive/queue/mongo-ingest-ledger.sqlite"
+
+A background thread flushes the buffer every FLUSH_INTERVAL and verifies
+the ledger every VERIFY_INTERVAL, so daemon workers (which never exit)
+are covered too. MongoDAO flushes, acknowledged, before a read of a file
+(fileId) with documents in the buffer, so that its existence check sees
+them; the other reads do not wait for the buffer.
+
+"""
+import os
+import time
+import atexit
+import collections
+import sqlite3
+import threading
+
+import bson
+from pymongo import MongoClient, InsertOne, UpdateOne, DeleteOne, DeleteMany, WriteConcern
+from pymongo.errors import ConnectionFailure, BulkWriteError, DuplicateKeyError, PyMongoError, CollectionInvalid
+
+
+#
+# raised by MongoDAO reads while the breaker is open
+#
+class MongoUnavailable(Exception):
+    pass
+
+
+#
+# hourly granules time-series collection (MongoDB >= 5.0), created if missing: an insert
+# into a missing hourly_ts would create a plain collection instead
+#
+def createTimeSeries(db):
+
+    if 'hourly_ts' in db.list_collection_names(filter={'name': 'hourly_ts'}):
+        return
+    try:
+        db.create_collection('hourly_ts', timeseries={'timeField': 'ts', 'metaField': 'meta',
+                                                      'granularity': 'hours'})
+    except CollectionInvalid:
+        # created meanwhile by another worker
+        pass
+
+
+#
+# Circuit breaker: closed -> open (after N failures) -> half-open (after timeout) -> closed
+#
+class CircuitBreaker():
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    #
+    # True if a call may go to the DB (closed, or half-open probe)
+    #
+    def allow(self):
+
+        with self._lock:
+            return self._state() != self.OPEN
+
+    def success(self):
+
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def failure(self):
+
+        with self._lock:
+            self._failures += 1
+            # a failed half-open probe re-opens the breaker straight away
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+
+#
+# Durable FIFO of pending write operations (SQLite, one row per op);
+# ops the DB rejects for good are parked in the dead-letter table
+#
+class WriteBehindQueue():
+
+    def __init__(self, path):
+
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " db TEXT NOT NULL,"
+                " coll TEXT NOT NULL,"
+                " op TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " keys TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead ("
+                " seq INTEGER PRIMARY KEY,"
+                " db TEXT NOT NULL,"
+                " coll TEXT NOT NULL,"
+                " op TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " error TEXT,"
+                " failed_at REAL,"
+                " keys TEXT)"
+            )
+            # queue files written before the fileId keys
+            for table in ('pending', 'dead'):
+                if 'keys' not in [column[1] for column in conn.execute("PRAGMA table_info(%s)" % table)]:
+                    conn.execute("ALTER TABLE %s ADD COLUMN keys TEXT" % table)
+            # counted once: the queue file belongs to this worker, put/ack/bury keep the counts afterwards
+            self._count = conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+            # queued ops per fileId
+            self._keys = collections.Counter()
+            for (keys,) in conn.execute("SELECT keys FROM pending WHERE keys IS NOT NULL"):
+                self._keys.update(keys.split('\n'))
+
+    def _conn(self):
+
+        return sqlite3.connect(self.path, timeout=30)
+
+    #
+    # fileIds an op is about: the fileId of the document(s) or of the filter, plus key
+    #
+    @staticmethod
+    def _keysOf(args, key=None):
+
+        keys = set([key]) if key else set()
+        docs = args[0] if args and isinstance(args[0], list) else args[:1]
+        for doc in docs:
+            if isinstance(doc, dict) and isinstance(doc.get('fileId'), str):
+                keys.add(doc['fileId'])
+        return sorted(keys)
+
+    #
+    # op: insert_one | insert_many | update_one | delete_one | delete_many | delete_streams
+    # args: document (insert) or filter [+ update]; key: fileId of an op filtered by _id
+    #
+    def put(self, db, coll, op, *args, key=None):
+
+        payload = bson.encode({'args': list(args)})
+        keys = self._keysOf(args, key)
+        with self._lock, self._conn() as conn:
+            conn.execute("INSERT INTO pending (db, coll, op, payload, keys) VALUES (?, ?, ?, ?, ?)",
+                         (db, coll, op, payload, '\n'.join(keys) or None))
+            self._count += 1
+            self._keys.update(keys)
+
+    def _forget(self, rows):
+
+        for (keys,) in rows:
+            if keys:
+                self._keys.subtract(keys.split('\n'))
+        self._keys += collections.Counter()
+
+    def peek(self, limit):
+
+        with self._lock, self._conn() as conn:
+            rows = conn.execute("SELECT seq, db, coll, op, payload FROM pending ORDER BY seq LIMIT ?",
+                                (limit,)).fetchall()
+        return [(seq, db, coll, op, bson.decode(payload)['args']) for seq, db, coll, op, payload in rows]
+
+    def ack(self, last_seq):
+
+        with self._lock, self._conn() as conn:
+            self._forget(conn.execute("SELECT keys FROM pending WHERE seq <= ?", (last_seq,)).fetchall())
+            removed = conn.execute("DELETE FROM pending WHERE seq <= ?", (last_seq,)).rowcount
+            self._count = max(self._count - removed, 0)
+
+    #
+    # move one pending op to the dead-letter table
+    #
+    def bury(self, seq, error):
+
+        with self._lock, self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO dead (seq, db, coll, op, payload, error, failed_at, keys)"
+                         " SELECT seq, db, coll, op, payload, ?, ?, keys FROM pending WHERE seq = ?",
+                         (str(error), time.time(), seq))
+            self._forget(conn.execute("SELECT keys FROM pending WHERE seq = ?", (seq,)).fetchall())
+            removed = conn.execute("DELETE FROM pending WHERE seq = ?", (seq,)).rowcount
+            self._count = max(self._count - removed, 0)
+
+    #
+    # dead-letter ops: [(seq, db, coll, op, args, error)]
+    #
+    def dead(self, limit=100):
+
+        with self._lock, self._conn() as conn:
+            rows = conn.execute("SELECT seq, db, coll, op, payload, error FROM dead ORDER BY seq LIMIT ?",
+                                (limit,)).fetchall()
+        return [(seq, db, coll, op, bson.decode(payload)['args'], error) for seq, db, coll, op, payload, error in rows]
+
+    #
+    # put the dead-letter ops back at the end of the queue (once the cause has been fixed)
+    #
+    def revive(self):
+
+        with self._lock, self._conn() as conn:
+            for (keys,) in conn.execute("SELECT keys FROM dead WHERE keys IS NOT NULL"):
+                self._keys.update(keys.split('\n'))
+            revived = conn.execute("INSERT INTO pending (db, coll, op, payload, keys)"
+                                   " SELECT db, coll, op, payload, keys FROM dead ORDER BY seq").rowcount
+            conn.execute("DELETE FROM dead")
+            self._count += revived
+        return revived
+
+    #
+    # True while ops wait to be replayed (cached count, no query)
+    #
+    @property
+    def pending(self):
+
+        return self._count > 0
+
+    #
+    # True while ops about fileId wait to be replayed
+    #
+    def touches(self, fileId):
+
+        with self._lock:
+            return self._keys[fileId] > 0
+
+    def __len__(self):
+
+        return self._count
+
+
+#
+# Background thread replaying the queue in bulk when the DB is back
+#
+class QueueDrainer(threading.Thread):
+
+    def __init__(self, queue, breaker, client_factory, log, interval=10, batch=500):
+
+        threading.Thread.__init__(self, name="mongo-writebehind-drainer", daemon=True)
+        self.queue = queue
+        self.breaker = breaker
+        self.client_factory = client_factory
+        self.log = log
+        self.interval = interval
+        self.batch = batch
+        self.client = None
+        # DBs whose hourly_ts time-series collection is known to exist
+        self._timeseries = set()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+
+        self._stop_event.set()
+
+    def run(self):
+
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as ex:
+                self.log.error("write-behind drainer error")
+                self.log.error(ex)
+
+    #
+    # replay pending ops; consecutive ops on the same collection go in one ordered bulk_write.
+    # Ops rejected by the DB (anything but a connection failure or an already applied insert)
+    # go to the dead-letter table, so that one bad op cannot hold back the whole queue.
+    #
+    def drain(self):
+
+        replayed = 0
+        while self.breaker.allow():
+            ops = self.queue.peek(self.batch)
+            if not ops:
+                break
+
+            if self.client is None:
+                self.client = self.client_factory()
+
+            try:
+                for (db, coll), group in self._groupByCollection(ops):
+                    requests = []
+                    for seq, op, args in group:
+                        if op == 'delete_streams':
+                            # resolved now: flush what precedes it, then drop the streams by fileId
+                            self._replay(self.client[db][coll], requests)
+                            requests = []
+                            try:
+                                self._deleteStreams(self.client[db], args[0])
+                            except ConnectionFailure:
+                                raise
+                            except PyMongoError as ex:
+                                self._bury(seq, db, coll, op, ex)
+                        elif op == 'insert_many':
+                            if coll == 'hourly_ts' and db not in self._timeseries:
+                                createTimeSeries(self.client[db])
+                                self._timeseries.add(db)
+                            requests.extend((seq, InsertOne(doc)) for doc in args[0])
+                        else:
+                            try:
+                                requests.append((seq, self._toRequest(op, args)))
+                            except ValueError as ex:
+                                self._bury(seq, db, coll, op, ex)
+                    self._replay(self.client[db][coll], requests)
+                    self.queue.ack(group[-1][0])
+                    replayed += len(group)
+            except ConnectionFailure as ex:
+                self.breaker.failure()
+                self.log.warning("write-behind drain interrupted, DB still unavailable: %s" % ex)
+                break
+
+            self.breaker.success()
+
+        if replayed:
+            self.log.info("write-behind drainer replayed %d operation(s)" % replayed)
+        return replayed
+
+    #
+    # ordered bulk_write of [(seq, request)]: inserts already applied (crash between write and ack)
+    # are skipped, any other write error buries the op and the tail is sent again
+    #
+    def _replay(self, collection, requests):
+
+        start = 0
+        while start < len(requests):
+            try:
+                collection.bulk_write([request for seq, request in requests[start:]], ordered=True)
+                return
+            except BulkWriteError as bwe:
+                errors = bwe.details.get('writeErrors', [])
+                if not errors:
+                    # write concern error only: the writes are applied
+                    self.log.warning("write-behind replay on %s: %s" % (collection.name, bwe.details))
+                    return
+                error = errors[0]
+                failed = start + error['index']
+                if error['code'] != 11000:
+                    self._bury(requests[failed][0], collection.database.name, collection.name,
+                               type(requests[failed][1]).__name__, error.get('errmsg', error))
+                # ordered bulk stops at the failed request: resend the tail
+                start = failed + 1
+            except ConnectionFailure:
+                raise
+            except PyMongoError as ex:
+                # the whole bulk was refused (i.e. OperationFailure): bury its ops
+                for seq in sorted(set(seq for seq, request in requests[start:])):
+                    self._bury(seq, collection.database.name, collection.name, 'bulk_write', ex)
+                return
+
+    def _bury(self, seq, db, coll, op, error):
+
+        self.queue.bury(seq, error)
+        self.log.error("write-behind op %d (%s on %s.%s) rejected by the DB, moved to dead letters: %s" % (
+            seq, op, db, coll, error))
+
+    #
+    # WFCatalog removal queued by fileId: daily stream plus hourly granules and segments
+    #
+    def _deleteStreams(self, db, query):
+
+        ids = [doc['_id'] for doc in db.daily_streams.find(query, {'_id': 1})]
+        if ids:
+            db.daily_streams.delete_many({'_id': {'$in': ids}})
+            db.hourly_streams.delete_many({'streamId': {'$in': ids}})
+            db.hourly_buckets.delete_many({'streamId': {'$in': ids}})
+            db.hourly_ts.delete_many({'meta.streamId': {'$in': ids}})
+            db.c_segments.delete_many({'streamId': {'$in': ids}})
+
+    def _groupByCollection(self, ops):
+
+        groups = []
+        for seq, db, coll, op, args in ops:
+            if groups and groups[-1][0] == (db, coll):
+                groups[-1][1].append((seq, op, args))
+            else:
+                groups.append(((db, coll), [(seq, op, args)]))
+        return groups
+
+    def _toRequest(self, op, args):
+
+        if op == 'insert_one':
+            return InsertOne(args[0])
+        elif op == 'update_one':
+            return UpdateOne(args[0], args[1], upsert=False)
+        elif op == 'delete_one':
+            return DeleteOne(args[0])
+        elif op == 'delete_many':
+            return DeleteMany(args[0])
+        raise ValueError("unknown queued operation: %s" % op)
+
+
+#
+# Local record of the documents written under the fast-ingest profile, waiting for verification
+#
+class IngestLedger():
+
+    def __init__(self, path):
+
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS expected ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " db TEXT NOT NULL,"
+                " coll TEXT NOT NULL,"
+                " oid TEXT NOT NULL,"
+                " stream TEXT,"
+                " payload BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS expected_oid ON expected (coll, oid)")
+            conn.execute("CREATE INDEX IF NOT EXISTS expected_stream ON expected (coll, stream)")
+
+    def _conn(self):
+
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, db, coll, docs):
+
+        rows = []
+        for doc in docs:
+            stream = doc.get('streamId') or doc.get('meta', {}).get('streamId')
+            rows.append((db, coll, str(doc['_id']), str(stream) if stream else None, bson.encode(doc)))
+        with self._lock, self._conn() as conn:
+            conn.executemany("INSERT INTO expected (db, coll, oid, stream, payload) VALUES (?, ?, ?, ?, ?)", rows)
+
+    #
+    # documents removed on purpose during the run must not be re-inserted by the verification
+    #
+    def forget(self, coll, query):
+
+        with self._lock, self._conn() as conn:
+            if '_id' in query and not isinstance(query['_id'], dict):
+                conn.execute("DELETE FROM expected WHERE coll = ? AND oid = ?", (coll, str(query['_id'])))
+            for key in ('streamId', 'meta.streamId'):
+                if key in query and not isinstance(query[key], dict):
+                    conn.execute("DELETE FROM expected WHERE coll = ? AND stream = ?", (coll, str(query[key])))
+
+    def entries(self, db, limit):
+
+        with self._lock, self._conn() as conn:
+            rows = conn.execute("SELECT seq, coll, payload FROM expected WHERE db = ? ORDER BY seq LIMIT ?",
+                                (db, limit)).fetchall()
+        return [(seq, coll, bson.decode(payload)) for seq, coll, payload in rows]
+
+    def ack(self, last_seq, db):
+
+        with self._lock, self._conn() as conn:
+            conn.execute("DELETE FROM expected WHERE db = ? AND seq <= ?", (db, last_seq))
+
+
+#
+# Buffer of inserts sent in bulk under the relaxed write concern of the fast-ingest profile
+#
+class IngestBuffer():
+
+    def __init__(self, db_name, ledger, client_factory, write_concern, log, bulk_size=500, flush_interval=30,
+                 fallback=None):
+
+        self.db_name = db_name
+        self.ledger = ledger
+        self.client_factory = client_factory
+        self.write_concern = write_concern
+        self.log = log
+        self.bulk_size = bulk_size
+        self.flush_interval = flush_interval
+        # fallback(db, coll, op, doc): where a batch goes if the DB is unreachable (write-behind queue)
+        self.fallback = fallback
+        self.client = None
+        self._pending = {}
+        # fileIds of the buffered documents
+        self._files = set()
+        self._count = 0
+        self._oldest = None
+        self._lock = threading.RLock()
+
+    def _client(self):
+
+        if self.client is None:
+            self.client = self.client_factory()
+        return self.client
+
+    def add(self, coll, docs):
+
+        with self._lock:
+            self.ledger.record(self.db_name, coll, docs)
+            self._pending.setdefault(coll, []).extend(docs)
+            self._files.update(doc['fileId'] for doc in docs if 'fileId' in doc)
+            self._count += len(docs)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._count >= self.bulk_size or time.monotonic() - self._oldest >= self.flush_interval:
+                self.flush()
+
+    #
+    # send the buffered documents; acknowledged=True waits for the DB (before a read that must see them)
+    #
+    def flush(self, acknowledged=False):
+
+        with self._lock:
+            if not self._pending:
+                return
+            write_concern = WriteConcern() if acknowledged else self.write_concern
+            db = self._client().get_database(self.db_name, write_concern=write_concern)
+            for coll, docs in self._pending.items():
+                try:
+                    db[coll].insert_many(docs, ordered=False)
+                except ConnectionFailure as ex:
+                    if self.fallback is None:
+                        raise
+                    self.log.warning("Fast ingest flush failed on %s, %d document(s) queued: %s" % (coll, len(docs), ex))
+                    for doc in docs:
+                        self.fallback(self.db_name, coll, 'insert_one', doc)
+                except BulkWriteError as bwe:
+                    # already present documents are fine, the verification catches the rest
+                    self.log.warning("Fast ingest flush on %s: %d write error(s)" % (coll, len(bwe.details.get('writeErrors', []))))
+            self._pending = {}
+            self._files = set()
+            self._count = 0
+            self._oldest = None
+
+    #
+    # True if documents of fileId wait in the buffer
+    #
+    def holds(self, fileId):
+
+        with self._lock:
+            return fileId in self._files
+
+    #
+    # True if the oldest buffered document waited FLUSH_INTERVAL
+    #
+    def due(self):
+
+        with self._lock:
+            return self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+
+    def forget(self, coll, query):
+
+        with self._lock:
+            self.ledger.forget(coll, query)
+
+    #
+    # flush, then compare the ledger with the DB and re-insert (acknowledged) whatever is missing;
+    # returns {collection: [expected, found, requeued]}
+    #
+    def verify(self, chunk=1000):
+
+        report = {}
+        with self._lock:
+            self.flush()
+            if not self.write_concern.acknowledged:
+                # let the unacknowledged batches land before checking them
+                time.sleep(1)
+
+            db = self._client()[self.db_name]
+            while True:
+                entries = self.ledger.entries(self.db_name, chunk)
+                if not entries:
+                    break
+
+                by_coll = {}
+                for seq, coll, doc in entries:
+                    by_coll.setdefault(coll, []).append(doc)
+
+                for coll, docs in by_coll.items():
+                    found = set(d['_id'] for d in db[coll].find({'_id': {'$in': [doc['_id'] for doc in docs]}}, {'_id': 1}))
+                    missing = [doc for doc in docs if doc['_id'] not in found]
+                    for doc in missing:
+                        if self.fallback is not None:
+                            self.fallback(self.db_name, coll, 'insert_one', doc)
+                        else:
+                            try:
+                                db[coll].insert_one(doc)
+                            except DuplicateKeyError:
+                                pass
+                    stats = report.setdefault(coll, [0, 0, 0])
+                    stats[0] += len(docs)
+                    stats[1] += len(found)
+                    stats[2] += len(missing)
+
+                self.ledger.ack(entries[-1][0], self.db_name)
+
+        for coll, (expected, found, requeued) in report.items():
+            message = "Fast ingest verification %s.%s: expected %d, found %d, re-queued %d" % (
+                self.db_name, coll, expected, found, requeued)
+            if requeued:
+                self.log.warning(message)
+            else:
+                self.log.info(message)
+        return report
+
+
+#
+# Background thread of the fast-ingest buffer: time-based flush and periodic verification
+#
+class IngestFlusher(threading.Thread):
+
+    def __init__(self, ingest, log, flush_interval=30, verify_interval=600):
+
+        threading.Thread.__init__(self, name="mongo-ingest-flusher", daemon=True)
+        self.ingest = ingest
+        self.log = log
+        self.tick = max(1, min(flush_interval, verify_interval))
+        self.verify_interval = verify_interval
+        self._last_verify = time.monotonic()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+
+        self._stop_event.set()
+
+    def run(self):
+
+        while not self._stop_event.wait(self.tick):
+            try:
+                if time.monotonic() - self._last_verify >= self.verify_interval:
+                    # verify flushes first
+                    self.ingest.verify()
+                    self._last_verify = time.monotonic()
+                elif self.ingest.due():
+                    self.ingest.flush()
+            except Exception as ex:
+                self.log.error("fast ingest flusher error")
+                self.log.error(ex)
+
+
+#
+# one breaker/queue/drainer per DB host and queue file, shared by every MongoDAO of the worker
+#
+_breakers = {}
+_queues = {}
+_buffers = {}
+_registry_lock = threading.Lock()
+
+
+def getBreaker(mongo_config):
+
+    host = mongo_config['DB_HOST']
+    wb_config = mongo_config['WRITE_BEHIND']
+    with _registry_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(wb_config.get('FAILURE_THRESHOLD', 3),
+                                             wb_config.get('RESET_TIMEOUT', 30))
+        return _breakers[host]
+
+
+def getQueue(mongo_config, log):
+
+    host = mongo_config['DB_HOST']
+    wb_config = mongo_config['WRITE_BEHIND']
+    path = wb_config['QUEUE_PATH']
+    with _registry_lock:
+        if path not in _queues:
+            queue = WriteBehindQueue(path)
+
+            drainer = QueueDrainer(queue, _breakers[host], _clientFactory(mongo_config, wb_config), log,
+                                   wb_config.get('DRAIN_INTERVAL', 10), wb_config.get('DRAIN_BATCH', 500))
+            drainer.start()
+            _queues[path] = (queue, drainer)
+        return _queues[path][0]
+
+
+def getIngestBuffer(mongo_config, log, fallback=None):
+
+    profile = mongo_config['INGEST_PROFILE']
+    key = (mongo_config['DB_HOST'], mongo_config['DB_NAME'])
+    with _registry_lock:
+        if key not in _buffers:
+            write_concern = WriteConcern(w=profile.get('W', 0), j=profile.get('J', False))
+            ingest = IngestBuffer(mongo_config['DB_NAME'], IngestLedger(profile['LEDGER_PATH']),
+                                  _clientFactory(mongo_config, profile), write_concern, log,
+                                  profile.get('BULK_SIZE', 500), profile.get('FLUSH_INTERVAL', 30), fallback)
+            # quiet or never-ending workers: flush and verify on a timer; last pass at exit
+            IngestFlusher(ingest, log, profile.get('FLUSH_INTERVAL', 30), profile.get('VERIFY_INTERVAL', 600)).start()
+            atexit.register(ingest.verify)
+            _buffers[key] = ingest
+        return _buffers[key]
+
+
+def _clientFactory(mongo_config, section):
+
+    def client_factory():
+        timeout = section.get('SERVER_TIMEOUT_MS', 5000)
+        if mongo_config['AUTHENTICATE']:
+            return MongoClient(mongo_config['DB_HOST'], username=mongo_config['USER'], password=mongo_config['PASS'],
+                               serverSelectionTimeoutMS=timeout)
+        return MongoClient(mongo_config['DB_HOST'], serverSelectionTimeoutMS=timeout)
+
+    return client_factory
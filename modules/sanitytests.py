@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+"""
+
+# Disclaimer:
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+    This script is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY.
+
+# Copyright:
+    2023 Massimo Fares, INGV - Italy <massimo.fares@ingv.it>; EIDA Italia Team, INGV - Italy  <adaisacd.ont@ingv.it>
+
+# License:
+    GPLv3
+
+# Platform:
+    Linux
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+
+The sanity tests of a miniSEED day file, shared by the sanitychecks action,
+the bulk validation (utils/batch_validate.py) and the checkin triage
+(utils/checkin_triage.py). Error codes:
+
+    0   empty or unreadable file            1   no records
+    2   SDS name, type code or record headers not consistent
+    21  unexpected error on test 2
+    3   sampling rate outside the band code range
+    31  unexpected error on test 3 (i.e. unknown band code)
+    41  no station metadata                 4   day outside the channel epochs
+
+Configuration: the sanitychecks CONFIG block (TYPE_CODE, BAND_CODE,
+HEADER_ONLY, DEEP_CHECK).
+
+Usage:
+    code, message, st = runTests(file, filename, config, stations.getEpochIndex, log=self.log)
+    if code: ...                                   # '' when every test passed
+    runTests(file, filename, config, last_test=2)  # corrupt/inconsistent files only
+
+"""
+import datetime
+import warnings
+
+from obspy import read
+
+# needed to silence output warnings for files partially broken
+warnings.filterwarnings('ignore', '.*')
+
+
+#
+# True if the file is read with record headers only (HEADER_ONLY unless DEEP_CHECK)
+#
+def headerOnly(config):
+
+    return config.get('HEADER_ONLY', False) and not config.get('DEEP_CHECK', False)
+
+
+#
+# run TESTs 0 to last_test on file (SDS name filename); epochs(net, sta) gives the
+# EpochIndex of a station (stationmanager). Returns (error code or '', message, stream)
+#
+def runTests(file, filename, config, epochs=None, last_test=4, log=None):
+
+    def failed(code, message, st=None):
+        if log:
+            log.error(message)
+        return code, message, st
+
+    #
+    # TEST 0 - 1 Check ZERO/Broken file
+    #
+    # HEADER_ONLY: TESTs 2-4 only use the record headers, the samples are decoded
+    # (and so checked) only with DEEP_CHECK
+    try:
+        st = read(file, headonly=headerOnly(config))
+    except Exception as e:
+        return failed('0', 'Check ZERO file: FAILED - empty or unreadable: %s' % e)
+
+    if st is None or len(st) == 0:
+        return failed('1', 'Check Broken file: FAILED - no records')
+    if log:
+        log.info('Check ZERO/Broken file: OK ')
+    if last_test < 2:
+        return '', 'OK', st
+
+    #
+    # TEST 2 Check SDS file:
+    #
+    # check if the filename reflect the infos inside mseed header
+    fields = filename.split('.')
+    if len(fields) != 7:
+        return failed('2', 'Check SDS file: FAILED - not an SDS file name: %s' % filename, st)
+    [xnet, xsta, xloc, xcha, xtype, xyear, xjday] = fields
+
+    if xtype not in config['TYPE_CODE']:
+        return failed('2', 'Check SDS file: FAILED - Type-Code %s not allowed' % xtype, st)
+
+    try:
+        for tr in st:
+            if not (xnet == tr.stats.network and xsta == tr.stats.station and xloc == tr.stats.location
+                    and xcha == tr.stats.channel and xyear == str(tr.stats.starttime.year)
+                    and xjday == str(tr.stats.starttime.julday).zfill(3)):
+                realdata = tr.stats.network + '.' + tr.stats.station + '.' + tr.stats.location + '.' + \
+                           tr.stats.channel + '.' + xtype + '.' + str(tr.stats.starttime.year) + '.' + \
+                           str(tr.stats.starttime.julday).zfill(3)
+                return failed('2', 'Check SDS file: FAILED - info inside file %s not equal to name %s' % (
+                    realdata, filename), st)
+    except Exception as e:
+        return failed('21', '2-1 unexpected error on step 2: %s' % e, st)
+    if log:
+        log.info('Check SDS file: OK ')
+    if last_test < 3:
+        return '', 'OK', st
+
+    #
+    # TEST 3 check RATE filename (band code)
+    #
+    # check if sampling_rate of filename is consistent with mseed header (last trace)
+    try:
+        low, high = config['BAND_CODE'][xcha[0]]
+        if not low <= tr.stats.sampling_rate <= high:
+            return failed('3', 'Check RATE file: FAILED - sampling rate %s for band code %s' % (
+                tr.stats.sampling_rate, xcha[0]), st)
+    except Exception as e:
+        return failed('31', '3-1 unexpected error on step 3: %s' % e, st)
+    if log:
+        log.info('Check RATE file: OK ')
+    if last_test < 4 or epochs is None:
+        return '', 'OK', st
+
+    #
+    # TEST 4 check EPOCH in file
+    #
+    # check if mseed data are consistent with station epoch
+    index = epochs(tr.stats.network, tr.stats.station)
+    if not index:
+        return failed('41', 'Check EPOCH file: FAILED: no-data ', st)
+
+    scnl = tr.stats.network + '.' + tr.stats.station + '.' + tr.stats.location + '.' + tr.stats.channel
+    jday = str(tr.stats.starttime.year) + '.' + str(tr.stats.starttime.julday)
+    julday = datetime.datetime.strptime(jday, '%Y.%j').date()
+    # sorted epochs per SCNL: binary search on the day
+    if not index.contains(scnl, julday):
+        return failed('4', 'Check EPOCH file: FAILED: time not in range %s %s' % (scnl, jday), st)
+    if log:
+        log.info('Check EPOCH file: OK ')
+
+    return '', 'OK', st
@@ -0,0 +1,611 @@
+#! /usr/bin/env python
+"""
+
+# Disclaimer:
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+    This script is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY.
+
+# Copyright:
+    2023 Massimo Fares, INGV - Italy <massimo.fares@ingv.it>; EIDA Italia Team, INGV - Italy  <adaisacd.ont@ingv.it>
+
+# License:
+    GPLv3
+
+# Platform:
+    Linux
+
+# Module-Author:
+    Massimo Fares, INGV - Italy <massimo.fares@ingv.it>
+
+
+Station metadata shared by the actions querying the FDSN station service
+(sanitychecks: channel epochs, dublincore: station coordinates).
+
+Files of one station arrive in bursts, so every answer is kept in an
+in-memory LRU with a TTL; requests go through a small pool of keep-alive
+connections per host. An expired entry is still served for STALE_TTL
+seconds while a background thread revalidates it, and when the service
+is unreachable the last known answer is served instead of failing the file.
+
+Configuration (yaml), inside the CONFIG block of any action with a STATION_ENDPOINT:
+
+    STATION_ENDPOINT: http://webservices.ingv.it/fdsnws/station/1/query?
+    STATION_CACHE:
+      TTL: 3600              # seconds an answer is fresh
+      STALE_TTL: 86400       # seconds an expired answer is served while revalidating
+      NEGATIVE_TTL: 300      # seconds a "no data" answer is kept
+      MAX_ENTRIES: 4096      # LRU size (net.sta per query level)
+      POOL_SIZE: 4           # idle keep-alive connections kept per host
+      TIMEOUT: 30            # socket timeout (seconds)
+      WARMUP:                # optional bulk inventory load at worker start
+        ENABLED: true
+        SNAPSHOT_PATH: "/var/lib/archive/queue/station-inventory.json"
+        REFRESH_INTERVAL: 3600   # seconds between bulk refreshes (default TTL)
+        RETRY_INTERVAL: 300      # seconds before retrying a failed refresh
+        BATCH: 10                # networks per request
+        NETWORKS: [IV, MN]       # optional, default: every network of net_info (MONGO block below)
+        MONGO:
+          DB_HOST: mongodb:27017
+          DB_NAME: wf_hand
+          ...
+
+With WARMUP the channel epochs of every authoritative network are fetched in
+a few bulk requests (level=channel&net=IV,MN,...) by a background thread and
+saved to SNAPSHOT_PATH. The next start loads the snapshot first, so a
+restarted worker answers TEST 4 of sanitychecks without waiting for the
+service, even when it is unreachable. MAX_ENTRIES must exceed the number of
+stations of those networks.
+
+One cache is kept per station service: endpoints that differ only by the
+scheme, the host case or the trailing '/' or '?' (i.e. http and https) share
+it, and it queries over https as soon as any action configures https.
+
+Usage:
+    stations = getStationCache(self.config, self.log)
+    epochs = stations.getEpochs('IV', 'ACER')      # [['IV.ACER..HHZ', start, end], ...] or None
+    index = stations.getEpochIndex('IV', 'ACER')   # index.contains('IV.ACER..HHZ', date)
+    stations.validateDays([('IV.ACER..HHZ', date), ('IV.CAFE..HHZ', date), ...])   # [bool, ...]
+    info = stations.getStation('IV', 'ACER')       # {'lat', 'lon', 'ele', 'start', 'end'} or None
+
+"""
+import bisect
+import csv
+import datetime
+import http.client
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import StringIO
+from urllib.parse import urlsplit
+
+OPEN_END = "2100-01-01T00:00:00"
+
+
+class StationServiceError(Exception):
+    pass
+
+
+#
+# text format parsers
+#
+# level=channel:
+#   #Network | Station | Location | Channel | Latitude | ... | SampleRate | StartTime | EndTime
+# returns [['NET.STA.LOC.CHA', start_date, end_date], ...], open epochs end at OPEN_END
+#
+def parseEpochs(text):
+
+    eps = []
+    for row in csv.reader(StringIO(text), delimiter='|'):
+        if not row or row[0].startswith('#') or len(row) < 6:
+            continue
+        if row[-1].strip() == "":
+            row[-1] = OPEN_END
+        start = datetime.datetime.strptime(row[-2].strip().split("T")[0], '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(row[-1].strip().split("T")[0], '%Y-%m-%d').date()
+        eps.append([row[0] + "." + row[1] + "." + row[2] + "." + row[3], start, end])
+    return eps
+
+
+#
+# level=station (default):
+#   #Network | Station | Latitude | Longitude | Elevation | SiteName | StartTime | EndTime
+# returns the first station epoch as {'lat', 'lon', 'ele', 'start', 'end'} (strings), None if no data
+#
+def parseStation(text):
+
+    for row in csv.reader(StringIO(text), delimiter='|'):
+        if not row or row[0].startswith('#') or len(row) < 8:
+            continue
+        return {"lat": row[2].strip(), "lon": row[3].strip(), "ele": row[4].strip(),
+                "start": row[6].strip(), "end": row[7].strip()}
+    return None
+
+
+#
+# Channel epochs of a station as sorted, merged day intervals per SCNL:
+# "is this day inside any epoch" is a binary search instead of a scan of every row
+#
+class EpochIndex():
+
+    ONE_DAY = datetime.timedelta(days=1)
+
+    def __init__(self, epochs):
+
+        # epochs as returned by parseEpochs, kept for the callers of getEpochs
+        self.epochs = epochs
+        intervals = {}
+        for scnl, start, end in epochs:
+            if start <= end:
+                intervals.setdefault(scnl, []).append((start, end))
+            else:
+                # reversed epoch: same meaning as filechecks_util.time_in_range (start <= t or t <= end)
+                intervals.setdefault(scnl, []).append((start, datetime.date.max))
+                intervals.setdefault(scnl, []).append((datetime.date.min, end))
+
+        # scnl -> (starts, ends), non overlapping and sorted by start
+        self._index = {}
+        for scnl, spans in intervals.items():
+            spans.sort()
+            starts, ends = [], []
+            for start, end in spans:
+                # overlapping or adjacent days collapse into one interval
+                if ends and (ends[-1] == datetime.date.max or start <= ends[-1] + self.ONE_DAY):
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._index[scnl] = (starts, ends)
+
+    def __len__(self):
+
+        return len(self.epochs)
+
+    #
+    # True if day (datetime.date) is inside an epoch of scnl (NET.STA.LOC.CHA)
+    #
+    def contains(self, scnl, day):
+
+        spans = self._index.get(scnl)
+        if spans is None:
+            return False
+        starts, ends = spans
+        i = bisect.bisect_right(starts, day) - 1
+        return i >= 0 and day <= ends[i]
+
+    #
+    # batch version: [(scnl, day), ...] -> [bool, ...]
+    #
+    def containsMany(self, pairs):
+
+        return [self.contains(scnl, day) for scnl, day in pairs]
+
+
+def parseEpochIndex(text):
+
+    return EpochIndex(parseEpochs(text))
+
+
+#
+# Keep-alive HTTP(S) connections to one host
+#
+class ConnectionPool():
+
+    def __init__(self, scheme, netloc, size=4, timeout=30):
+
+        self.scheme = scheme
+        self.netloc = netloc
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new(self):
+
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    #
+    # GET path, returns (status, body); a reused connection closed by the server is retried once on a new one
+    #
+    def get(self, path):
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        reused = conn is not None
+        if conn is None:
+            conn = self._new()
+
+        try:
+            conn.request("GET", path, headers={'Connection': 'keep-alive'})
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, ConnectionError, OSError):
+            conn.close()
+            if not reused:
+                raise
+            conn = self._new()
+            conn.request("GET", path, headers={'Connection': 'keep-alive'})
+            response = conn.getresponse()
+            body = response.read()
+
+        if response.will_close:
+            conn.close()
+        else:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+        return response.status, body.decode(response.headers.get_content_charset() or 'utf-8')
+
+    def close(self):
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+#
+# LRU + TTL cache of station service answers, keyed by (level, net, sta)
+#
+class StationCache():
+
+    def __init__(self, endpoint, log, pool, ttl=3600, stale_ttl=86400, negative_ttl=300, max_entries=4096):
+
+        self.endpoint = endpoint
+        self.log = log
+        self.pool = pool
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # key -> [value, expires_at (monotonic)]
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.counters = {'hit': 0, 'stale': 0, 'miss': 0, 'error': 0}
+
+    #
+    # channel epochs of net.sta as an EpochIndex, None if unknown and the service failed
+    #
+    def getEpochIndex(self, net, sta):
+
+        query = 'level=channel&net=' + net + '&station=' + sta + '&format=text'
+        return self._get(('channel', net, sta), query, parseEpochIndex)
+
+    #
+    # channel epochs of net.sta as a list, None if unknown and the service failed
+    #
+    def getEpochs(self, net, sta):
+
+        index = self.getEpochIndex(net, sta)
+        return None if index is None else index.epochs
+
+    #
+    # batch validation: [(scnl, day), ...] -> [bool, ...], one lookup per station
+    # (False for the stations the service could not answer)
+    #
+    def validateDays(self, pairs):
+
+        indexes = {}
+        result = []
+        for scnl, day in pairs:
+            net, sta = scnl.split('.')[:2]
+            if (net, sta) not in indexes:
+                indexes[(net, sta)] = self.getEpochIndex(net, sta)
+            index = indexes[(net, sta)]
+            result.append(index is not None and index.contains(scnl, day))
+        return result
+
+    #
+    # station coordinates/epoch of net.sta, None if no data or the service failed
+    #
+    def getStation(self, net, sta):
+
+        query = 'net=' + net + '&sta=' + sta + '&format=text'
+        return self._get(('station', net, sta), query, parseStation)
+
+    #
+    # store an answer obtained elsewhere (i.e. a bulk inventory request)
+    #
+    def put(self, key, value):
+
+        self._store(key, value)
+
+    #
+    # raw text of a service query (i.e. level=channel&net=IV,MN&format=text)
+    #
+    def fetch(self, query):
+
+        return self._fetch(query)
+
+    def _get(self, key, query, parser):
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now < entry[1]:
+                    self.counters['hit'] += 1
+                    return entry[0]
+                if now < entry[1] + self.stale_ttl:
+                    # stale-while-revalidate: answer now, refresh in background
+                    self.counters['stale'] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._revalidate, args=(key, query, parser),
+                                         name="station-revalidate", daemon=True).start()
+                    return entry[0]
+            self.counters['miss'] += 1
+
+        try:
+            return self._store(key, parser(self._fetch(query)))
+        except Exception as ex:
+            with self._lock:
+                self.counters['error'] += 1
+            if entry is not None:
+                self.log.warning("Station service error for %s, using last known answer: %s" % ('.'.join(key), ex))
+                return entry[0]
+            self.log.error("Station service error for %s: %s" % ('.'.join(key), ex))
+            return None
+
+    def _revalidate(self, key, query, parser):
+
+        try:
+            self._store(key, parser(self._fetch(query)))
+        except Exception as ex:
+            with self._lock:
+                self.counters['error'] += 1
+            self.log.warning("Station revalidation failed for %s, keeping stale answer: %s" % ('.'.join(key), ex))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _fetch(self, query):
+
+        parts = urlsplit(self.endpoint + query)
+        status, text = self.pool.get(parts.path + '?' + parts.query)
+        # FDSN: 204 (or 404 when nodata=404) means no matching metadata
+        if status in (204, 404):
+            return ""
+        if status != 200:
+            raise StationServiceError("HTTP %d from %s" % (status, parts.netloc))
+        return text
+
+    def _store(self, key, value):
+
+        ttl = self.ttl if value else self.negative_ttl
+        with self._lock:
+            self._entries[key] = [value, time.monotonic() + ttl]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+#
+# Bulk channel inventory of the authoritative networks, kept warm in the cache
+# and saved as an on-disk snapshot for the next start
+#
+class InventoryWarmer(threading.Thread):
+
+    def __init__(self, cache, log, snapshot_path, networks=None, mongo_config=None,
+                 interval=3600, retry_interval=300, batch=10):
+
+        threading.Thread.__init__(self, name="station-warmup", daemon=True)
+        self.cache = cache
+        self.log = log
+        self.snapshot_path = snapshot_path
+        self.networks = networks
+        self.mongo_config = mongo_config
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.batch = batch
+        # "NET.STA" -> epochs as in parseEpochs
+        self.inventory = {}
+        # net_info DAO, built at the first refresh and reused by the next ones
+        self._mongo = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+
+        self._stop_event.set()
+        if self._mongo is not None:
+            self._mongo.disconnect()
+
+    def run(self):
+
+        while not self._stop_event.is_set():
+            try:
+                ok = self.refresh()
+            except Exception as ex:
+                self.log.error("Station inventory refresh failed: %s" % ex)
+                ok = False
+            self._stop_event.wait(self.interval if ok else self.retry_interval)
+
+    #
+    # snapshot -> cache; returns the number of stations loaded
+    #
+    def loadSnapshot(self):
+
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except ValueError as ex:
+            self.log.warning("Unreadable station snapshot %s: %s" % (self.snapshot_path, ex))
+            return 0
+        if endpointKey(snapshot.get('endpoint') or '') != endpointKey(self.cache.endpoint):
+            self.log.warning("Station snapshot %s is for %s, ignored" % (self.snapshot_path, snapshot.get('endpoint')))
+            return 0
+
+        fromordinal = datetime.date.fromordinal
+        for netsta, rows in snapshot['stations'].items():
+            self.inventory[netsta] = [[scnl, fromordinal(start), fromordinal(end)] for scnl, start, end in rows]
+        self._publish(self.inventory)
+        if self.networks is None:
+            self.networks = snapshot.get('networks')
+        return len(self.inventory)
+
+    #
+    # bulk requests for every network, cache update, snapshot save
+    #
+    def refresh(self):
+
+        networks = self._networks()
+        if not networks:
+            self.log.warning("Station inventory warm-up: no network to load")
+            return False
+
+        started = time.monotonic()
+        stations = {}
+        failed = []
+        for i in range(0, len(networks), self.batch):
+            nets = networks[i:i + self.batch]
+            try:
+                text = self.cache.fetch('level=channel&net=' + ','.join(nets) + '&format=text')
+            except Exception as ex:
+                self.log.warning("Station inventory request for %s failed: %s" % (','.join(nets), ex))
+                failed.extend(nets)
+                continue
+            for ep in parseEpochs(text):
+                stations.setdefault('.'.join(ep[0].split('.')[:2]), []).append(ep)
+
+        # the networks that failed keep what the snapshot had
+        for netsta, epochs in self.inventory.items():
+            if netsta.split('.')[0] in failed:
+                stations.setdefault(netsta, epochs)
+
+        self._publish(stations)
+        self.inventory = stations
+        self._saveSnapshot(networks)
+        self.log.info("Station inventory: %d stations of %d networks in %.1fs (%d failed)" %
+                      (len(stations), len(networks), time.monotonic() - started, len(failed)))
+        return len(failed) < len(networks)
+
+    def _networks(self):
+
+        if self.mongo_config:
+            try:
+                if self._mongo is None:
+                    from project.modules.mongomanager import MongoDAO
+                    self._mongo = MongoDAO({'MONGO': self.mongo_config}, self.log)
+                self._mongo.connect()
+                self.networks = sorted(self._mongo.getNetInfoNets())
+            except Exception as ex:
+                self.log.warning("net_info unavailable, using the last known networks: %s" % ex)
+        return self.networks
+
+    def _publish(self, stations):
+
+        for netsta, epochs in stations.items():
+            net, sta = netsta.split('.')
+            self.cache.put(('channel', net, sta), EpochIndex(epochs))
+
+    def _saveSnapshot(self, networks):
+
+        snapshot = {
+            'endpoint': self.cache.endpoint,
+            'saved': datetime.datetime.utcnow().isoformat(),
+            'networks': networks,
+            'stations': {netsta: [[scnl, start.toordinal(), end.toordinal()] for scnl, start, end in epochs]
+                         for netsta, epochs in self.inventory.items()}
+        }
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp, self.snapshot_path)
+
+
+#
+# one pool per host, one cache and warmer per endpoint, shared by every action of the worker
+#
+_pools = {}
+_caches = {}
+_warmers = {}
+_registry_lock = threading.Lock()
+
+
+def getPool(endpoint, cache_config=None):
+
+    cache_config = cache_config or {}
+    parts = urlsplit(endpoint)
+    key = (parts.scheme, parts.netloc)
+    with _registry_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(parts.scheme, parts.netloc, cache_config.get('POOL_SIZE', 4),
+                                         cache_config.get('TIMEOUT', 30))
+        return _pools[key]
+
+
+#
+# registry key of a station service: host and path, whatever the scheme
+#
+def endpointKey(endpoint):
+
+    parts = urlsplit(endpoint)
+    return parts.netloc.lower(), parts.path.rstrip('/')
+
+
+def getStationCache(config, log):
+
+    endpoint = config['STATION_ENDPOINT']
+    cache_config = config.get('STATION_CACHE', {})
+    key = endpointKey(endpoint)
+    with _registry_lock:
+        cache = _caches.get(key)
+    if cache is None:
+        pool = getPool(endpoint, cache_config)
+        with _registry_lock:
+            if key not in _caches:
+                _caches[key] = StationCache(endpoint, log, pool,
+                                            cache_config.get('TTL', 3600),
+                                            cache_config.get('STALE_TTL', 86400),
+                                            cache_config.get('NEGATIVE_TTL', 300),
+                                            cache_config.get('MAX_ENTRIES', 4096))
+            cache = _caches[key]
+    if urlsplit(endpoint).scheme == 'https' and urlsplit(cache.endpoint).scheme != 'https':
+        pool = getPool(endpoint, cache_config)
+        with _registry_lock:
+            cache.pool = pool
+            cache.endpoint = endpoint
+    if cache_config.get('WARMUP', {}).get('ENABLED', False):
+        startWarmup(cache, cache_config, log)
+    return cache
+
+
+#
+# load the snapshot (synchronously) and start the background bulk refresh, once per endpoint
+#
+def startWarmup(cache, cache_config, log):
+
+    warmup = cache_config['WARMUP']
+    key = endpointKey(cache.endpoint)
+    with _registry_lock:
+        if key in _warmers:
+            return _warmers[key]
+        warmer = InventoryWarmer(cache, log,
+                                 warmup.get('SNAPSHOT_PATH', '/var/lib/archive/queue/station-inventory.json'),
+                                 warmup.get('NETWORKS'), warmup.get('MONGO'),
+                                 warmup.get('REFRESH_INTERVAL', cache_config.get('TTL', 3600)),
+                                 warmup.get('RETRY_INTERVAL', 300), warmup.get('BATCH', 10))
+        _warmers[key] = warmer
+
+    started = time.monotonic()
+    loaded = warmer.loadSnapshot()
+    if loaded:
+        log.info("Station snapshot: %d stations loaded in %.3fs" % (loaded, time.monotonic() - started))
+    warmer.start()
+    return warmer
@@ -42,6 +42,9 @@ import fnmatch
 import signal
 import glob
 
+from project.modules.mongoqueue import MongoUnavailable
+from project.modules.archiveindex import getArchiveIndex, isArchived
+
 # ObsPy mSEED-QC is required
 try:
     from obspy.signal.quality_control import MSEEDMetadata
@@ -64,6 +67,10 @@ class WFCatalogCollector():
         self.config = config
         self.mongo = mongo
         self.log = log
+        # optional digital object view (see MongoDAO.getDigitalObject) for the file being removed
+        self.do_view = None
+        # optional local index of ARCHIVE_ROOT for the neighbour lookups
+        self.archive_index = getArchiveIndex(config)
 
     def handler(signum, frame):
         raise Exception("Metric calculation has timed out")
@@ -198,8 +205,11 @@ class WFCatalogCollector():
             # print("in deletefile file is:")
             # print(file)
 
+            # use the preloaded view if it is about this file
+            view = self.do_view if self.do_view and self.do_view['fileId'] == os.path.basename(file) else None
+
             # Set update for dependents on the file to be deleted
-            for documents in self.mongo.getDailyFilesById(file):
+            for documents in (view['dependents'] if view else self.mongo.getDailyFilesById(file)):
 
                 # Make sure to not update self or any file included in deletion
                 if self._getFullPath(documents["fileId"]) not in self.files:
@@ -210,14 +220,14 @@ class WFCatalogCollector():
 
             # Remove the document
             # print("get doc by filename")
-            document = self.mongo.getDocumentByFilenameOne(file)
+            document = view['daily_stream'] if view else self.mongo.getDocumentByFilenameOne(file, 'LOOKUP')
             # print(document)
 
             if document is not None:
                 mongo_id = document['_id']
 
                 try:                    
-                    self.mongo.removeDocumentsById(mongo_id)
+                    self.mongo.removeDocumentsById(mongo_id, file)
                     self.log.info("Succesfully removed document related to id %s." % mongo_id)
                 except Exception as ex:
                     self.log.error("Could not remove documents with id %s." % mongo_id)
@@ -492,7 +502,13 @@ class WFCatalogCollector():
 
             # Get the documents that depend on this file
             # under document.files
-            for document in self.mongo.getDailyFilesById(file):
+            try:
+                dependents = self.mongo.getDailyFilesById(file)
+            except MongoUnavailable as ex:
+                self.log.warning("Database unavailable, change detection skipped for %s: %s" % (os.path.basename(file), ex))
+                continue
+
+            for document in dependents:
 
                 # The document update is forced
                 # We must update every document that depends on the file
@@ -531,12 +547,15 @@ class WFCatalogCollector():
 
         return self._getFileDirectory(self._getStatsObject(file))
 
-    def _isNewDocument(self, file):
+    def _isNewDocument(self, file, consistent=False, storing=False):
         """
         WFCatalogCollector._isNewDocument
         > check if daily stream with given filename
         > does not exist in the database. If double is allowed
-        > this check is skipped.
+        > this check is skipped. consistent=True reads from
+        > the primary (right after a removal). storing=True
+        > (check right before the insert) queues the removal
+        > of any previous document when the check cannot run
         """
 
         if not self.config['MONGO']['ENABLED']:
@@ -548,7 +567,15 @@ class WFCatalogCollector():
             # my_result = self.mongo.getDocumentByFilename(file)
             # print('isNewDoc : myresult:')
             # print(my_result)
-            exist_file = self.mongo.getDocumentByFilenameOne(file)
+            try:
+                exist_file = self.mongo.getDocumentByFilenameOne(file, 'LOOKUP' if consistent else 'EXISTENCE')
+            except MongoUnavailable as ex:
+                self.log.warning("Database unavailable, assuming new document for %s: %s" % (os.path.basename(file), ex))
+                if storing:
+                    # the insert is queued behind this removal: no duplicate at replay
+                    self.mongo.removeDocumentsByFilename(file)
+                return True
+
             if exist_file:
                 print("ERROR document exist in mongo - return false")
                 return False
@@ -661,16 +688,19 @@ class WFCatalogCollector():
             try:
                 for document in self.mongo.getDocumentByFilename(documents['daily']['fileId']):
                     mongo_id = document['_id']
-                    self.mongo.removeDocumentsById(mongo_id)
+                    self.mongo.removeDocumentsById(mongo_id, documents['daily']['fileId'])
                     self.log.info("Succesfully removed document related to id %s." % mongo_id)
+            except MongoUnavailable:
+                self.mongo.removeDocumentsByFilename(documents['daily']['fileId'])
             except Exception as ex:
                 self.log.error("Could not remove documents with id %s." % mongo_id)
                 self.log.exception(ex)
                 return
 
         # Final check and quit if the document with this fileId
-        # is already in the database
-        if not self._isNewDocument(documents['daily']['fileId']):
+        # is already in the database (while queued writes of the file wait
+        # for the replay, the check cannot run and a removal is queued first)
+        if not self._isNewDocument(documents['daily']['fileId'], consistent=True, storing=True):
             self.log.error("Stop: document with this id is already in the database: %s" % documents['daily']['fileId'])
             return
 
@@ -685,7 +715,17 @@ class WFCatalogCollector():
             return
 
         # Store the hourly output
-        if self.args['hourly']:
+        if self.args['hourly'] and self.mongo.hourly_storage != 'documents':
+            # bucketed layouts: all the hourly granules of the day in one write
+            try:
+                qc_metadata = [self._getDatabaseKeyMap(granule, id) for granule in documents['hourly']]
+                self.mongo.storeHourlyGranules(id, qc_metadata)
+                self.log.info("Succesfully stored %d hourly granule(s) as %s" % (len(qc_metadata), self.mongo.hourly_storage))
+            except Exception as ex:
+                self.log.error("Could not store hourly granules to database")
+                self.log.exception(ex)
+
+        elif self.args['hourly']:
             for i, granule in enumerate(documents['hourly']):
                 try:
                     qc_metadata = self._getDatabaseKeyMap(granule, id)
@@ -1083,7 +1123,7 @@ class WFCatalogCollector():
         # Append three files to array in order [yesterday, today, tomorrow]
         # Get yesterdays file
         previous_file = self._getNextFile(file, -1)
-        if os.path.isfile(previous_file):
+        if isArchived(self.archive_index, previous_file):
             day_files.append(previous_file)
 
         # Add todays file
@@ -1091,7 +1131,7 @@ class WFCatalogCollector():
 
         # Get tomorrows file
         next_file = self._getNextFile(file, 1)
-        if os.path.isfile(next_file):
+        if isArchived(self.archive_index, next_file):
             day_files.append(next_file)
 
         self.log.info("[%d/%d] File %s prepared with %s" % (self.file_counter, self.totalFiles, os.path.basename(file), [os.path.basename(f) for f in day_files]))
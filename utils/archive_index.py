@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+"""
+#
+#  massimo.fares@ingv.it
+#  adaisacd.ont@ingv.it
+#
+#  maintenance of the local archive existence index (modules/archiveindex.py)
+#  used by preflychecks, move2archive, checkout2past, checkout2working and
+#  the WFCatalog neighbour lookups.
+#
+#  --resync walks the whole archive and replaces the index content; run it
+#  from cron more often than MAX_SYNC_AGE (misses are trusted only after a
+#  recent re-sync), after changes made outside the workers, and preferably
+#  while the workers are idle (changes recorded during the walk may be
+#  overwritten by the scan).
+#
+#  usage:
+#    python3 -m project.utils.archive_index --config project/config/config-move2archive.yaml --resync
+#    python3 -m project.utils.archive_index --config ... --stats
+#    python3 -m project.utils.archive_index --config ... --lookup /var/lib/archive/trust/2024/IV/ACER/HHZ.D/IV.ACER..HHZ.D.2024.061
+#
+"""
+
+import argparse
+import datetime
+import logging
+import yaml
+
+from project.modules.archiveindex import ArchiveIndex
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="local archive existence index maintenance")
+    parser.add_argument('--config', required=True, help="action config yaml with an ARCHIVE_INDEX block (i.e. config-move2archive.yaml)")
+    parser.add_argument('--resync', action='store_true', help="walk the archive and rebuild the index")
+    parser.add_argument('--stats', action='store_true', help="print the index size and last re-sync")
+    parser.add_argument('--lookup', default=None, help="print the index row of an archive path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    log = logging.getLogger("archive_index")
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)['CONFIG']
+    index_config = config['ARCHIVE_INDEX']
+    index = ArchiveIndex(index_config.get('PATH', '/var/lib/archive/queue/archive-index.sqlite'),
+                         index_config.get('ROOT', config.get('ARCHIVE_TRUST', '/var/lib/archive/trust/')),
+                         index_config.get('MAX_SYNC_AGE', 86400))
+
+    if args.resync:
+        index.resync(log)
+
+    if args.stats:
+        synced = index.syncedAt()
+        log.info("index %s of %s: %d file(s), last re-sync %s%s" % (
+            index.path, index.root, len(index),
+            datetime.datetime.fromtimestamp(synced).isoformat() if synced else 'never',
+            '' if index.ready else ' (too old: misses go to the file system)'))
+
+    if args.lookup:
+        log.info("%s: %s" % (args.lookup, index.lookup(args.lookup)))
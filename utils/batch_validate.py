@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+"""
+#
+#  massimo.fares@ingv.it
+#  adaisacd.ont@ingv.it
+#
+#  bulk validation of the files delivered into the certification area
+#  (policy-validates, rule filevalidate) across a process pool.
+#
+#  every file goes through the sanitychecks tests, same error codes:
+#    0   empty or unreadable file           2/21  SDS name vs record headers, type code
+#    3/31 sampling rate vs band code        4/41  day outside the channel epochs / no epochs
+#  the tests are the ones of the action (modules/sanitytests): headers only
+#  when HEADER_ONLY is set and DEEP_CHECK is not.
+#
+#  the station metadata is resolved once per station in the parent through the
+#  shared station cache (modules/stationmanager, snapshot/warm-up included) and
+#  handed to the workers; the workers never call the station service.
+#
+#  at the end one consolidated JSON report is written and the bad files are
+#  moved into ARCHIVE_BAD (SDS tree if BAD_SDS) with the '-<code>' suffix,
+#  unless NOT_MOVE is true or --dry-run is given.
+#
+#  usage:
+#    python3 -m project.utils.batch_validate --config project/config/config-sanitychecks.yaml \
+#        --dir /var/lib/archive/certification/ --workers 8 --report /var/lib/archive/certification-report.json
+#    python3 -m project.utils.batch_validate --config ... --dir ... --dry-run
+#
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import yaml
+
+from project.modules.stationmanager import getStationCache
+from project.modules.filefacts import sdsPath
+from project.modules.sanitytests import runTests
+
+# worker globals, set by the pool initializer
+_config = None
+_epochs = None
+
+
+def _initWorker(config, epochs):
+
+    global _config, _epochs
+    _config = config
+    _epochs = epochs
+
+
+#
+# sanitychecks TESTs 0-4 on one file: {'file', 'code' ('' when good), 'message'}
+#
+def checkFile(file):
+
+    code, message, st = runTests(file, os.path.basename(file), _config,
+                                 lambda net, sta: _epochs.get((net, sta)))
+    return {'file': file, 'code': code, 'message': message}
+
+
+#
+# files of the certification area, SDS tree or flat
+#
+def listFiles(root):
+
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        files.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+    return files
+
+
+#
+# one station service lookup per net.sta (through the shared cache)
+#
+def resolveStations(files, config, log):
+
+    stations = getStationCache(config, log)
+    epochs = {}
+    for file in files:
+        fields = os.path.basename(file).split('.')
+        if len(fields) != 7 or (fields[0], fields[1]) in epochs:
+            continue
+        epochs[(fields[0], fields[1])] = stations.getEpochIndex(fields[0], fields[1])
+    log.info("station metadata: %d station(s), %d without epochs" % (
+        len(epochs), sum(1 for index in epochs.values() if not index)))
+    return epochs
+
+
+def moveBad(result, config, log):
+
+    file = result['file']
+    # a name that is not SDS has no place in the SDS tree
+    if config.get('BAD_SDS', False) and len(os.path.basename(file).split('.')) >= 7:
+        target = sdsPath(config['ARCHIVE_BAD'], os.path.basename(file)) + "-" + result['code']
+    else:
+        target = config['ARCHIVE_BAD'] + os.path.basename(file) + "-" + result['code']
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(file, target)
+        result['moved_to'] = target
+    except Exception as e:
+        log.error("move of %s into BAD failed: %s" % (file, e))
+        result['move_error'] = str(e)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="bulk validation of the certification area")
+    parser.add_argument('--config', required=True, help="sanitychecks config yaml (i.e. config-sanitychecks.yaml)")
+    parser.add_argument('--dir', default="/var/lib/archive/certification/", help="directory to validate")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="validation processes")
+    parser.add_argument('--chunk', type=int, default=16, help="files per task sent to a worker")
+    parser.add_argument('--report', default=None, help="JSON report (default: ./validation-<timestamp>.json)")
+    parser.add_argument('--dry-run', action='store_true', help="report only, never move bad files")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    log = logging.getLogger("batch_validate")
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)['CONFIG']
+
+    started = time.time()
+    files = listFiles(args.dir)
+    log.info("%d file(s) to validate in %s" % (len(files), args.dir))
+    epochs = resolveStations(files, config, log)
+
+    results = []
+    with multiprocessing.get_context('fork').Pool(args.workers, _initWorker, (config, epochs)) as pool:
+        for result in pool.imap_unordered(checkFile, files, chunksize=args.chunk):
+            results.append(result)
+            if len(results) % 1000 == 0:
+                log.info("%d/%d file(s) validated" % (len(results), len(files)))
+
+    bad = [r for r in results if r['code']]
+    move = not args.dry_run and str(config.get('NOT_MOVE', False)).lower() != 'true'
+    if move:
+        for result in bad:
+            moveBad(result, config, log)
+
+    by_code = {}
+    for result in bad:
+        by_code[result['code']] = by_code.get(result['code'], 0) + 1
+    report = {
+        'directory': args.dir,
+        'started': datetime.datetime.fromtimestamp(started).isoformat(),
+        'seconds': round(time.time() - started, 1),
+        'files': len(results),
+        'good': len(results) - len(bad),
+        'bad': len(bad),
+        'by_code': by_code,
+        'moved': move,
+        'bad_files': sorted(bad, key=lambda r: r['file'])
+    }
+    report_path = args.report or "validation-%s.json" % time.strftime('%Y%m%dT%H%M%S')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    log.info("validated %d file(s) in %.1fs: %d good, %d bad %s, report %s" % (
+        len(results), report['seconds'], report['good'], len(bad), by_code, report_path))
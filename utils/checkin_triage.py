@@ -0,0 +1,174 @@
+#! /usr/bin/env python3
+"""
+#
+#  massimo.fares@ingv.it
+#  adaisacd.ont@ingv.it
+#
+#  triage of a checkin backlog (i.e. after an outage) before the policy runs.
+#
+#  the record headers of every file are scanned in a process pool; files that
+#  are obviously corrupt are rejected at once into ARCHIVE_BAD with the
+#  sanitychecks codes (0 unreadable, 1 no records, 2 name/type code/headers
+#  not consistent), the others are grouped by NSLC and ordered by day, so
+#  each day finds the previous one already archived (WFCatalog neighbours)
+#  and consecutive files hit the same station cache entries.
+#
+#  the header tests are the sanitychecks ones (modules/sanitytests, TESTs 0-2);
+#  rejected files are not moved when NOT_MOVE is true or with --dry-run.
+#
+#  the ordered list is written to --list and/or handed to ONE long-lived
+#  command with --run ('{}' is replaced by the list file, the list is also
+#  on its stdin): one process for the whole backlog keeps the station and
+#  Mongo caches warm, a process per file would start cold every time.
+#
+#  the checkin daemons (rum.py --mode d) must be stopped while the backlog is
+#  triaged, otherwise they pick the same files concurrently: the triage
+#  refuses to move or run anything while one is found on the host.
+#
+#  usage:
+#    python3 -m project.utils.checkin_triage --config project/config/config-sanitychecks.yaml \
+#        --dir /var/lib/archive/checkin/ --list /tmp/checkin-order.txt --run "<policy runner reading the list> {}"
+#    python3 -m project.utils.checkin_triage --config ... --dir ... --list /tmp/checkin-order.txt --dry-run
+#
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+
+from project.utils.batch_validate import listFiles, moveBad
+from project.modules.sanitytests import runTests
+
+# worker global, set by the pool initializer
+_config = None
+
+
+def _initWorker(config):
+
+    global _config
+    # the triage only looks at the record headers, whatever the action does
+    _config = dict(config, HEADER_ONLY=True, DEEP_CHECK=False)
+
+
+#
+# header scan of one file: {'file', 'code' ('' when accepted), 'message', 'key' (net, sta, loc, cha, year, jday)}
+#
+def scanFile(file):
+
+    # versions are delivered as NAME#handle
+    name = os.path.basename(file).split('#')[0]
+    code, message, st = runTests(file, name, _config, last_test=2)
+    result = {'file': file, 'code': code, 'message': message, 'key': None}
+    if not code:
+        [xnet, xsta, xloc, xcha, xtype, xyear, xjday] = name.split('.')
+        result['key'] = (xnet, xsta, xloc, xcha, int(xyear), int(xjday))
+    return result
+
+
+#
+# pids of the checkin daemons (rum.py --mode d) running on this host
+#
+def runningDaemons():
+
+    pids = []
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            with open('/proc/%s/cmdline' % pid, 'rb') as f:
+                argv = f.read().decode(errors='replace').split('\0')
+        except OSError:
+            continue
+        if any(os.path.basename(arg) == 'rum.py' for arg in argv) and ('--mode=d' in argv or any(
+                arg == '--mode' and value == 'd' for arg, value in zip(argv, argv[1:]))):
+            pids.append(int(pid))
+    return pids
+
+
+#
+# accepted files grouped by NSLC (stations together), each stream by day;
+# the original file of a version comes before its NAME#handle copies
+#
+def triageOrder(results):
+
+    accepted = [r for r in results if not r['code']]
+    accepted.sort(key=lambda r: (r['key'], '#' in os.path.basename(r['file']), r['file']))
+    return [r['file'] for r in accepted]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="triage of the checkin backlog")
+    parser.add_argument('--config', required=True, help="sanitychecks config yaml (TYPE_CODE, ARCHIVE_BAD, BAD_SDS)")
+    parser.add_argument('--dir', default="/var/lib/archive/checkin/", help="checkin directory")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="header scan processes")
+    parser.add_argument('--chunk', type=int, default=64, help="files per task sent to a worker")
+    parser.add_argument('--list', default=None, help="write the ordered files here, one per line")
+    parser.add_argument('--run', default=None, help="command run once on the ordered list, '{}' is the list file")
+    parser.add_argument('--dry-run', action='store_true', help="never move the rejected files, never run")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    log = logging.getLogger("checkin_triage")
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)['CONFIG']
+
+    move = not args.dry_run and str(config.get('NOT_MOVE', False)).lower() != 'true'
+    if (move or args.run) and not args.dry_run:
+        daemons = runningDaemons()
+        if daemons:
+            log.error("checkin daemon(s) running (pid %s): stop them before the triage, or use --dry-run" % (
+                ", ".join(str(pid) for pid in daemons)))
+            sys.exit(1)
+
+    started = time.time()
+    files = listFiles(args.dir)
+    log.info("%d file(s) in %s" % (len(files), args.dir))
+
+    with multiprocessing.get_context('fork').Pool(args.workers, _initWorker, (config,)) as pool:
+        results = list(pool.imap_unordered(scanFile, files, chunksize=args.chunk))
+
+    rejected = [r for r in results if r['code']]
+    for result in rejected:
+        log.error("rejected %s: %s (code %s)" % (result['file'], result['message'], result['code']))
+        if move:
+            moveBad(result, config, log)
+
+    order = triageOrder(results)
+    streams = len(set(r['key'][:4] for r in results if not r['code']))
+    log.info("header scan of %d file(s) in %.1fs: %d stream(s), %d file(s) accepted, %d rejected" % (
+        len(results), time.time() - started, streams, len(order), len(rejected)))
+
+    if args.list:
+        with open(args.list, 'w') as f:
+            f.writelines(file + "\n" for file in order)
+        log.info("ordered list written to %s" % args.list)
+
+    if args.run and not args.dry_run:
+        # a single policy run over the whole list, in order
+        list_file = args.list
+        if not list_file:
+            with tempfile.NamedTemporaryFile('w', prefix='checkin-order-', suffix='.txt', delete=False) as f:
+                f.writelines(file + "\n" for file in order)
+                list_file = f.name
+        command = [list_file if arg == '{}' else arg for arg in shlex.split(args.run)]
+        with open(list_file) as f:
+            returncode = subprocess.run(command, stdin=f).returncode
+        if returncode != 0:
+            log.error("policy run on %s failed with code %d" % (list_file, returncode))
+        log.info("%d file(s) handed to the policy in %.1fs" % (len(order), time.time() - started))
+        if not args.list:
+            os.remove(list_file)
+        sys.exit(returncode)
+
+    if not args.list and not args.run:
+        for file in order:
+            print(file)
@@ -9,6 +9,7 @@
 """
 
 import urllib.request
+import hashlib
 import datetime
 import csv
 from io import StringIO
@@ -122,4 +123,50 @@ class filechecks_util():
             return e                  
             
 
-        return 0
\ No newline at end of file
+        return 0
+
+
+    #
+    # md5 of a file, read once in blocks
+    #
+    def md5(self, file, blocksize=1024 * 1024):
+
+        hasher = hashlib.md5()
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    #
+    # compare an archived (or tagged) file with the incoming one by checksum:
+    # a size mismatch answers at once; the archived md5 comes from the archive index
+    # (only while the row still matches the size and mtime of the archived file) or
+    # from daily_streams.files.chksm, so only the incoming file is read; without a
+    # stored checksum the archived file is hashed once and its md5 recorded in the index
+    #
+    def sameContent(self, archived_file, file, index=None, mongo=None, facts=None, log=None):
+
+        st = os.stat(archived_file)
+        incoming_size = facts.size if facts is not None and facts.file == file else os.path.getsize(file)
+        if st.st_size != incoming_size:
+            return False
+
+        row = index.lookup(archived_file) if index is not None else None
+        stored = None
+        if row is not None and row['md5'] is not None and row['size'] == st.st_size and row['mtime'] == st.st_mtime:
+            stored = row['md5']
+        if stored is None and mongo is not None:
+            # daily_streams lists the SDS name, without the tag suffix
+            name = ".".join(os.path.basename(archived_file).split(".")[:7])
+            try:
+                stored = mongo.getFileChecksum(name)
+            except Exception as e:
+                if log:
+                    log.warning("stored checksum unavailable for %s: %s" % (name, e))
+        if stored is None:
+            stored = self.md5(archived_file)
+            if index is not None:
+                index.record(archived_file, st.st_size, st.st_mtime, stored)
+
+        incoming = facts.md5() if facts is not None and facts.file == file else self.md5(file)
+        return stored == incoming
@@ -0,0 +1,222 @@
+#! /usr/bin/env python3
+"""
+#
+#  massimo.fares@ingv.it
+#  adaisacd.ont@ingv.it
+#
+#  HdfsDAO throughput benchmark against the local WebHDFS emulator
+#  (utils/webhdfs_emulator.py) or any WebHDFS endpoint given with --url.
+#
+#  For every file-size mix and concurrency setting it measures:
+#    hdfs_mkdir        SDS directories, cold (MKDIRS) and warm (directory cache)
+#    upload_many       copy_local2hdfs_many
+#    upload_single     copy_local2hdfs_overwrite, one file at a time
+#    list_dir          one listing per SDS directory
+#    restore_many      copy_hdfs2local_many (parallel range reads)
+#    download_single   copy_hdfs2local, one file at a time
+#  and reports ops/s and MB/s.
+#
+#  The Kerberos ticket check is bypassed (BenchmarkDAO): the emulator never
+#  asks for authentication.
+#
+#  usage:
+#    python3 -m project.utils.hdfs_benchmark
+#    python3 -m project.utils.hdfs_benchmark --mix day=200x2M --mix large=4x256M --transfers 1,4,16
+#    python3 -m project.utils.hdfs_benchmark --checksum --resumable --range-size 8M
+#
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from project.modules.hdfsmanager import HdfsDAO
+from project.utils.webhdfs_emulator import WebHdfsEmulator
+
+DEFAULT_MIXES = ['small=500x64K', 'day=100x2M', 'large=4x128M']
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+#
+# HdfsDAO without klist/kinit
+#
+class BenchmarkDAO(HdfsDAO):
+
+    def _check_and_renew_kerberos(self, min_remaining_minutes=60):
+
+        self.ticket_expiry = datetime.now() + timedelta(days=365)
+        return True
+
+
+#
+# 'name=COUNTxSIZE' -> (name, count, size)
+#
+def parse_mix(spec):
+
+    name, shape = spec.split('=')
+    count, size = shape.lower().split('x')
+    size = size.upper()
+    unit = size[-1] if size[-1] in UNITS else ''
+    return name, int(count), int(float(size.rstrip('KMG')) * UNITS[unit])
+
+
+def parse_size(value):
+
+    value = value.upper()
+    unit = value[-1] if value[-1] in UNITS else ''
+    return int(float(value.rstrip('KMG')) * UNITS[unit])
+
+
+#
+# SDS named random files, spread over a few stations/channels
+#
+def make_files(local_dir, count, size):
+
+    os.makedirs(local_dir, exist_ok=True)
+    block = os.urandom(min(size, 1024 * 1024))
+    files = []
+    for i in range(count):
+        name = "BM.S%03d..HH%s.D.2024.%03d" % (i % 50, "ZNE"[i % 3], 1 + i // 150)
+        path = os.path.join(local_dir, name)
+        with open(path, 'wb') as f:
+            written = 0
+            while written < size:
+                chunk = block[:size - written]
+                f.write(chunk)
+                written += len(chunk)
+        files.append(path)
+    return files
+
+
+def measure(results, mix, transfers, op, count, size, seconds):
+
+    results.append({
+        'mix': mix, 'transfers': transfers, 'op': op, 'count': count,
+        'ops_s': count / seconds if seconds > 0 else 0.0,
+        'mb_s': (size / 1048576.0) / seconds if seconds > 0 and size else 0.0,
+        'seconds': seconds
+    })
+
+
+def run_mix(dao, results, mix, files, size, transfers, hdfs_root, restore_dir, single_limit):
+
+    total = size * len(files)
+    root = "%s/%s-t%d" % (hdfs_root, mix, transfers)
+    targets = [dao.sds_target(root, os.path.basename(f)) for f in files]
+    dirs = sorted({os.path.dirname(t) for t in targets})
+
+    # directories: cold, then cached
+    start = time.monotonic()
+    for d in dirs:
+        dao.hdfs_mkdir(d)
+    measure(results, mix, transfers, 'hdfs_mkdir (cold)', len(dirs), 0, time.monotonic() - start)
+    start = time.monotonic()
+    for d in dirs:
+        dao.hdfs_mkdir(d)
+    measure(results, mix, transfers, 'hdfs_mkdir (cached)', len(dirs), 0, time.monotonic() - start)
+
+    # uploads
+    summary = dao.copy_local2hdfs_many(list(zip(files, targets)), n_transfers=transfers)
+    if summary['failed']:
+        logging.getLogger("hdfs_benchmark").warning("%d upload(s) failed" % summary['failed'])
+    measure(results, mix, transfers, 'upload_many', summary['ok'], summary['bytes'], summary['seconds'])
+
+    if transfers == 1:
+        sample = list(zip(files, targets))[:single_limit]
+        start = time.monotonic()
+        for src, dst in sample:
+            dao.copy_local2hdfs_overwrite(src, dst)
+        measure(results, mix, transfers, 'upload_single', len(sample), size * len(sample), time.monotonic() - start)
+
+    # listing
+    start = time.monotonic()
+    for d in dirs:
+        dao.list_dir(d)
+    measure(results, mix, transfers, 'list_dir', len(dirs), 0, time.monotonic() - start)
+
+    # restores
+    local = os.path.join(restore_dir, "%s-t%d" % (mix, transfers))
+    os.makedirs(local, exist_ok=True)
+    summary = dao.copy_hdfs2local_many([(t, os.path.join(local, os.path.basename(t))) for t in targets],
+                                       n_transfers=transfers)
+    measure(results, mix, transfers, 'restore_many', summary['ok'], summary['bytes'], summary['seconds'])
+
+    if transfers == 1:
+        sample = targets[:single_limit]
+        start = time.monotonic()
+        for t in sample:
+            dao.copy_hdfs2local(t, os.path.join(local, os.path.basename(t)))
+        measure(results, mix, transfers, 'download_single', len(sample), size * len(sample), time.monotonic() - start)
+
+    shutil.rmtree(local, ignore_errors=True)
+    dao.kclient.delete(root, recursive=True)
+    return total
+
+
+def report(results):
+
+    print("%-8s %9s %-20s %7s %10s %10s %9s" % ('mix', 'transfers', 'operation', 'count', 'ops/s', 'MB/s', 'seconds'))
+    for r in results:
+        print("%-8s %9d %-20s %7d %10.1f %10.2f %9.2f" % (r['mix'], r['transfers'], r['op'], r['count'],
+                                                         r['ops_s'], r['mb_s'], r['seconds']))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="HdfsDAO throughput benchmark")
+    parser.add_argument('--url', default=None, help="WebHDFS endpoint (default: start the local emulator)")
+    parser.add_argument('--hdfs-root', default='/benchmark', help="HDFS directory used (removed after each run)")
+    parser.add_argument('--mix', action='append', default=None,
+                        help="file-size mix NAME=COUNTxSIZE, repeatable (default: %s)" % ' '.join(DEFAULT_MIXES))
+    parser.add_argument('--transfers', default='1,4,8', help="comma separated concurrency settings")
+    parser.add_argument('--range-size', default='64M', help="HDFS.RESTORE_RANGE_SIZE")
+    parser.add_argument('--chunk-size', default='4M', help="HDFS.CHUNK_SIZE")
+    parser.add_argument('--single-limit', type=int, default=50, help="files timed one by one (upload/download_single)")
+    parser.add_argument('--checksum', action='store_true', help="enable HDFS.CHECKSUM verification")
+    parser.add_argument('--resumable', action='store_true', help="enable HDFS.RESUMABLE uploads")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    log = logging.getLogger("hdfs_benchmark")
+
+    emulator = None
+    url = args.url
+    if url is None:
+        emulator = WebHdfsEmulator().start()
+        url = emulator.url
+
+    config = {
+        'HDFS': {
+            'WEBHDFS_URL': url,
+            'CHUNK_SIZE': parse_size(args.chunk_size),
+            'RESTORE_RANGE_SIZE': parse_size(args.range_size),
+            'CHECKSUM': {'ENABLED': args.checksum},
+            'RESUMABLE': {'ENABLED': args.resumable}
+        },
+        'KERBEROS': {'KEYTAB': None, 'PRINCIPAL': None}
+    }
+    dao = BenchmarkDAO(config, log)
+    if not dao.connect():
+        raise SystemExit("cannot connect to %s" % url)
+
+    workdir = tempfile.mkdtemp(prefix='hdfs-benchmark-')
+    results = []
+    try:
+        for spec in args.mix or DEFAULT_MIXES:
+            mix, count, size = parse_mix(spec)
+            files = make_files(os.path.join(workdir, 'src', mix), count, size)
+            for transfers in [int(t) for t in args.transfers.split(',')]:
+                run_mix(dao, results, mix, files, size, transfers, args.hdfs_root,
+                        os.path.join(workdir, 'restore'), args.single_limit)
+            shutil.rmtree(os.path.join(workdir, 'src', mix), ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        dao.close()
+        if emulator:
+            emulator.stop()
+
+    report(results)
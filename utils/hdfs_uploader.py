@@ -0,0 +1,67 @@
+#! /usr/bin/env python3
+"""
+#
+#  massimo.fares@ingv.it
+#  adaisacd.ont@ingv.it
+#
+#  standalone drain loop of the durable HDFS upload queue filled by copy2hdfs
+#  (HDFS.QUEUE), for hosts where the workers run with RUN_UPLOADER: false.
+#
+#  usage:
+#    python3 -m project.utils.hdfs_uploader --config project/config/config-copy2hdfs.yaml
+#    python3 -m project.utils.hdfs_uploader --config ... --once
+#    python3 -m project.utils.hdfs_uploader --config ... --audit failed
+#    python3 -m project.utils.hdfs_uploader --config ... --requeue-failed
+#
+"""
+
+import argparse
+import logging
+import time
+import yaml
+
+from project.modules.hdfsmanager import get_shared_dao
+from project.modules.hdfsqueue import get_upload_queue, Uploader
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="drain the HDFS upload queue")
+    parser.add_argument('--config', required=True, help="action config yaml with HDFS/KERBEROS blocks (i.e. config-copy2hdfs.yaml)")
+    parser.add_argument('--once', action='store_true', help="drain what is due and exit")
+    parser.add_argument('--audit', nargs='?', const='', default=None, metavar='STATE',
+                        help="print the latest queue records (optionally only pending|running|done|failed) and exit")
+    parser.add_argument('--limit', type=int, default=100, help="records printed by --audit")
+    parser.add_argument('--requeue-failed', action='store_true', help="put failed uploads back in the queue and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    log = logging.getLogger("hdfs_uploader")
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)['CONFIG']
+
+    queue = get_upload_queue(config)
+
+    if args.audit is not None:
+        for rec in queue.audit(state=args.audit or None, limit=args.limit):
+            print("%(id)d %(state)s attempts=%(attempts)d %(source)s -> %(target)s md5=%(md5)s "
+                  "bytes=%(bytes)s seconds=%(seconds)s error=%(error)s" % rec)
+        log.info("queue: %s" % queue.stats())
+
+    elif args.requeue_failed:
+        log.info("requeued %d failed upload(s)" % queue.requeue_failed())
+
+    else:
+        uploader = Uploader(queue, get_shared_dao(config, log), log, config['HDFS'].get('QUEUE', {}))
+        if args.once:
+            uploader.drain()
+        else:
+            log.info("draining %s every %ss" % (queue.path, uploader.interval))
+            while True:
+                try:
+                    uploader.drain()
+                except Exception as ex:
+                    log.error("drain error: %s" % ex)
+                time.sleep(uploader.interval)
+        log.info("queue: %s" % queue.stats())
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+"""
+#
+#  massimo.fares@ingv.it
+#  adaisacd.ont@ingv.it
+#
+#  migrate WFCatalog hourly granules from hourly_streams (one document per hour)
+#  to the bucket (hourly_buckets) or time-series (hourly_ts) layout used by MongoDAO
+#  when MONGO.HOURLY_STORAGE is set.
+#
+#  unless --keep is given, each migrated stream is read back through
+#  MongoDAO.getHourlyGranules once its hourly_streams documents are removed;
+#  a stream that does not read back identical is restored into hourly_streams.
+#
+#  usage:
+#    python3 -m project.utils.migrate_hourly --config project/config/config-wfccollector.yaml --mode bucket
+#    python3 -m project.utils.migrate_hourly --config ... --mode timeseries --keep --limit 1000
+#
+"""
+
+import argparse
+import logging
+import yaml
+
+from project.modules.mongomanager import MongoDAO
+from project.modules.mongoqueue import MongoUnavailable
+
+
+#
+# True if the granules read back hold every field of the migrated documents
+#
+def sameGranules(docs, granules):
+
+    if len(docs) != len(granules):
+        return False
+    for doc, granule in zip(sorted(docs, key=lambda d: d['ts']), granules):
+        if any(granule.get(key) != value for key, value in doc.items()):
+            return False
+    return True
+
+
+#
+# move the hourly documents of every daily stream into the target layout
+#
+def migrate(dao, mode, keep=False, limit=None, log=None):
+
+    dao.hourly_storage = mode
+    if mode == 'timeseries':
+        # before the first insert, or a plain hourly_ts collection would be created
+        dao.ensureTimeSeries()
+    pipeline = [
+        {'$sort': {'streamId': 1, 'ts': 1}},
+        {'$group': {'_id': '$streamId', 'granules': {'$push': '$$ROOT'}}}
+    ]
+    if limit:
+        pipeline.append({'$limit': limit})
+
+    streams = 0
+    granules = 0
+    for group in dao.db.hourly_streams.aggregate(pipeline, allowDiskUse=True):
+        stream_id = group['_id']
+        docs = group['granules']
+        old_ids = [doc.pop('_id') for doc in docs]
+
+        dao.storeHourlyGranules(stream_id, docs)
+        if not keep:
+            dao.db.hourly_streams.delete_many({'_id': {'$in': old_ids}})
+            try:
+                verified = sameGranules(docs, dao.getHourlyGranules(stream_id))
+            except MongoUnavailable as ex:
+                if log:
+                    log.warning("could not read back stream %s: %s" % (stream_id, ex))
+                verified = False
+            if not verified:
+                # put the original documents back, drop the new layout copy
+                dao.db.hourly_buckets.delete_many({'streamId': stream_id})
+                dao.db.hourly_ts.delete_many({'meta.streamId': stream_id})
+                for doc, old_id in zip(docs, old_ids):
+                    doc['_id'] = old_id
+                dao.db.hourly_streams.insert_many(docs)
+                if log:
+                    log.error("stream %s did not read back identical, restored into hourly_streams" % stream_id)
+                continue
+
+        streams += 1
+        granules += len(docs)
+        if log and streams % 1000 == 0:
+            log.info("migrated %d stream(s), %d hourly granule(s)" % (streams, granules))
+
+    return streams, granules
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="migrate hourly_streams to bucket/time-series layout")
+    parser.add_argument('--config', required=True, help="action config yaml with a MONGO block (i.e. config-wfccollector.yaml)")
+    parser.add_argument('--mode', required=True, choices=['bucket', 'timeseries'])
+    parser.add_argument('--keep', action='store_true', help="do not delete migrated hourly_streams documents")
+    parser.add_argument('--limit', type=int, default=None, help="migrate at most N daily streams")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    log = logging.getLogger("migrate_hourly")
+
+    with open(args.config) as f:
+        config = yaml.safe_load(f)['CONFIG']
+
+    dao = MongoDAO(config, log)
+    dao.connect()
+    streams, granules = migrate(dao, args.mode, args.keep, args.limit, log)
+    log.info("done: %d stream(s), %d hourly granule(s) migrated to %s" % (streams, granules, args.mode))
+    dao.disconnect()
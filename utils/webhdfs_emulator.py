@@ -0,0 +1,431 @@
+#! /usr/bin/env python3
+"""
+#
+#  massimo.fares@ingv.it
+#  adaisacd.ont@ingv.it
+#
+#  local WebHDFS emulator: in-process HTTP server backed by a directory,
+#  speaking the subset of the WebHDFS REST API used by HdfsDAO through the
+#  hdfs library (KerberosClient):
+#
+#    GET    GETFILESTATUS, LISTSTATUS, OPEN (offset/length), GETFILECHECKSUM, GETTRASHROOT
+#    PUT    CREATE (two-step, 307 redirect), MKDIRS, RENAME
+#    POST   APPEND (two-step, 307 redirect)
+#    DELETE DELETE (recursive)
+#
+#  no authentication is requested (no 401), so requests_kerberos never starts
+#  a negotiation; only the klist/kinit check of HdfsDAO has to be bypassed
+#  (see utils/hdfs_benchmark.py). GETFILECHECKSUM answers MD5-of-MD5-of-CRC32C
+#  as HDFS does with the default settings, or COMPOSITE-CRC32C with
+#  --combine-mode COMPOSITE_CRC; it is computed here, independently of the
+#  HdfsChecksum of HdfsDAO that it is meant to check.
+#
+#  usage:
+#    python3 -m project.utils.webhdfs_emulator --root /tmp/webhdfs --port 14000
+#
+#    with WebHdfsEmulator() as hdfs:          # temp dir, free port
+#        config['HDFS']['WEBHDFS_URL'] = hdfs.url
+#
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+try:
+    from crc32c import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+PREFIX = '/webhdfs/v1'
+BLOCK_SIZE = 128 * 1024 * 1024
+BYTES_PER_CHECKSUM = 512
+
+
+#
+# CRC32C (Castagnoli, reflected polynomial 0x82F63B78), the crc32c package when installed
+#
+def _table():
+
+    table = []
+    for n in range(256):
+        for _ in range(8):
+            n = (n >> 1) ^ 0x82F63B78 if n & 1 else n >> 1
+        table.append(n)
+    return table
+
+
+_TABLE = _table()
+
+
+def crc32c(data, crc=0):
+
+    if _crc32c is not None:
+        return _crc32c(data, crc)
+    crc = ~crc & 0xFFFFFFFF
+    for byte in data:
+        crc = _TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return ~crc & 0xFFFFFFFF
+
+
+# known answers (RFC 3720 B.4 and the usual "123456789" check value)
+assert crc32c(b'123456789') == 0xE3069283
+assert crc32c(bytes(32)) == 0x8A9136AA
+assert crc32c(b'\xff' * 32) == 0x62A8AB43
+
+
+#
+# GETFILECHECKSUM of a local file, as the namenode combines the datanode checksums
+#
+def file_checksum(path, combine_mode='MD5MD5CRC', bytes_per_checksum=BYTES_PER_CHECKSUM, block_size=BLOCK_SIZE):
+
+    size = os.path.getsize(path)
+    if combine_mode == 'COMPOSITE_CRC':
+        # the chunk CRCs combined over the blocks and the file: the CRC of the whole content
+        crc = 0
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(1024 * 1024), b''):
+                crc = crc32c(data, crc)
+        return {'algorithm': "COMPOSITE-CRC32C", 'bytes': "%08x" % crc, 'length': 4}
+
+    # one CRC per bytes_per_checksum chunk, MD5 of the (big endian) CRCs of each block,
+    # MD5 of the block MD5s; crcPerBlock is only reported for multi-block files
+    block_md5s = []
+    with open(path, 'rb') as f:
+        for start in range(0, size, block_size):
+            crcs = hashlib.md5()
+            remaining = min(block_size, size - start)
+            while remaining > 0:
+                chunk = f.read(min(bytes_per_checksum, remaining))
+                crcs.update(crc32c(chunk).to_bytes(4, 'big'))
+                remaining -= len(chunk)
+            block_md5s.append(crcs.digest())
+    crc_per_block = block_size // bytes_per_checksum if size > block_size else 0
+    return {'algorithm': "MD5-of-%dMD5-of-%dCRC32C" % (crc_per_block, bytes_per_checksum),
+            'bytes': "%08x%016x%s" % (bytes_per_checksum, crc_per_block,
+                                      hashlib.md5(b''.join(block_md5s)).hexdigest()),
+            'length': 28}
+
+
+class WebHdfsEmulator():
+
+    def __init__(self, root=None, host='127.0.0.1', port=0, user='emulator', combine_mode='MD5MD5CRC'):
+
+        self._tmp = None
+        if root is None:
+            self._tmp = tempfile.mkdtemp(prefix='webhdfs-')
+            root = self._tmp
+        self.root = os.path.abspath(root)
+        self.user = user
+        self.combine_mode = combine_mode
+        os.makedirs(self.root, exist_ok=True)
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.emulator = self
+        self.thread = None
+
+    @property
+    def url(self):
+
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.server.serve_forever, name="webhdfs-emulator", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+
+        self.server.shutdown()
+        self.server.server_close()
+        if self._tmp:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def __enter__(self):
+
+        return self.start()
+
+    def __exit__(self, *exc):
+
+        self.stop()
+
+    #
+    # HDFS path -> local path, never outside root
+    #
+    def local(self, hdfs_path):
+
+        path = os.path.normpath(os.path.join(self.root, hdfs_path.lstrip('/')))
+        if path != self.root and not path.startswith(self.root + os.sep):
+            raise PermissionError(hdfs_path)
+        return path
+
+    def status(self, path, suffix=''):
+
+        st = os.stat(path)
+        is_dir = os.path.isdir(path)
+        return {
+            'accessTime': int(st.st_atime * 1000),
+            'blockSize': 0 if is_dir else BLOCK_SIZE,
+            'childrenNum': len(os.listdir(path)) if is_dir else 0,
+            'fileId': st.st_ino,
+            'group': 'supergroup',
+            'length': 0 if is_dir else st.st_size,
+            'modificationTime': int(st.st_mtime * 1000),
+            'owner': self.user,
+            'pathSuffix': suffix,
+            'permission': '755' if is_dir else '644',
+            'replication': 0 if is_dir else 1,
+            'storagePolicy': 0,
+            'type': 'DIRECTORY' if is_dir else 'FILE'
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+
+        BaseHTTPRequestHandler.setup(self)
+        # keep-alive + small responses: no Nagle/delayed-ACK stalls
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+
+        pass
+
+    # ---------------------------
+    # dispatch
+    # ---------------------------
+    def do_GET(self):
+
+        self._dispatch({'GETFILESTATUS': self._getfilestatus, 'LISTSTATUS': self._liststatus,
+                        'OPEN': self._open, 'GETFILECHECKSUM': self._getfilechecksum,
+                        'GETTRASHROOT': self._gettrashroot})
+
+    def do_PUT(self):
+
+        self._dispatch({'CREATE': self._create, 'MKDIRS': self._mkdirs, 'RENAME': self._rename})
+
+    def do_POST(self):
+
+        self._dispatch({'APPEND': self._append})
+
+    def do_DELETE(self):
+
+        self._dispatch({'DELETE': self._delete})
+
+    def _dispatch(self, handlers):
+
+        url = urlparse(self.path)
+        self.params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        op = self.params.get('op', '').upper()
+        try:
+            if not url.path.startswith(PREFIX):
+                return self._error(404, 'FileNotFoundException', url.path)
+            self.hdfs_path = unquote(url.path[len(PREFIX):]) or '/'
+            self.target = self.server.emulator.local(self.hdfs_path)
+            if op not in handlers:
+                self._drain()
+                return self._error(400, 'UnsupportedOperationException', "op=%s" % op)
+            handlers[op]()
+        except FileNotFoundError:
+            self._error(404, 'FileNotFoundException', "File does not exist: %s" % self.hdfs_path)
+        except PermissionError as ex:
+            self._error(403, 'AccessControlException', str(ex))
+        except Exception as ex:
+            # the body may be half read: do not reuse the connection
+            self.close_connection = True
+            self._error(500, 'IOException', str(ex))
+
+    # ---------------------------
+    # responses
+    # ---------------------------
+    def _json(self, obj, code=200):
+
+        payload = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, code, exception, message):
+
+        self._json({'RemoteException': {'exception': exception, 'javaClassName': 'java.io.' + exception,
+                                        'message': message}}, code)
+
+    def _redirect(self):
+
+        location = "%s%s&data=true" % (self.server.emulator.url, self.path)
+        self.send_response(307)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    #
+    # request body, plain or chunked (streaming uploads send generators)
+    #
+    def _body(self):
+
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining > 0:
+                block = self.rfile.read(min(remaining, 1024 * 1024))
+                if not block:
+                    return
+                remaining -= len(block)
+                yield block
+
+    def _drain(self):
+
+        for _ in self._body():
+            pass
+
+    # ---------------------------
+    # operations
+    # ---------------------------
+    def _getfilestatus(self):
+
+        self._json({'FileStatus': self.server.emulator.status(self.target)})
+
+    def _liststatus(self):
+
+        emulator = self.server.emulator
+        if os.path.isdir(self.target):
+            statuses = [emulator.status(os.path.join(self.target, name), name)
+                        for name in sorted(os.listdir(self.target))]
+        else:
+            statuses = [emulator.status(self.target)]
+        self._json({'FileStatuses': {'FileStatus': statuses}})
+
+    def _open(self):
+
+        size = os.path.getsize(self.target)
+        offset = int(self.params.get('offset', 0))
+        length = self.params.get('length')
+        length = size - offset if length is None else min(int(length), size - offset)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(max(length, 0)))
+        self.end_headers()
+        with open(self.target, 'rb') as f:
+            f.seek(offset)
+            while length > 0:
+                block = f.read(min(length, 1024 * 1024))
+                if not block:
+                    break
+                self.wfile.write(block)
+                length -= len(block)
+
+    def _getfilechecksum(self):
+
+        if os.path.isdir(self.target):
+            return self._error(404, 'FileNotFoundException', "Path is not a file: %s" % self.hdfs_path)
+        self._json({'FileChecksum': file_checksum(self.target, self.server.emulator.combine_mode)})
+
+    def _gettrashroot(self):
+
+        self._json({'Path': "/user/%s/.Trash" % self.server.emulator.user})
+
+    def _create(self):
+
+        if self.params.get('data') != 'true':
+            self._drain()
+            if os.path.exists(self.target) and self.params.get('overwrite', 'false').lower() != 'true':
+                return self._error(403, 'FileAlreadyExistsException', "%s already exists" % self.hdfs_path)
+            return self._redirect()
+        os.makedirs(os.path.dirname(self.target), exist_ok=True)
+        if os.path.isdir(self.target):
+            shutil.rmtree(self.target)
+        with open(self.target, 'wb') as f:
+            for block in self._body():
+                f.write(block)
+        self.send_response(201)
+        self.send_header('Location', 'hdfs://emulator%s' % self.hdfs_path)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _append(self):
+
+        if self.params.get('data') != 'true':
+            self._drain()
+            if not os.path.isfile(self.target):
+                return self._error(404, 'FileNotFoundException', "File does not exist: %s" % self.hdfs_path)
+            return self._redirect()
+        with open(self.target, 'ab') as f:
+            for block in self._body():
+                f.write(block)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _mkdirs(self):
+
+        self._drain()
+        if os.path.isfile(self.target):
+            return self._error(403, 'FileAlreadyExistsException', "Path is a file: %s" % self.hdfs_path)
+        os.makedirs(self.target, exist_ok=True)
+        self._json({'boolean': True})
+
+    def _rename(self):
+
+        self._drain()
+        destination = self.server.emulator.local(self.params['destination'])
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(self.target))
+        if not os.path.exists(self.target) or os.path.exists(destination) \
+                or not os.path.isdir(os.path.dirname(destination)):
+            return self._json({'boolean': False})
+        os.rename(self.target, destination)
+        self._json({'boolean': True})
+
+    def _delete(self):
+
+        self._drain()
+        if not os.path.exists(self.target):
+            return self._json({'boolean': False})
+        if os.path.isdir(self.target):
+            if os.listdir(self.target) and self.params.get('recursive', 'false').lower() != 'true':
+                return self._error(403, 'PathIsNotEmptyDirectoryException', "%s is non empty" % self.hdfs_path)
+            shutil.rmtree(self.target)
+        else:
+            os.remove(self.target)
+        self._json({'boolean': True})
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="local WebHDFS emulator backed by a directory")
+    parser.add_argument('--root', default=None, help="backing directory (default: a temp dir, removed at exit)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=14000)
+    parser.add_argument('--combine-mode', default='MD5MD5CRC', choices=['MD5MD5CRC', 'COMPOSITE_CRC'],
+                        help="dfs.checksum.combine.mode of the emulated cluster")
+    args = parser.parse_args()
+
+    emulator = WebHdfsEmulator(args.root, args.host, args.port, combine_mode=args.combine_mode).start()
+    print("WebHDFS emulator on %s, root %s" % (emulator.url, emulator.root))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emulator.stop()